@@ -0,0 +1,158 @@
+"""This module defines the engine used to allocate IP prefixes to the
+broadcast domains of a network. It relies on a buddy allocator of free
+prefixes, which steers clear of the subnets that were already set by the
+user."""
+import heapq
+from bisect import bisect_right
+
+from ipaddress import IPv4Interface, IPv6Interface
+
+_INTERFACE_CLS = {4: IPv4Interface, 6: IPv6Interface}
+
+
+def interface_at(net, offset):
+    """Return the ip_interface at a given offset in a subnet, without going
+    through the string representation of the address
+
+    :param net: ip_network-like
+    :param offset: the index of the address in the subnet
+    :raise IndexError: if the offset is outside of the subnet"""
+    if offset < 0 or offset >= net.num_addresses:
+        raise IndexError('Offset %d out of %s' % (offset, net))
+    return _INTERFACE_CLS[net.version]((int(net.network_address) + offset,
+                                        net.prefixlen))
+
+
+def _bounds(net):
+    """Return the first and last address of a subnet, as integers"""
+    first = int(net.network_address)
+    return first, first + net.num_addresses - 1
+
+
+class SubnetIndex(object):
+    """An interval index over a set of subnets, answering overlap queries in
+    logarithmic time.
+
+    As two IP prefixes are either disjoint or nested, we only need to keep
+    the outermost ones to answer these queries. These are disjoint, hence
+    sorting them by first address also sorts them by last address."""
+
+    def __init__(self, subnets=()):
+        """:param subnets: an iterable of ip_network-like objects"""
+        self._starts = {4: [], 6: []}
+        self._ends = {4: [], 6: []}
+        nets = sorted(subnets, key=lambda n: (n.version,
+                                              int(n.network_address),
+                                              n.prefixlen))
+        for n in nets:
+            first, last = _bounds(n)
+            ends = self._ends[n.version]
+            if ends and ends[-1] >= last:
+                continue  # Nested in the previous outermost subnet
+            self._starts[n.version].append(first)
+            ends.append(last)
+
+    def __len__(self):
+        return sum(len(s) for s in self._starts.values())
+
+    def _outermost(self, net):
+        """Return the bounds of the indexed subnet starting right before
+        the end of net, and the bounds of net
+
+        :return: (start, end) or None, (first, last)"""
+        first, last = _bounds(net)
+        starts = self._starts[net.version]
+        i = bisect_right(starts, last) - 1
+        if i < 0:
+            return None, (first, last)
+        return (starts[i], self._ends[net.version][i]), (first, last)
+
+    def overlaps(self, net):
+        """Return whether net overlaps with any indexed subnet"""
+        candidate, (first, _) = self._outermost(net)
+        return candidate is not None and candidate[1] >= first
+
+    def covers(self, net):
+        """Return whether net is fully included in an indexed subnet"""
+        candidate, (first, last) = self._outermost(net)
+        return (candidate is not None and
+                candidate[0] <= first and candidate[1] >= last)
+
+
+class PrefixAllocator(object):
+    """A buddy allocator of IP prefixes of a single IP version.
+
+    Free prefixes are kept in one heap per prefix length. Allocating a prefix
+    takes the lowest free block among the smallest ones that can hold it, and
+    splits it until it has the requested length, giving back the unused
+    halves (the buddies) to the free lists.
+    Reserved subnets are carved out of the free space once, when the
+    allocator is created, so that no allocation ever overlaps with them."""
+
+    def __init__(self, subnets, reserved=()):
+        """:param subnets: the ip_network-like subnets that can be allocated
+        :param reserved: the ip_network-like subnets (or a SubnetIndex) that
+                         cannot be allocated"""
+        self.reserved = (reserved if isinstance(reserved, SubnetIndex)
+                         else SubnetIndex(reserved))
+        self._free = {}  # prefixlen -> heap of network addresses (as int)
+        self._count = 0
+        self._net_cls = None
+        self._max_prefixlen = None
+        for net in subnets:
+            if self._net_cls is None:
+                self._net_cls = type(net)
+                self._max_prefixlen = net.max_prefixlen
+            elif not isinstance(net, self._net_cls):
+                raise ValueError('Cannot mix IP versions in an allocator')
+            self._carve(net)
+
+    def __len__(self):
+        """The number of free blocks in this allocator"""
+        return self._count
+
+    def _push(self, addr, prefixlen):
+        heapq.heappush(self._free.setdefault(prefixlen, []), addr)
+        self._count += 1
+
+    def _carve(self, net):
+        """Register the parts of a subnet that do not overlap with the
+        reserved subnets as free blocks"""
+        to_visit = [net]
+        while to_visit:
+            n = to_visit.pop()
+            if not self.reserved.overlaps(n):
+                self._push(int(n.network_address), n.prefixlen)
+            elif not self.reserved.covers(n):
+                to_visit.extend(n.subnets(prefixlen_diff=1))
+
+    def allocate(self, prefixlen):
+        """Allocate a new subnet
+
+        :param prefixlen: the prefix length of the subnet
+        :return: ip_network-like
+        :raise ValueError: if no free block is large enough"""
+        if not self._count:
+            raise ValueError('No subnet left in the prefix space for all '
+                             'broadcast domains.')
+        prefixlen = plen = int(prefixlen)
+        # Best fit: the smallest block that can contain the prefix
+        while plen >= 0 and not self._free.get(plen):
+            plen -= 1
+        if plen < 0 or prefixlen > self._max_prefixlen:
+            raise ValueError('Could not find a subnet big enough for a '
+                             'broadcast domain.')
+        addr = heapq.heappop(self._free[plen])
+        self._count -= 1
+        # Split the block, and keep its left half at every step
+        while plen < prefixlen:
+            plen += 1
+            self._push(addr + (1 << (self._max_prefixlen - plen)), plen)
+        return self._net_cls((addr, prefixlen))
+
+    def free_subnets(self):
+        """Return the list of free subnets, from the smallest to the
+        biggest"""
+        return [self._net_cls((addr, plen))
+                for plen in sorted(self._free, reverse=True)
+                for addr in sorted(self._free[plen])]
@@ -1,30 +1,55 @@
+import glob
+import os
+import signal
+import time
 
 from mininet.log import lg as log
 import mininet.clean as mnclean
 
 import ipmininet.router.config as daemons
 
+from .teardown import scan_processes, daemon_pids, signal_pids, \
+    wait_pids, cmdline, remove_files
 from .utils import is_container
 
 
-def cleanup():
-    """Cleanup all possible junk that we may have started."""
+def _daemon_classes():
+    for d in daemons.__all__:
+        obj = getattr(daemons, d)
+        if getattr(obj, 'KILL_PATTERNS', None):
+            yield obj
+
+
+def cleanup(cwd='/tmp'):
+    """Cleanup all possible junk that we may have started.
+
+    :param cwd: the base directory of the routers, in which we look for the
+                pid files of the daemons"""
     log.setLogLevel('info')
     # Standard mininet cleanup
     mnclean.cleanup()
     # Cleanup any leftover daemon
     patterns = []
-    for d in daemons.__all__:
-        obj = getattr(daemons, d)
-        killp = getattr(obj, 'KILL_PATTERNS', None)
-        if not killp:
-            continue
+    pid_files = {}  # pid file -> daemon name
+    for obj in _daemon_classes():
+        killp = obj.KILL_PATTERNS
         if not is_container(killp):
             killp = [killp]
         patterns.extend(killp)
+        if obj.NAME:
+            for path in glob.glob(os.path.join(cwd, '%s_*.pid' % obj.NAME)):
+                pid_files[path] = obj.NAME
     log.info('*** Cleaning up daemons:\n')
-    for pattern in patterns:
-        mnclean.killprocs('"%s"' % pattern)
+    # A single scan of /proc matches all patterns at once
+    pids = set(pid for pid, _ in scan_processes(patterns))
+    pids.update(daemon_pids(pid_files))
+    for pid in sorted(pids):
+        log.info('%d (%s) ' % (pid, cmdline(pid)))
+    signal_pids(pids, signal.SIGKILL)
+    remaining = wait_pids(pids, time.time() + 1)
+    if remaining:
+        log.error('Could not kill the processes', remaining, '\n')
+    remove_files(pid_files)
     log.info('\n')
 
 
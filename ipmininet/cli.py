@@ -1,13 +1,20 @@
 """An enhanced CLI providing IP-related commands"""
+import re
 import sys
 from cmd import Cmd
-from select import poll
+from collections import OrderedDict
+from select import poll, POLLIN
 
 from mininet.cli import CLI
 from mininet.log import lg
 
 from ipmininet.utils import address_pair
 
+# A command run on a group of nodes, e.g., "r1,r2: ip route"
+FANOUT = re.compile(r'^\s*([\w.-]+(?:\s*,\s*[\w.-]+)*)\s*:\s*(.*)$')
+# A group selecting the routers of an AS, e.g., "as65001"
+AS_GROUP = re.compile(r'^as(\d+)$')
+
 
 class IPCLI(CLI):
 
@@ -36,12 +43,115 @@ class IPCLI(CLI):
         self.initReadline()
         self.run()
 
+    def onecmd(self, line):
+        match = FANOUT.match(line)
+        if match is not None:
+            return self.fanout(*match.groups())
+        return CLI.onecmd(self, line)
+
+    def select_nodes(self, selector):
+        """Return the nodes matching a comma-separated list of node names
+        and groups, in order and without duplicates. The groups are
+        'routers', 'hosts', 'switches', 'all' and as<number> for the
+        routers of an AS.
+
+        :raise ValueError: if a name is neither a node nor a group"""
+        groups = {'routers': self.mn.routers,
+                  'hosts': self.mn.hosts,
+                  'switches': self.mn.switches,
+                  'all': self.mn.routers + self.mn.hosts + self.mn.switches}
+        nodes = []
+        for name in selector.split(','):
+            name = name.strip()
+            if name in self.mn:
+                group = [self.mn[name]]
+            elif name in groups:
+                group = groups[name]
+            elif AS_GROUP.match(name):
+                group = [r for r in self.mn.routers
+                         if str(r.asn) == AS_GROUP.match(name).group(1)]
+            else:
+                raise ValueError('Unknown node or group: %s' % name)
+            nodes.extend(n for n in group if n not in nodes)
+        return nodes
+
+    def fanout(self, selector, line, summary=False):
+        """Run a command on all nodes matching a selector (see
+        select_nodes)"""
+        if not line.strip():
+            lg.error('*** Enter a command for nodes: %s: <cmd>\n' % selector)
+            return
+        try:
+            nodes = self.select_nodes(selector)
+        except ValueError as e:
+            lg.error('*** %s\n' % e)
+            return
+        self.run_on(nodes, line, summary=summary)
+
+    def do_summary(self, line):
+        """summary nodes: cmd: Run the command on the nodes, and print the
+        nodes with the same output together"""
+        match = FANOUT.match(line)
+        if match is None:
+            lg.error('*** Usage: summary <nodes>: <cmd>\n')
+            return
+        self.fanout(*match.groups(), summary=True)
+
+    def run_on(self, nodes, line, summary=False):
+        """Run a command concurrently on nodes. Their output is printed line
+        by line as it arrives, prefixed by the node name, or once all
+        commands are done, grouping the nodes with identical outputs.
+
+        :param nodes: the nodes running the command
+        :param line: the command, in which node names are replaced by their
+                     addresses (see default)
+        :param summary: whether the outputs are grouped"""
+        running = {}
+        for node in nodes:
+            cmd = self._node_command(node, line.split(' '))
+            if cmd is not None:
+                node.sendCmd(cmd)
+                running[node.stdout.fileno()] = node
+        poller = poll()
+        for fd in running:
+            poller.register(fd, POLLIN)
+        pending = dict((n, '') for n in running.values())
+        outputs = OrderedDict((n, []) for n in nodes if n in pending)
+        while running:
+            try:
+                for fd, _ in poller.poll():
+                    node = running[fd]
+                    data = pending[node] + node.monitor(0).replace('\r', '')
+                    lines = data.split('\n')
+                    if node.waiting:
+                        pending[node] = lines.pop()
+                    else:
+                        poller.unregister(fd)
+                        del running[fd]
+                        if not lines[-1]:
+                            lines.pop()
+                    outputs[node].extend(lines)
+                    if not summary:
+                        for l in lines:
+                            lg.output('[%s] %s\n' % (node.name, l))
+            except KeyboardInterrupt:
+                for node in running.values():
+                    node.sendInt()
+        if summary:
+            groups = OrderedDict()
+            for node, lines in outputs.items():
+                groups.setdefault(tuple(lines), []).append(node.name)
+            for lines, names in groups.items():
+                lg.output('*** %s (%d node%s):\n' % (
+                    ', '.join(names), len(names), 's' if len(names) > 1
+                    else ''))
+                for l in lines:
+                    lg.output(l + '\n')
+
     def do_route(self, line=""):
         """route destination: Print all the routes towards that destination
         for every router in the network"""
-        for r in self.mn.routers:
-            lg.output("[%s] " % r.name)
-            self.default('%s ip route get %s' % (r.name, line))
+        self.run_on(self.mn.routers, 'ip route get %s' % line)
 
     def do_ip(self, line):
         """ip IP1 IP2 ...: return the node associated to the given IP"""
@@ -97,30 +207,39 @@ class IPCLI(CLI):
                 lg.error("*** Enter a command for node: %s <cmd>" % first)
                 return
             node = self.mn[first]
-            rest = args.split(' ')
-
-            hops = [h for h in rest if h in self.mn]
-            v4_support, v6_support = address_pair(self.mn[first])
-            v4_map = {}
-            v6_map = {}
-            for hop in hops:
-                ip, ip6 = address_pair(self.mn[hop],
-                                       v4_support is not None,
-                                       v6_support is not None)
-                if ip is not None:
-                    v4_map[hop] = ip
-                if ip6 is not None:
-                    v6_map[hop] = ip6
-            ip_map = v4_map if len(v4_map) >= len(v6_map) else v6_map
-
-            if len(ip_map) < len(hops):
-                missing = [h for h in hops if h not in ip_map]
-                version = 'IPv4' if v4_support else 'IPv6'
-                lg.error('*** Nodes', missing, 'have no', version,
-                         'address! Cannot execute the command.\n')
+            cmd = self._node_command(node, args.split(' '))
+            if cmd is None:
                 return
-
-            node.sendCmd(' '.join([ip_map.get(r, r) for r in rest]))
+            node.sendCmd(cmd)
             self.waitForNode(node)
         else:
             lg.error('*** Unknown command: %s\n' % line)
+
+    def _node_command(self, node, rest):
+        """Return the command to run on a node, with the node names replaced
+        by their addresses, or None if some have no address (see default)
+
+        :param rest: the words of the command"""
+        hops = [h for h in rest if h in self.mn]
+        if not hops:
+            return ' '.join(rest)
+        v4_support, v6_support = address_pair(node)
+        v4_map = {}
+        v6_map = {}
+        for hop in hops:
+            ip, ip6 = address_pair(self.mn[hop],
+                                   v4_support is not None,
+                                   v6_support is not None)
+            if ip is not None:
+                v4_map[hop] = ip
+            if ip6 is not None:
+                v6_map[hop] = ip6
+        ip_map = v4_map if len(v4_map) >= len(v6_map) else v6_map
+
+        if len(ip_map) < len(hops):
+            missing = [h for h in hops if h not in ip_map]
+            version = 'IPv4' if v4_support else 'IPv6'
+            lg.error('*** Nodes', missing, 'have no', version,
+                     'address! Cannot execute the command.\n')
+            return None
+        return ' '.join([ip_map.get(r, r) for r in rest])
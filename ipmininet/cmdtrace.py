@@ -0,0 +1,272 @@
+"""This module traces the commands run in the nodes of a network, i.e., the
+calls to Node.cmd, Node.pexec and Node.popen, to show where the shell
+round-trips of a topology are spent.
+
+The tracer aggregates the commands per node, per subsystem (the ipmininet
+module issuing the command), per program and per call site, with a
+latency histogram for each, such that it can be left enabled:
+
+>>> with CommandTracer() as tracer:
+...     net = IPNet(topo=MyTopo())
+...     net.start()
+>>> print(tracer.summary())
+
+Setting IPMININET_TRACE_COMMANDS=<file> in the environment traces the
+commands of a whole run, and writes the JSON report to file at exit."""
+import atexit
+import bisect
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from mininet.node import Node
+
+from ipmininet import basestring
+
+# The modules whose frames are skipped when looking for the call site
+_SKIPPED_MODULES = ('mininet.', __name__)
+
+
+def _subclasses(cls):
+    """Return cls and all its subclasses"""
+    classes = [cls]
+    for c in classes:
+        classes.extend(s for s in c.__subclasses__() if s not in classes)
+    return classes
+
+
+class LatencyHistogram(object):
+    """A histogram of durations, with fixed buckets from 100us to 1s"""
+
+    # The upper bounds of the buckets, in seconds
+    BOUNDS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1,
+              .25, .5, 1.)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, duration):
+        self.buckets[bisect.bisect_left(self.BOUNDS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.
+
+    def percentile(self, p):
+        """Return the upper bound of the bucket containing the p-th
+        percentile, the maximal duration for the last bucket"""
+        rank = p / 100. * self.count
+        seen = 0
+        for bound, n in zip(self.BOUNDS, self.buckets):
+            seen += n
+            if seen >= rank and seen:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.mean,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'buckets': dict(('<=%gms' % (b * 1000), n) for b, n in
+                                zip(self.BOUNDS, self.buckets) if n),
+                'slower': self.buckets[-1]}
+
+
+class CommandTracer(object):
+    """Records the commands run through Node.cmd, Node.pexec and Node.popen,
+    once installed. Commands run while another traced call is in progress
+    in the same thread (e.g., pexec calling popen, or an overridden method
+    calling its parent) are counted once."""
+
+    METHODS = ('cmd', 'pexec', 'popen')
+    _installed = None
+
+    def __init__(self, keep=0):
+        """:param keep: the number of the last commands kept with their
+                        details, see records"""
+        self.by_node = {}
+        self.by_subsystem = {}
+        self.by_program = {}
+        self.by_site = {}
+        self.by_method = {}
+        self.total = LatencyHistogram()
+        # The last (node, method, command, call site, duration) recorded
+        self.records = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._originals = {}
+
+    def install(self):
+        """Start tracing the commands of all nodes. The methods are wrapped
+        in Node and in all its subclasses overriding them, which should thus
+        be imported beforehand.
+
+        :raise ValueError: if another tracer is installed"""
+        if CommandTracer._installed is not None:
+            raise ValueError('A command tracer is already installed')
+        CommandTracer._installed = self
+        for cls in _subclasses(Node):
+            for method in self.METHODS:
+                original = cls.__dict__.get(method)
+                if original is not None:
+                    self._originals[cls, method] = original
+                    setattr(cls, method, self._wrap(method, original))
+        return self
+
+    def uninstall(self):
+        """Stop tracing the commands"""
+        if CommandTracer._installed is not self:
+            return
+        for (cls, method), original in self._originals.items():
+            setattr(cls, method, original)
+        self._originals = {}
+        CommandTracer._installed = None
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    def _wrap(self, method, original):
+        tracer = self
+
+        @functools.wraps(original)
+        def traced(node, *args, **kwargs):
+            local = tracer._local
+            if getattr(local, 'active', False):
+                return original(node, *args, **kwargs)
+            local.active = True
+            start = time.time()
+            try:
+                return original(node, *args, **kwargs)
+            finally:
+                duration = time.time() - start
+                local.active = False
+                tracer._record(node, method, args, kwargs, duration)
+        return traced
+
+    @staticmethod
+    def _call_site():
+        """Return the module and the location of the code issuing a
+        command"""
+        frame = sys._getframe(3)
+        for _ in range(32):
+            if frame is None:
+                break
+            module = frame.f_globals.get('__name__', '?')
+            if not module.startswith(_SKIPPED_MODULES):
+                code = frame.f_code
+                return module, '%s:%d(%s)' % (code.co_filename,
+                                              frame.f_lineno, code.co_name)
+            frame = frame.f_back
+        return '?', '?'
+
+    @staticmethod
+    def _command(args, kwargs):
+        cmd = args if args else kwargs.get('args', ())
+        if len(cmd) == 1:
+            cmd = cmd[0]
+        if isinstance(cmd, basestring):
+            return cmd
+        return ' '.join(str(c) for c in cmd)
+
+    def _record(self, node, method, args, kwargs, duration):
+        module, site = self._call_site()
+        command = self._command(args, kwargs)
+        program = os.path.basename(command.split(None, 1)[0]) \
+            if command.strip() else '?'
+        name = getattr(node, 'name', '?')
+        with self._lock:
+            self.total.add(duration)
+            for stats, key in ((self.by_node, name),
+                               (self.by_subsystem, module),
+                               (self.by_program, program),
+                               (self.by_site, site),
+                               (self.by_method, method)):
+                try:
+                    stats[key].add(duration)
+                except KeyError:
+                    stats[key] = LatencyHistogram()
+                    stats[key].add(duration)
+            if self.records.maxlen:
+                self.records.append((name, method, command, site, duration))
+
+    @staticmethod
+    def _top(stats, top=None):
+        """Return the (key, histogram) pairs sorted by total time"""
+        return sorted(stats.items(), key=lambda item: item[1].total,
+                      reverse=True)[:top]
+
+    def report(self, top=None):
+        """Return a JSON-serializable report of the traced commands
+
+        :param top: the number of entries kept per category, all if None"""
+        with self._lock:
+            return {'total': self.total.to_dict(),
+                    'methods': dict((k, v.to_dict())
+                                    for k, v in self.by_method.items()),
+                    'nodes': [dict(node=k, **v.to_dict())
+                              for k, v in self._top(self.by_node, top)],
+                    'subsystems': [dict(subsystem=k, **v.to_dict()) for k, v
+                                   in self._top(self.by_subsystem, top)],
+                    'programs': [dict(program=k, **v.to_dict()) for k, v
+                                 in self._top(self.by_program, top)],
+                    'call_sites': [dict(site=k, **v.to_dict()) for k, v
+                                   in self._top(self.by_site, top)]}
+
+    def write_json(self, path, top=None):
+        """Write the report to a file
+
+        :param path: the path of the file or a file object"""
+        if isinstance(path, basestring):
+            with open(path, 'w') as f:
+                json.dump(self.report(top), f, indent=2)
+        else:
+            json.dump(self.report(top), path, indent=2)
+
+    def summary(self, top=10):
+        """Return a table of the commands per subsystem, per program and per
+        call site
+
+        :param top: the number of entries shown per category"""
+        lines = ['%d commands, %.1fms in total' % (self.total.count,
+                                                   self.total.total * 1000)]
+        with self._lock:
+            for title, stats in (('Subsystem', self.by_subsystem),
+                                 ('Program', self.by_program),
+                                 ('Top call sites', self.by_site)):
+                lines.append('')
+                lines.append('%-60s %7s %10s %9s %9s' % (
+                    title, 'Count', 'Total', 'p50', 'p99'))
+                for key, h in self._top(stats, top):
+                    if len(key) > 60:
+                        key = '...' + key[-57:]
+                    lines.append('%-60s %7d %8.1fms %7.2fms %7.2fms' % (
+                        key, h.count, h.total * 1000,
+                        h.percentile(50) * 1000, h.percentile(99) * 1000))
+        return '\n'.join(lines)
+
+
+def trace_from_environment():
+    """Trace the commands of this run if IPMININET_TRACE_COMMANDS is set,
+    and write the report to the file it names at exit"""
+    path = os.environ.get('IPMININET_TRACE_COMMANDS')
+    if not path or CommandTracer._installed is not None:
+        return
+    tracer = CommandTracer().install()
+    atexit.register(tracer.write_json, path)
@@ -4,6 +4,8 @@ import argparse
 import ipmininet
 from ipmininet.ipnet import IPNet
 from ipmininet.cli import IPCLI
+from ipmininet.instrumentation import Tracer
+from ipmininet.cmdtrace import CommandTracer
 
 from .simple_ospf_network import SimpleOSPFNet
 from .simple_ospfv3_network import SimpleOSPFv3Net
@@ -74,6 +76,21 @@ def parse_args():
     parser.add_argument('--args', help='Additional arguments to give'
                         'to the topology constructor (key=val, key=val, ...)',
                         default='')
+    parser.add_argument('--timings', metavar='FILE',
+                        help='Record the duration of each phase of the '
+                        'network lifecycle, print a summary and write a JSON '
+                        'report to FILE')
+    parser.add_argument('--profile', nargs='*', metavar='PHASE',
+                        help='Profile the given phases (e.g. build start), '
+                        'or all of them if none is given, in the timings '
+                        'report')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Trace the memory allocated by each phase in '
+                        'the timings report')
+    parser.add_argument('--trace-commands', metavar='FILE',
+                        help='Record the commands run in the nodes, print '
+                        'their top call sites and write a JSON report to '
+                        'FILE')
     return parser.parse_args()
 
 
@@ -92,7 +109,27 @@ if __name__ == '__main__':
             kwargs[k] = v
         except ValueError:
             lg.error('Ignoring args:', arg)
-    net = IPNet(topo=TOPOS[args.topo](**kwargs), **NET_ARGS.get(args.topo, {}))
+    tracer = None
+    if args.timings:
+        tracer = Tracer(profile=True if args.profile == []
+                        else args.profile or (),
+                        trace_memory=args.trace_memory)
+    command_tracer = None
+    if args.trace_commands:
+        command_tracer = CommandTracer().install()
+    net = IPNet(topo=TOPOS[args.topo](**kwargs), tracer=tracer,
+                **NET_ARGS.get(args.topo, {}))
     net.start()
+    try:
+        net.wait_stp_converged()
+    except ValueError:
+        pass  # Already logged, the CLI can still be used
     IPCLI(net)
     net.stop()
+    if tracer is not None:
+        lg.output(tracer.summary() + '\n')
+        tracer.write_json(args.timings)
+    if command_tracer is not None:
+        command_tracer.uninstall()
+        lg.output(command_tracer.summary() + '\n')
+        command_tracer.write_json(args.trace_commands)
@@ -0,0 +1,246 @@
+"""This module records how long the phases of the lifecycle of a network
+take, as a tree of timed spans, optionally profiling their CPU usage with
+cProfile and their memory allocations with tracemalloc.
+
+The spans can be reported as JSON, or as a summary table:
+
+>>> net = IPNet(topo=MyTopo(), tracer=Tracer())
+>>> net.start()
+>>> print(net.tracer.summary())
+>>> net.tracer.write_json('timings.json')"""
+import cProfile
+import functools
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from ipmininet import basestring
+
+
+class Span(object):
+    """A timed phase, possibly containing nested phases"""
+
+    def __init__(self, name, attrs=None):
+        """:param name: the name of the phase
+        :param attrs: a dict of additional information on the phase"""
+        self.name = name
+        self.attrs = attrs or {}
+        self.children = []
+        self.thread = threading.current_thread().name
+        self.start = self.end = None
+        # The bytes allocated and not freed during the span, if traced
+        self.memory = None
+        # The list of the most expensive functions, if profiled
+        self.profile = None
+        self.error = None
+
+    @property
+    def duration(self):
+        """The duration of the span in seconds, None if it is running"""
+        return None if self.end is None else self.end - self.start
+
+    def walk(self, depth=0):
+        """Iterate over this span and its descendants, as (depth, span)"""
+        yield depth, self
+        for child in sorted(self.children, key=lambda s: s.start):
+            for item in child.walk(depth + 1):
+                yield item
+
+    def to_dict(self, origin=0):
+        """Return a JSON-serializable description of this span
+
+        :param origin: the time to which the start times are relative"""
+        d = {'name': self.name,
+             'start': self.start - origin,
+             'duration': self.duration,
+             'thread': self.thread,
+             'children': [c.to_dict(origin) for c in
+                          sorted(self.children, key=lambda s: s.start)]}
+        for key in ('attrs', 'memory', 'profile', 'error'):
+            value = getattr(self, key)
+            if value:
+                d[key] = value
+        return d
+
+
+class Tracer(object):
+    """Records the spans of the lifecycle of a network.
+
+    Spans opened in a thread are nested in the last span opened by this
+    thread, or in an explicit parent, e.g., to attach the tasks run by a
+    pool of threads to the phase that runs them."""
+
+    def __init__(self, enabled=True, profile=(), trace_memory=False,
+                 profile_top=20):
+        """:param enabled: whether spans are recorded
+        :param profile: the names of the spans to profile with cProfile,
+                        True to profile all spans (except the ones nested
+                        in an already profiled span)
+        :param trace_memory: whether the memory allocated during each span
+                             is traced with tracemalloc
+        :param profile_top: the number of functions kept in the profile of
+                            a span"""
+        self.enabled = enabled
+        self.profile = profile if profile is True else \
+            {profile} if isinstance(profile, basestring) else set(profile)
+        self.trace_memory = trace_memory and tracemalloc is not None \
+            and enabled
+        self.profile_top = profile_top
+        self.origin = time.time()
+        self.roots = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            self._local.profiling = False
+            return self._local.stack
+
+    def current(self):
+        """Return the innermost span opened by this thread, or None"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name, parent=None, **attrs):
+        """Time the enclosed block as a new span
+
+        :param name: the name of the span
+        :param parent: the span in which this one is nested, the current
+                       span of this thread if None
+        :param attrs: additional information stored in the span
+        :return: the Span, or None if the tracer is disabled"""
+        if not self.enabled:
+            yield None
+            return
+        stack = self._stack()
+        span = Span(name, attrs)
+        if parent is None and stack:
+            parent = stack[-1]
+        with self._lock:
+            (parent.children if parent is not None else self.roots)\
+                .append(span)
+        profiler = self._start_profiler(name)
+        memory = tracemalloc.get_traced_memory()[0] \
+            if self.trace_memory else None
+        stack.append(span)
+        span.start = time.time()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = '%s: %s' % (type(e).__name__, e)
+            raise
+        finally:
+            span.end = time.time()
+            stack.pop()
+            if memory is not None:
+                span.memory = tracemalloc.get_traced_memory()[0] - memory
+            if profiler is not None:
+                profiler.disable()
+                self._local.profiling = False
+                span.profile = self._top_functions(profiler)
+
+    def wrap(self, name, func, parent=None, **attrs):
+        """Return a function running func in a new span
+
+        :param parent: the span in which the new span is nested, the
+                       current span of the caller if None"""
+        if not self.enabled:
+            return func
+        if parent is None:
+            parent = self.current()
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            with self.span(name, parent=parent, **attrs):
+                return func(*args, **kwargs)
+        return run
+
+    def _start_profiler(self, name):
+        if self._local.profiling or not \
+                (self.profile is True or name in self.profile):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiler is active
+            return None
+        self._local.profiling = True
+        return profiler
+
+    def _top_functions(self, profiler):
+        """Return the functions with the highest cumulative time"""
+        stats = pstats.Stats(profiler).stats
+        top = sorted(stats.items(), key=lambda item: item[1][3],
+                     reverse=True)[:self.profile_top]
+        return [{'function': '%s:%d(%s)' % func,
+                 'calls': ncalls,
+                 'total': tottime,
+                 'cumulative': cumtime}
+                for func, (_, ncalls, tottime, cumtime, _) in top]
+
+    def spans(self):
+        """Iterate over all spans, as (depth, span)"""
+        for root in sorted(self.roots, key=lambda s: s.start):
+            for item in root.walk():
+                yield item
+
+    def report(self):
+        """Return a JSON-serializable report of all spans"""
+        return {'origin': self.origin,
+                'spans': [r.to_dict(self.origin) for r in
+                          sorted(self.roots, key=lambda s: s.start)]}
+
+    def write_json(self, path):
+        """Write the report to a file
+
+        :param path: the path of the file or a file object"""
+        if isinstance(path, basestring):
+            with open(path, 'w') as f:
+                json.dump(self.report(), f, indent=2)
+        else:
+            json.dump(self.report(), path, indent=2)
+
+    def summary(self, max_depth=None):
+        """Return a table of the spans, indented by nesting level
+
+        :param max_depth: the deepest nesting level shown, all if None"""
+        lines = ['%-48s %10s %10s%s' % ('Phase', 'Start', 'Duration',
+                                        ' %12s' % 'Memory'
+                                        if self.trace_memory else '')]
+        for depth, span in self.spans():
+            if max_depth is not None and depth > max_depth:
+                continue
+            duration = span.duration
+            lines.append('%-48s %8.1fms %10s%s%s' % (
+                '  ' * depth + span.name, (span.start - self.origin) * 1000,
+                'running' if duration is None else
+                '%.1fms' % (duration * 1000),
+                ' %12s' % ('%+dB' % span.memory if span.memory is not None
+                           else '') if self.trace_memory else '',
+                ' [%s]' % span.error if span.error else ''))
+        return '\n'.join(lines)
+
+    def close(self):
+        """Stop tracing the memory, if this tracer started it"""
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+# A tracer recording nothing
+NULL_TRACER = Tracer(enabled=False)
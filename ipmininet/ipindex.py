@@ -0,0 +1,217 @@
+"""This module defines an index of the IP addresses and subnets of a network,
+answering exact and longest-prefix match queries in a time proportional to
+the length of the prefixes."""
+from builtins import str
+
+import itertools
+
+from ipaddress import ip_network, ip_interface, IPv4Network, IPv6Network
+
+from .link import address_generation
+
+
+_NETWORK_CLS = {4: IPv4Network, 6: IPv6Network}
+
+
+def _common_prefixlen(a, b, max_prefixlen, prefixlen):
+    """Return the length of the common prefix of a and b, up to prefixlen"""
+    diff = (a ^ b) >> (max_prefixlen - prefixlen)
+    return prefixlen - diff.bit_length()
+
+
+class _TrieNode(object):
+    __slots__ = ('key', 'prefixlen', 'value', 'has_value', 'children')
+
+    def __init__(self, key, prefixlen):
+        self.key = key
+        self.prefixlen = prefixlen
+        self.value = None
+        self.has_value = False
+        self.children = [None, None]
+
+    def set(self, value):
+        self.value = value
+        self.has_value = True
+
+
+class PrefixTrie(object):
+    """A path-compressed binary trie (a.k.a. radix or patricia trie) mapping
+    IP prefixes of both versions to values.
+
+    Every node of the trie is a prefix, whose children are the longest
+    prefixes found below its left or right half. Only branching nodes and
+    nodes with values are kept."""
+
+    def __init__(self):
+        self._roots = {4: _TrieNode(0, 0), 6: _TrieNode(0, 0)}
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __setitem__(self, net, value):
+        net = ip_network(str(net), strict=False)
+        bits = net.max_prefixlen
+        key, plen = int(net.network_address), net.prefixlen
+        node = self._roots[net.version]
+        while node.prefixlen < plen:
+            bit = (key >> (bits - node.prefixlen - 1)) & 1
+            child = node.children[bit]
+            if child is None:
+                child = node.children[bit] = _TrieNode(key, plen)
+                node = child
+                break
+            common = _common_prefixlen(child.key, key, bits,
+                                       min(child.prefixlen, plen))
+            if common < child.prefixlen:
+                # Insert a new node where both prefixes diverge
+                mask = ((1 << common) - 1) << (bits - common)
+                split = node.children[bit] = _TrieNode(key & mask, common)
+                split.children[(child.key >> (bits - common - 1)) & 1] = child
+                child = split
+            node = child
+        if not node.has_value:
+            self._len += 1
+        node.set(value)
+
+    def _walk(self, ip):
+        """Yield the nodes of the prefixes containing a given address or
+        prefix, from the shortest to the longest
+
+        :param ip: ip_interface-like"""
+        bits = ip.max_prefixlen
+        key, plen = int(ip.network.network_address), ip.network.prefixlen
+        node = self._roots[ip.version]
+        while True:
+            yield node
+            if node.prefixlen >= plen:
+                return
+            node = node.children[(key >> (bits - node.prefixlen - 1)) & 1]
+            if node is None or node.prefixlen > plen or \
+                    (node.key ^ key) >> (bits - node.prefixlen):
+                return
+
+    def longest_match(self, ip, default=None):
+        """Return the prefix and the value of the longest prefix that
+        contains an address or a prefix
+
+        :param ip: the address or prefix, either as ip_interface-like object
+                   or a string
+        :param default: the value to return if no prefix matches
+        :return: (ip_network-like, value) or default"""
+        ip = ip_interface(str(ip))
+        best = None
+        for node in self._walk(ip):
+            if node.has_value:
+                best = node
+        if best is None:
+            return default
+        net = _NETWORK_CLS[ip.version]((best.key, best.prefixlen))
+        return net, best.value
+
+    def get(self, net, default=None):
+        """Return the value of an exact prefix
+
+        :param net: ip_network-like object or a string
+        :param default: the value to return if the prefix is unknown"""
+        net = ip_network(str(net), strict=False)
+        match = self.longest_match(net)
+        if match is None or match[0] != net:
+            return default
+        return match[1]
+
+    def setdefault(self, net, default=None):
+        """Return the value of an exact prefix, after having set it to
+        default if the prefix was unknown"""
+        value = self.get(net, self)
+        if value is self:
+            self[net] = value = default
+        return value
+
+    def __getitem__(self, net):
+        value = self.get(net, self)
+        if value is self:
+            raise KeyError(net)
+        return value
+
+    def __contains__(self, net):
+        return self.get(net, self) is not self
+
+
+class IPIndex(object):
+    """An index of the addresses and subnets assigned to the interfaces of
+    a set of nodes.
+
+    It is rebuilt on the next query whenever the known addresses of any
+    interface change, so that it always reflects the current addressing
+    of the network."""
+
+    def __init__(self, nodes=()):
+        """:param nodes: the nodes whose interfaces are indexed"""
+        self.nodes = list(nodes)
+        self._generation = None
+        self._addresses = None  # address -> interface
+        self._subnets = None  # subnet -> interfaces
+
+    def _build(self):
+        self._addresses = PrefixTrie()
+        self._subnets = PrefixTrie()
+        for n in self.nodes:
+            for itf in n.intfList():
+                for ip in _global_ips(itf):
+                    self._addresses.setdefault(ip.ip, itf)
+                    self._subnets.setdefault(ip.network, []).append(itf)
+        # The index can read addresses for the first time, which does not
+        # make it outdated
+        self._generation = address_generation()
+
+    def _index(self):
+        if self._generation != address_generation():
+            self._build()
+        return self
+
+    def interface_for_ip(self, ip):
+        """Return the interface to which an address is assigned
+
+        :param ip: the address, with or without a prefix length
+        :raise KeyError: if no interface has this address"""
+        try:
+            ip = ip_interface(str(ip))
+        except ValueError:
+            raise KeyError(ip)
+        return self._index()._addresses[ip.ip]
+
+    def node_for_ip(self, ip):
+        """Return the node to which an address is assigned
+
+        :param ip: the address, with or without a prefix length
+        :raise KeyError: if no node has this address"""
+        return self.interface_for_ip(ip).node
+
+    def interfaces_for_subnet(self, ip):
+        """Return the interfaces whose subnet is the longest one containing
+        an address or a subnet
+
+        :param ip: the address or subnet
+        :return: a list of interfaces, empty if there are none"""
+        match = self._index()._subnets.longest_match(ip)
+        return [] if match is None else match[1]
+
+    def broadcast_domain_for_subnet(self, ip):
+        """Return the broadcast domain that owns the longest subnet
+        containing an address or a subnet
+
+        :param ip: the address or subnet
+        :return: the broadcast domain or None"""
+        for itf in self.interfaces_for_subnet(ip):
+            if itf.broadcast_domain is not None:
+                return itf.broadcast_domain
+        return None
+
+
+def _global_ips(itf):
+    """Return the addresses of an interface, except the loopback and
+    link-local ones that are not unique in the network"""
+    for ip in itertools.chain(itf.ips(), itf.ip6s(exclude_lls=True)):
+        if not ip.is_loopback:
+            yield ip
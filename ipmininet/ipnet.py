@@ -3,25 +3,43 @@ This modules will auto-generate all needed configuration properties if
 unspecified by the user"""
 from builtins import str
 
+import functools
 import math
-from operator import attrgetter, methodcaller
+import sys
+import time
+from collections import OrderedDict
+from itertools import groupby
+from operator import methodcaller
 
 from ipaddress import ip_network, ip_interface
 
 from . import MIN_IGP_METRIC, OSPF_DEFAULT_AREA
-from .utils import otherIntf, realIntfList, L3Router, address_pair, has_cmd
-from .router import Router
+from .allocator import PrefixAllocator, interface_at
+from .utils import otherIntf, realIntfList, L3Router, address_pair,\
+    DisjointSet, AdjacencyIndex
+from .ipindex import IPIndex
+from .iptopo import collapse_switches
+from .reachability import PingEngine
+from .scheduler import TaskGraph
+from .teardown import TERMINATE_TIMEOUT
+from .instrumentation import NULL_TRACER
+from .cmdtrace import trace_from_environment
+from .stp import stp_states, wait_stp_converged
+from .router import Router, ConfigCheckError
 from .router.config import BasicRouterConfig
-from .link import IPIntf, IPLink, PhysicalInterface
+from .router.config.base import RouterIdAllocator
+from .router.config.render import render_configs
+from .link import IPIntf, IPLink, PhysicalInterface, AddressBatch,\
+    AddressWatcher, address_generation
 
+import mininet.clean
 from mininet.net import Mininet
 from mininet.node import Host
 from mininet.nodelib import LinuxBridge
-from ipmininet.switch_hub import SwitchHub
+from ipmininet.switch_hub import SwitchHub, port_vlans
 from mininet.log import lg as log
 
-# ping6 is not provided by default on newer systems
-PING6_CMD = 'ping6' if has_cmd('ping6') else 'ping -6'
+trace_from_environment()
 
 
 class IPNet(Mininet):
@@ -42,6 +60,11 @@ class IPNet(Mininet):
                  intf=IPIntf,
                  switch=SwitchHub,
                  controller=None,
+                 watch_addresses=None,
+                 max_workers=None,
+                 stop_timeout=TERMINATE_TIMEOUT,
+                 tracer=None,
+                 collapse_switches=False,
                  *args, **kwargs):
         """Extends Mininet by adding IP-related ivars/functions and
         configuration knobs.
@@ -57,11 +80,31 @@ class IPNet(Mininet):
         :param max_v6_prefixlen: Maximal IPv6 prefixlen to auto-allocate
         :param allocate_IPs: wether to auto-allocate subnets in the network
         :param igp_metric: The default IGP metric for the links
-        :param igp_area: The default IGP area for the links"""
+        :param igp_area: The default IGP area for the links
+        :param watch_addresses: Whether the address changes made by the
+                                kernel should be watched (True for all
+                                nodes, False for none), so that the known
+                                addresses of the interfaces stay up-to-date.
+                                By default, only the hosts that can receive
+                                router advertisements are watched.
+        :param max_workers: The maximal number of nodes that are started or
+                            stopped in parallel (see
+                            ipmininet.scheduler.default_workers() if None).
+                            Set it to 1 to start them one by one.
+        :param stop_timeout: The time given to all daemons of the network to
+                             exit when it is stopped, before they are
+                             killed
+        :param tracer: The ipmininet.instrumentation.Tracer recording the
+                       duration of the phases of the lifecycle of the
+                       network, nothing is recorded if None
+        :param collapse_switches: Whether the switches connecting only two
+                                  nodes, without spanning tree or hub
+                                  behavior, are replaced by direct links
+                                  when building from a topology"""
         self.router = router
         self.config = config
         self.routers = []  # the list of router in the network
-        self._ip_allocs = {}  # We need this to be able to do inverse-lookups
+        self.ip_index = IPIndex()  # We need this to do inverse-lookups
         self.max_v4_prefixlen = max_v4_prefixlen
         self._unallocated_ipbase = [ip_network(ipBase)]
         self.use_v4 = use_v4
@@ -74,6 +117,14 @@ class IPNet(Mininet):
         self.igp_area = igp_area
         self.allocate_IPs = allocate_IPs
         self.physical_interface = {}  # itf: node
+        self.watch_addresses = watch_addresses
+        self._address_watcher = None
+        self.adjacency = None
+        self.max_workers = max_workers
+        self.stop_timeout = stop_timeout
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.collapse_switches = collapse_switches
+        self.collapsed_switches = []  # The switches replaced by links
         super(IPNet, self).__init__(ipBase=ipBase, switch=switch, link=link,
                                     intf=intf, controller=controller,
                                     *args, **kwargs)
@@ -103,14 +154,23 @@ class IPNet(Mininet):
         return len(self.routers) + super(IPNet, self).__len__()
 
     def buildFromTopo(self, topo):
-        log.info('\n*** Adding Routers:\n')
-        for routerName in topo.routers():
-            self.addRouter(routerName, **topo.nodeInfo(routerName))
-            log.info(routerName + ' ')
-        log.info('\n')
-        self.physical_interface.update(topo.phys_interface_capture)
-        
-        super(IPNet, self).buildFromTopo(topo)
+        with self.tracer.span('buildFromTopo'):
+            log.info('\n*** Adding Routers:\n')
+            with self.tracer.span('add_routers'):
+                for routerName in topo.routers():
+                    self.addRouter(routerName, **topo.nodeInfo(routerName))
+                    log.info(routerName + ' ')
+            log.info('\n')
+            self.physical_interface.update(topo.phys_interface_capture)
+            if self.collapse_switches:
+                with self.tracer.span('collapse_switches') as span:
+                    self.collapsed_switches = collapse_switches(topo)
+                    if span is not None:
+                        span.attrs['removed'] = len(self.collapsed_switches)
+                log.info('*** Replaced', len(self.collapsed_switches),
+                         'two-port switches by direct links\n')
+
+            super(IPNet, self).buildFromTopo(topo)
                 
     def addLink(self, node1, node2,
                 igp_metric=None, igp_area=None, igp_passive=False,
@@ -168,58 +228,191 @@ class IPNet(Mininet):
         """Return the node owning a given IP address
 
         :param ip: an IP address
-        :return: a node name"""
-        return self._ip_allocs[str(ip)]
+        :return: a node
+        :raise KeyError: if no node has this address"""
+        return self.ip_index.node_for_ip(ip)
 
     def start(self):
-        super(IPNet, self).start()
+        with self.tracer.span('start'):
+            self._start()
+
+    def _start(self):
+        tracer = self.tracer
+        with tracer.span('mininet.start'):
+            self._start_switches()
+        log.info('*** Rendering the configuration of', len(self.routers),
+                 'routers\n')
+        with tracer.span('render_configs'):
+            errors = self.render_configs().errors()
+        if errors:
+            raise ValueError('Cannot render a configuration [%s: %s]'
+                             % errors[0][:2])
+        # The watcher threads are started once the rendering pool is done, as
+        # forking while they hold a lock would deadlock the workers
+        self._address_watcher = AddressWatcher(self._watched_nodes())
+        self._address_watcher.start()
         log.info('*** Starting, ', len(self.routers), 'routers\n')
-        for router in self.routers:
-            log.info(router.name + ' ')
-            router.start()
+        with tracer.span('start_nodes'):
+            graph = TaskGraph()
+            for router in self.routers:
+                log.info(router.name + ' ')
+                for task in router.start_tasks():
+                    # Each task is its own span, nested in start_nodes
+                    task.func = tracer.wrap(task.name, task.func)
+                    graph.add_task(task)
+            log.info('\n')
+            log.info('*** Setting default host routes\n')
+            for h in self.hosts:
+                if 'defaultRoute' in h.params:
+                    continue  # Skipping hosts with explicit default route
+                name = h.name + ':default-route'
+                graph.add(name, tracer.wrap(name, functools.partial(
+                    self._set_default_route, h)))
+            try:
+                graph.run(max_workers=self.max_workers)
+            except ConfigCheckError as e:
+                log.error('%s, aborting!\n' % e)
+                mininet.clean.cleanup()
+                sys.exit(1)
         log.info('\n')
-        log.info('*** Setting default host routes\n')
-        for h in self.hosts:
-            if 'defaultRoute' in h.params:
-                continue  # Skipping hosts with explicit default route
-            default = False
-            # The first router we find will become the default gateway
-            for itf in realIntfList(h):
-                for r in itf.broadcast_domain.routers:
-                    log.info('%s via %s, ' % (h.name, r.name))
-                    if self.use_v4 and len(r.addresses[4]) > 0:
-                        h.setDefaultRoute('via %s' % r.ip)
-                        default = True
-                    if (self.use_v6 and len(r.addresses[6]) > 0 and
-                            len(r.ra_prefixes)) == 0:
-                        # We define a default route only if router xi
-                        # advertisement are not activated. If we call the same
-                        # function, the route created above might be deleted
-                        h.cmd('ip route add default dev %s via %s' % (
-                            h.defaultIntf(), r.ip6))
-                        default = True
-                    break
-                if default:
-                    break
-            if not default:
-                log.info('skipping %s , ' % h.name)
+
+    def _start_switches(self):
+        """Start the controllers and the switches as Mininet.start does,
+        but starting all switches concurrently"""
+        if not self.built:
+            self.build()
+        log.info('*** Starting controller\n')
+        for controller in self.controllers:
+            log.info(controller.name + ' ')
+            controller.start()
         log.info('\n')
-                
+        log.info('*** Starting %s switches\n' % len(self.switches))
+        with self.tracer.span('start_switches'):
+            graph = TaskGraph()
+            for switch in self.switches:
+                log.info(switch.name + ' ')
+                name = switch.name + ':start'
+                graph.add(name, self.tracer.wrap(name, functools.partial(
+                    switch.start, self.controllers)))
+            graph.run(max_workers=self.max_workers)
+        for swclass, switches in groupby(sorted(self.switches,
+                                                key=lambda s: str(type(s))),
+                                         type):
+            if hasattr(swclass, 'batchStartup'):
+                swclass.batchStartup(tuple(switches))
+        log.info('\n')
+        if self.waitConn:
+            self.waitConnected()
+
+    def render_configs(self, processes=None):
+        """Build and write the configuration files of all routers, spreading
+        the template rendering over a pool of processes. This can be called
+        on its own once the network is built, and is done when the network
+        starts.
+
+        :param processes: the size of the process pool, the number of cpus
+                          if None
+        :return: a RenderReport of the errors per router and daemon"""
+        return render_configs(self.routers, processes=processes)
+
+    def _stp_switches(self):
+        return [s for s in self.switches if getattr(s, 'stp', False)]
+
+    def stp_states(self):
+        """Return the spanning tree state of the switches running it
+
+        :return: an OrderedDict mapping the switch names to their
+                 BridgeState"""
+        return stp_states(self._stp_switches())
+
+    def wait_stp_converged(self, timeout=60):
+        """Wait until the ports of all switches running the spanning tree
+        protocol have a stable state
+
+        :param timeout: the maximal number of seconds to wait
+        :return: the states of the switches, as stp_states
+        :raise ValueError: if the spanning tree has not converged in time"""
+        switches = self._stp_switches()
+        if switches:
+            log.info('*** Waiting for the spanning tree to converge on',
+                     len(switches), 'switches\n')
+        return wait_stp_converged(switches, timeout=timeout)
+
+    def _set_default_route(self, h):
+        """Set the default routes of a host towards the first router found
+        on its interfaces"""
+        default = False
+        # The first router we find will become the default gateway
+        for itf in realIntfList(h):
+            for r in itf.broadcast_domain.routers:
+                log.info('%s via %s, ' % (h.name, r.name))
+                if self.use_v4 and len(r.addresses[4]) > 0:
+                    h.setDefaultRoute('via %s' % r.ip)
+                    default = True
+                if (self.use_v6 and len(r.addresses[6]) > 0 and
+                        len(r.ra_prefixes)) == 0:
+                    # We define a default route only if router xi
+                    # advertisement are not activated. If we call the same
+                    # function, the route created above might be deleted
+                    h.cmd('ip route add default dev %s via %s' % (
+                        h.defaultIntf(), r.ip6))
+                    default = True
+                break
+            if default:
+                break
+        if not default:
+            log.info('skipping %s , ' % h.name)
+
     def stop(self):
+        with self.tracer.span('stop'):
+            self._stop()
+
+    def _stop(self):
+        tracer = self.tracer
         log.info('*** Stopping', len(self.routers),  'routers\n')
-        for router in self.routers:
-            log.info(router.name + ' ')
-            router.terminate()
+        # All routers share the same deadline, after which their remaining
+        # daemons are killed
+        deadline = time.time() + self.stop_timeout
+        with tracer.span('stop_routers'):
+            graph = TaskGraph()
+            for router in self.routers:
+                log.info(router.name + ' ')
+                name = router.name + ':terminate'
+                graph.add(name, tracer.wrap(name, functools.partial(
+                    router.terminate, deadline=deadline)))
+            graph.run(max_workers=self.max_workers)
         log.info('\n')
-        super(IPNet, self).stop()
+        if self._address_watcher:
+            self._address_watcher.stop()
+            self._address_watcher = None
+        with tracer.span('mininet.stop'):
+            super(IPNet, self).stop()
+
+    def _watched_nodes(self):
+        """Return the nodes whose address changes must be watched"""
+        if self.watch_addresses is not None:
+            return self.hosts + self.routers if self.watch_addresses else []
+        # Hosts can autoconfigure addresses from router advertisements
+        return [h for h in self.hosts
+                if any(r.ra_prefixes for itf in realIntfList(h)
+                       if itf.broadcast_domain is not None
+                       for r in itf.broadcast_domain.routers)]
 
     def build(self):
-        super(IPNet, self).build()
-        self.broadcast_domains = self._broadcast_domains()
+        with self.tracer.span('build'):
+            self._build()
+
+    def _build(self):
+        tracer = self.tracer
+        with tracer.span('mininet.build'):
+            super(IPNet, self).build()
+        with tracer.span('broadcast_domains'):
+            self.broadcast_domains = self._broadcast_domains()
         log.info("*** Found", len(self.broadcast_domains),
                  "broadcast domains\n")
         if self.allocate_IPs:
-            self._allocate_IPs()
+            with tracer.span('allocate_IPs'):
+                self._allocate_IPs()
         # Physical interfaces are their own broadcast domain
         for itf_name, n in self.physical_interface.items():
             try:
@@ -230,9 +423,16 @@ class IPNet(Mininet):
             except KeyError:
                 log.error('!!! Node', n, 'not found!\n')
         try:
-            self.topo.post_build(self)
+            with tracer.span('post_build'):
+                self.topo.post_build(self)
         except AttributeError as e:
             log.error('*** Skipping post_build():', str(e), '\n')
+        # Router ids are unique accross the whole network
+        with tracer.span('allocate_routerids'):
+            RouterIdAllocator(self.routers).allocate()
+        with tracer.span('index_nodes'):
+            self.adjacency = AdjacencyIndex(self.hosts + self.routers)
+            self.ip_index = IPIndex(self.hosts + self.routers)
 
     def _allocated_ipv4_subnets(self):
         subnets = []
@@ -248,13 +448,18 @@ class IPNet(Mininet):
 
     def _allocate_IPs(self):
         """Allocate IP addresses on every interface in every broadcast
-        domain"""
+        domain. The addresses of each node are then set all at once."""
+        batch = AddressBatch()
         if self.use_v4:
-            self._allocate_ipv4()
+            with self.tracer.span('allocate_ipv4'):
+                self._allocate_ipv4(batch=batch)
         if self.use_v6:
-            self._allocate_ipv6()
+            with self.tracer.span('allocate_ipv6'):
+                self._allocate_ipv6(batch=batch)
+        with self.tracer.span('apply_addresses'):
+            batch.apply()
 
-    def _allocate_ipv4(self):
+    def _allocate_ipv4(self, batch=None):
         log.info("*** Allocating IPv4 addresses\n")
         self._allocate_subnets(self._unallocated_ipbase,
                                self.broadcast_domains,
@@ -270,12 +475,9 @@ class IPNet(Mininet):
                 if len(list(intf.ips())) == 0:
                     ips = tuple(domain.next_ipv4()
                                 for _ in range(intf.interface_width[0]))
-                    intf.setIP(ips)
-                for ip in intf.ips():
-                    self._ip_allocs[ip.with_prefixlen] = intf.node
-                    self._ip_allocs[ip.ip.compressed] = intf.node
+                    intf.setIP(ips, batch=batch)
 
-    def _allocate_ipv6(self):
+    def _allocate_ipv6(self, batch=None):
         log.info("*** Allocating IPv6 addresses\n")
         self._allocate_subnets(self._unallocated_ip6base,
                                self.broadcast_domains,
@@ -291,10 +493,7 @@ class IPNet(Mininet):
                 if len(list(intf.ip6s(exclude_lls=True))) == 0:
                     ips = tuple(domain.next_ipv6()
                                 for _ in range(intf.interface_width[1]))
-                    intf.setIP6(ips)
-                for ip in intf.ip6s(exclude_lls=True):
-                    self._ip_allocs[ip.with_prefixlen] = intf.node
-                    self._ip_allocs[ip.ip.compressed] = intf.node
+                    intf.setIP6(ips, batch=batch)
 
     @staticmethod
     def _allocate_subnets(subnets, domains, domainlen='len_v4',
@@ -302,17 +501,14 @@ class IPNet(Mininet):
                           max_prefixlen=24, allocated_subnets=()):
         """Allocate subnets to broadcast domains.
 
-        We keep the subnets sorted as x < y wrt the available number of
-        addresses in the subnet so that the bigger domains
-        take the smallest subnets before subdividing them.
-        As the domains range from the biggest to the smallest, and the subnets
-        from the smallest to the biggest, the biggest domains will take the
-        first subnet that is able to contain it, and split it in several
-        subnets until it is restricted to its prefix.
-        The next domain then is necessarily of the same size (reuses on of the
-        split subnets) or smaller (uses a previsouly split subnet or splits a
-        bigger one). This avoids wasting of addresses (wrt. the specified
-        max_prefixlen) at the cost of a quadratic (?) behavior.
+        The domains are served from the biggest to the smallest, by a buddy
+        allocator (see PrefixAllocator) which always takes the smallest free
+        subnet that is able to contain a domain, and splits it until it is
+        restricted to the domain prefix. The next domain then is necessarily of
+        the same size (reuses one of the split subnets) or smaller (uses a
+        previously split subnet or splits a bigger one). This avoids wasting
+        of addresses (wrt. the specified max_prefixlen) while each allocation
+        is done in logarithmic time.
 
         :param subnets: a list of ip_network of available subnets. This list
                         will be modified to account for the new allocations.
@@ -326,101 +522,124 @@ class IPNet(Mininet):
         :param max_prefixlen: The maximal prefixlen that can be allocated,
                                 e.g. to not allocate /126 for IPv6 P2P links
         :param allocated_subnets: The subnets that are already allocated and
-                                  cannot be allocated to another domain
-        :return: iterator of (domain, subnet)"""
+                                  cannot be allocated to another domain"""
         _domainlen = methodcaller(domainlen)
         domains.sort(key=_domainlen, reverse=True)
-        _prefixlen = attrgetter('prefixlen')
-        subnets.sort(key=_prefixlen, reverse=True)
         ip_version = 4 if net_key == 'net' else 6
+        allocator = PrefixAllocator(subnets, reserved=allocated_subnets)
         for d in domains:
             if not d.use_ip_version(ip_version):
                 continue
-            if not subnets:
-                raise ValueError('No subnet left in the prefix space for all'
-                                 'broadcast domains.')
             plen = min(max_prefixlen, getattr(d, size_key))
-            if plen < subnets[-1].prefixlen:
-                raise ValueError('Could not find a subnet big enough for a '
-                                 'broadcast domain.')
             log.debug('Allocating prefix', plen, 'for interfaces',
                       d.interfaces)
-            # Try to find a suitable subnet in the list
-            for i, net in enumerate(subnets):
-                nets = []
-                # if the subnet is too big for the prefix, perform a left
-                # expansion (only expand one at a time to keep subnets as
-                # aggregated as possible).
-                while plen > net.prefixlen:
-                    # Get list of subnets and append to list of previous
-                    # expanded subnets as it is bigger wrt. prefixlen
-                    net, next_net = tuple(net.subnets(prefixlen_diff=1))
-                    # If not a subnet of an allocated subnet
-                    if len(list(filter(lambda y: next_net in y, allocated_subnets))) == 0:
-                        nets.append(next_net)
-                # Check if we have an appropriately-sized subnet
-                if plen == net.prefixlen:
-                    # If the network overlaps with an allocated subnet, we pass it
-                    if len(list(filter(lambda y: net in y or y in net, allocated_subnets))) == 0:
-                        # Register the allocation
-                        setattr(d, net_key, net)
-                    # Delete the expanded/used subnet
-                    del subnets[i]
-                    # Insert the created subnets if any
-                    subnets.extend(nets)
-                    # Sort the array again
-                    subnets.sort(key=_prefixlen, reverse=True)
-                    # Proceed to the next broadcast domain
-                    break
-                # Otherwise try the next network for the current domain
+            setattr(d, net_key, allocator.allocate(plen))
+        # Keep track of the remaining address space
+        subnets[:] = allocator.free_subnets()
 
     def _broadcast_domains(self):
-        """Build the broadcast domains for this topology"""
+        """Build the broadcast domains for this topology, in a single pass
+        over all links and L2 nodes.
+
+        The frames crossing a link are either untagged or tagged with a
+        VLAN id. L3 interfaces only belong to the domain of the untagged
+        frames of their link. VLAN-filtering switches (see
+        SwitchHub.vlanFiltering) have one domain per VLAN, while the other
+        L2 nodes bind all their interfaces in the same domain for each VLAN
+        id."""
+        filtering = set(s for s in self.switches
+                        if isinstance(s, SwitchHub) and s.vlanFiltering())
+        all_tags = set()
+        for s in filtering:
+            for i in s.ports():
+                all_tags.update(port_vlans(i)[1])
+
+        def domain_of(itf, tag):
+            """Return the domain element of the frames of an interface with
+            a given tag (None if untagged), or None if they are dropped"""
+            node = itf.node
+            if BroadcastDomain.is_domain_boundary(node):
+                return None if tag is not None else (itf, None)
+            if node in filtering:
+                access, tagged = port_vlans(itf)
+                if tag is None:
+                    return node, access
+                return (node, tag) if tag in tagged else None
+            return node, tag
+
+        domains = DisjointSet()
+        boundaries = []
+        for n in self.values():
+            if BroadcastDomain.is_domain_boundary(n):
+                boundaries.extend(realIntfList(n))
+        for link in self.links:
+            tags = set()
+            for i in (link.intf1, link.intf2):
+                if i.node in filtering:
+                    tags.update(port_vlans(i)[1])
+                elif not BroadcastDomain.is_domain_boundary(i.node):
+                    tags.update(all_tags)
+            for tag in [None] + sorted(tags):
+                d1, d2 = domain_of(link.intf1, tag), domain_of(link.intf2, tag)
+                if d1 is not None and d2 is not None:
+                    domains.union(d1, d2)
+        # Group the L3 interfaces by domain, in the order of discovery
+        groups = OrderedDict()
+        for i in boundaries:
+            groups.setdefault(domains.find((i, None)), []).append(i)
         domains = []
-        interfaces = {intf: False
-                      for n in self.values()
-                      if BroadcastDomain.is_domain_boundary(n)
-                      for intf in realIntfList(n)}
-        for intf, explored in interfaces.items():
-            # the interface already belongs to a broadcast domain
-            if explored:
-                continue
-            # create a new domain and explore the interface
-            bd = BroadcastDomain(intf)
-            # Mark all explored interfaces belonging to that domain
+        for itfs in groups.values():
+            bd = BroadcastDomain(itfs, explore=False)
             for i in bd:
-                interfaces[i] = True
                 i.broadcast_domain = bd
             domains.append(bd)
         return domains
 
-    def _ping_set(self, src, dst_dict, timeout, v4=True):
-        """Do the actual ping to the dict of {dst: dst_ip} from src
-
-           :param src: origin of the ping
-           :param dst_dict: destinations {dst: dst_ip} of the ping
-           :param timeout: the time to wait for a response, as string
-           :param v4: whether IPv4 or IPv6 is used
-           :param return: a tuple (lost packets, sent packets)"""
-        if len(dst_dict) == 0:
-            return 0, 0
-        lost = 0
-        packets = 0
-        opts = ''
-        if timeout:
-            opts = '-W %s' % timeout
-
-        log.output("%s --%s--> " % (src.name, "IPv4" if v4 else "IPv6"))
-        for dst, dst_ip in dst_dict.items():
-            result = src.cmd('%s -c1 %s %s' % ("ping" if v4 else PING6_CMD,
-                                               opts, dst_ip))
-            sent, received = self._parsePing(result)
-            lost += sent - received
-            packets += sent
-            log.output("%s " % dst.name if received else "X ")
-        log.output('\n')
-
-        return lost, packets
+    def reachability(self, hosts=None, timeout=None, use_v4=True,
+                     use_v6=True):
+        """Ping between all specified hosts, concurrently, and return the
+           results of each ping.
+           Pairs of hosts are tested in each allowed IP version in which
+           both have a global address (loopback excluded).
+
+           :param hosts: list of hosts or None if all must be pinged
+           :param timeout: time to wait for a response, as string
+           :param use_v4: whether IPv4 addresses can be used
+           :param use_v6: whether IPv6 addresses can be used
+           :return: a ReachabilityMatrix"""
+        return PingEngine(timeout=timeout).run(
+            self._ping_probes(hosts or self.hosts, use_v4, use_v6))
+
+    @staticmethod
+    def _ping_probes(hosts, use_v4, use_v6, incompatible_hosts=None):
+        """Return the list of (src, dst, dst_ip, version) to ping between
+           hosts
+
+           :param incompatible_hosts: a dict in which to register the pairs
+                                      of hosts without any common IP
+                                      version"""
+        if incompatible_hosts is None:
+            incompatible_hosts = {}
+        probes = []
+        for src in hosts:
+            src_ip, src_ip6 = address_pair(src, use_v4, use_v6)
+            probes6 = []
+            for dst in hosts:
+                if src != dst:
+                    dst_ip, dst_ip6 = address_pair(dst, src_ip is not None,
+                                                   src_ip6 is not None)
+                    if dst_ip is not None:
+                        probes.append((src, dst, dst_ip, 4))
+                    if dst_ip6 is not None:
+                        probes6.append((src, dst, dst_ip6, 6))
+                    if (use_v4 and dst_ip is None and
+                            use_v6 and dst_ip6 is None):
+                        node1 = src if src.name <= dst.name else dst
+                        node2 = src if node1 != src else dst
+                        incompatible_hosts.setdefault(node1.name, set())\
+                            .add(node2.name)
+            probes.extend(probes6)
+        return probes
 
     def ping(self, hosts=None, timeout=None, use_v4=True, use_v6=True):
         """Ping between all specified hosts.
@@ -430,6 +649,8 @@ class IPNet(Mininet):
            If use_v6 is true, pings over IPv6 are used between any pair of
            hosts having at least one non-link-local IPv6 address on one of
            their interfaces (loopback excluded).
+           All pings are sent concurrently, see reachability() to get the
+           result of each of them.
 
            :param hosts: list of hosts or None if all must be pinged
            :param timeout: time to wait for a response, as string
@@ -438,7 +659,6 @@ class IPNet(Mininet):
            :return: the packet loss percentage of IPv4 connectivity if
                     self.use_v4 is set the loss percentage of IPv6 connectivity
                     otherwise"""
-        packets = lost = 0
         if not hosts:
             hosts = self.hosts
         incompatible_hosts = {}
@@ -451,43 +671,27 @@ class IPNet(Mininet):
                    % ("IPv4" if use_v4 else "",
                       " and " if use_v4 and use_v6 else "",
                       "IPv6" if use_v6 else ""))
+        matrix = PingEngine(timeout=timeout).run(
+            self._ping_probes(hosts, use_v4, use_v6, incompatible_hosts))
         for src in hosts:
-            src_ip, src_ip6 = address_pair(src, use_v4, use_v6)
-            ping_dict = {}
-            ping6_dict = {}
-            for dst in hosts:
-                if src != dst:
-                    dst_ip, dst_ip6 = address_pair(dst, src_ip is not None,
-                                                   src_ip6 is not None)
-                    if dst_ip is not None:
-                        ping_dict[dst] = dst_ip
-                    if dst_ip6 is not None:
-                        ping6_dict[dst] = dst_ip6
-                    if (use_v4 and dst_ip is None and
-                            use_v6 and dst_ip6 is None):
-                        node1 = src if src.name <= dst.name else dst
-                        node2 = src if node1 != src else dst
-                        if node2.name not in incompatible_hosts.setdefault(
-                                node1.name, set()):
-                            incompatible_hosts[node1.name].add(node2.name)
-
-            result = self._ping_set(src, ping_dict, timeout, True)
-            lost += result[0]
-            packets += result[1]
-            result = self._ping_set(src, ping6_dict, timeout, False)
-            lost += result[0]
-            packets += result[1]
+            for version in (4, 6):
+                results = matrix.results_from(src, version)
+                if not results:
+                    continue
+                log.output("%s --IPv%d--> %s\n" % (
+                    src.name, version,
+                    "".join("%s " % r.dst.name if r.received else "X "
+                            for r in results)))
 
         for node1, incompatibilities in incompatible_hosts.items():
             for node2 in incompatibilities:
                 log.output("*** Warning: %s and %s have no global address "
                            "in the same IP version\n" % (node1, node2))
 
-        if packets > 0:
-            ploss = 100.0 * lost / packets
-            received = packets - lost
+        if matrix.sent > 0:
+            ploss = matrix.loss()
             log.output("*** Results: %i%% dropped (%d/%d received)\n" %
-                       (ploss, received, packets))
+                       (ploss, matrix.received, matrix.sent))
         else:
             ploss = 0
             log.output("*** Warning: No packets sent\n")
@@ -535,13 +739,17 @@ class BroadcastDomain(object):
     # FIXME Where do we put middleboxes in this model ?
     BOUNDARIES = (Host, Router)
 
-    def __init__(self, interfaces=None, *args, **kwargs):
+    def __init__(self, interfaces=None, explore=True, *args, **kwargs):
         """Initialize the broadcast domain and optionally explore a set of
         interfaces
 
-        :param interfaces: one Intf or a list of Intf"""
+        :param interfaces: one Intf or a list of Intf
+        :param explore: whether the neighbors of the interfaces should be
+                        explored, or if the given interfaces already are the
+                        complete domain"""
         super(BroadcastDomain, self).__init__(*args, **kwargs)
         self.interfaces = set()
+        self._invalidate()
         self.net = None
         self._allocated_v4 = 1  # We need to skip subnet address
         self.net6 = None
@@ -551,7 +759,10 @@ class BroadcastDomain(object):
         if interfaces:
             if not isinstance(interfaces, list):
                 interfaces = [interfaces]
-            self.explore(interfaces)
+            if explore:
+                self.explore(interfaces)
+            else:
+                self.interfaces.update(interfaces)
 
         # Retrieve pre-fixed subnets
         self.fixed_net4s = []
@@ -577,28 +788,50 @@ class BroadcastDomain(object):
         """Iterates over all interfaces in this broadcast domain"""
         return iter(self.interfaces)
 
+    def _invalidate(self):
+        """Reset the cached properties of this domain"""
+        self._len_v4 = self._len_v6 = self._routers = None
+        self._generation = None
+
+    def _check_addresses(self):
+        """Reset the cached address counts if an address of any interface
+        changed since they were computed"""
+        if self._generation != address_generation():
+            self._len_v4 = self._len_v6 = None
+
     def len_v4(self):
         """The number of IPv4 addresses in this broadcast domain"""
-        return sum(map(lambda x: x.interface_width[0]
-                       if x.ip else 0, self.interfaces))
+        self._check_addresses()
+        if self._len_v4 is None:
+            self._len_v4 = sum(x.interface_width[0] if x.ip else 0
+                               for x in self.interfaces)
+            # Loading the addresses for the first time changes the generation
+            self._generation = address_generation()
+        return self._len_v4
 
     def len_v6(self):
         """The number of IPv6 addresses in this broadcast domain"""
-        return sum(map(lambda x: x.interface_width[1]
-                       if len(list(x.ip6s(exclude_lls=True))) else 0, self.interfaces))
+        self._check_addresses()
+        if self._len_v6 is None:
+            self._len_v6 = sum(x.interface_width[1]
+                               if next(x.ip6s(exclude_lls=True), None)
+                               else 0 for x in self.interfaces)
+            self._generation = address_generation()
+        return self._len_v6
 
     def explore(self, itfs):
         """Explore a new list of interfaces and add them and their neightbors
         to this broadcast domain
 
         :param itf: a list of Intf"""
-        visited = []
+        self._invalidate()
+        visited = set()
         while itfs:
             # Explore one element
             i = itfs.pop()
             if i in visited:
                 continue
-            visited.append(i)
+            visited.add(i)
             if self.is_domain_boundary(i.node):
                 self.interfaces.add(i)
             # check its corresponding interface
@@ -629,35 +862,38 @@ class BroadcastDomain(object):
     @property
     def routers(self):
         """List all interfaces in this domain belonging to a L3 router"""
-        return [i for i in self.interfaces if L3Router.is_l3router_intf(i)]
+        if self._routers is None:
+            self._routers = [i for i in self.interfaces
+                             if L3Router.is_l3router_intf(i)]
+        return self._routers
 
     def next_ipv4(self):
         """Allocate and return the next available IPv4 address in this
         domain
 
         :return ip_interface:"""
+        if self.net is None:
+            raise ValueError('No associated IPv4 subnet')
         try:
-            addr = self.net[self._allocated_v4]
-            self._allocated_v4 += 1
-            return ip_interface(u'%s/%d' % (addr, self.net.prefixlen))
+            ip = interface_at(self.net, self._allocated_v4)
         except IndexError:
             raise ValueError('No more available IPv4 address')
-        except TypeError:
-            raise ValueError('No associated IPv4 subnet')
+        self._allocated_v4 += 1
+        return ip
 
     def next_ipv6(self):
         """Allocate and return the next available IPv6 address in this
         domain
 
         :return ip_interface:"""
+        if self.net6 is None:
+            raise ValueError('No associated IPv6 subnet')
         try:
-            addr = self.net6[self._allocated_v6]
-            self._allocated_v6 += 1
-            return ip_interface(u'%s/%d' % (addr, self.net6.prefixlen))
+            ip = interface_at(self.net6, self._allocated_v6)
         except IndexError:
             raise ValueError('No more available IPv6 address')
-        except TypeError:
-            raise ValueError('No associated IPv6 subnet')
+        self._allocated_v6 += 1
+        return ip
 
     def use_ip_version(self, ip_version):
         """ Checks whether it makes sense to allocate a subnet
@@ -256,3 +256,79 @@ class IntfDescription(RouterDescription):
 
     def __eq__(self, other):
         return self.node.__eq__(other)
+
+
+# The options of a link that are specific to each of its sides
+_SIDE_OPTIONS = ('node1', 'node2', 'port1', 'port2', 'params1', 'params2')
+
+
+def _side(opts, node):
+    """Return the port and the parameters of the interface of node on a link
+    of the topology"""
+    if opts['node1'] == node:
+        return opts['port1'], opts.get('params1', {})
+    return opts['port2'], opts.get('params2', {})
+
+
+def collapsible_switch(topo, switch):
+    """Return the two links of the topology through a switch if they can be
+    replaced by a direct link, None otherwise. This is the case if the
+    switch has no spanning tree, hub or VLAN behavior, and connects exactly
+    two distinct nodes that are not switches with links of the same kind.
+
+    :param topo: the topology
+    :param switch: the name of the switch"""
+    info = topo.nodeInfo(switch)
+    if info.get('stp') or info.get('hub') or 'cls' in info:
+        return None
+    links = [(nbr, opts) for nbr, entry in topo.g[switch].items()
+             for opts in entry.values()]
+    if len(links) != 2:
+        return None
+    (a, opts_a), (b, opts_b) = links
+    if a == b or topo.isSwitch(a) or topo.isSwitch(b):
+        return None
+    for opts in (opts_a, opts_b):
+        if any('vlan' in p or 'vlans' in p for p in
+               (opts, _side(opts, switch)[1])):
+            return None
+    shared_a, shared_b = [dict((k, v) for k, v in opts.items()
+                               if k not in _SIDE_OPTIONS)
+                          for opts in (opts_a, opts_b)]
+    # Link options such as delays would apply twice over the switch
+    if shared_a != shared_b:
+        return None
+    return (a, opts_a), (b, opts_b)
+
+
+def collapse_switches(topo):
+    """Replace the switches that only connect two nodes by a direct link
+    between these nodes, keeping the ports and the parameters of their
+    interfaces. This spares a bridge and a pair of interfaces per switch,
+    and keeps the same broadcast domains.
+
+    :param topo: the topology, modified in place
+    :return: the names of the removed switches"""
+    removed = []
+    for switch in topo.switches():
+        links = collapsible_switch(topo, switch)
+        if links is None:
+            continue
+        (a, opts_a), (b, opts_b) = links
+        port_a, params_a = _side(opts_a, a)
+        port_b, params_b = _side(opts_b, b)
+        opts = dict((k, v) for k, v in opts_a.items()
+                    if k not in _SIDE_OPTIONS)
+        for node, port in ((a, port_a), (b, port_b)):
+            del topo.g.edge[node][switch]
+            del topo.ports[node][port]
+        del topo.g.edge[switch]
+        del topo.g.node[switch]
+        topo.ports.pop(switch, None)
+        topo.ports[a][port_a] = (b, port_b)
+        topo.ports[b][port_b] = (a, port_a)
+        opts.update(node1=a, node2=b, port1=port_a, port2=port_b,
+                    params1=params_a, params2=params_b)
+        topo.g.add_edge(a, b, None, opts)
+        removed.append(switch)
+    return removed
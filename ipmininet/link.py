@@ -4,8 +4,11 @@ classes and a new TCIntf base."""
 from builtins import str
 from ipmininet import basestring
 
+from collections import OrderedDict
 from itertools import chain
 import subprocess
+import threading
+import weakref
 from ipaddress import ip_interface, IPv4Interface, IPv6Interface
 import functools
 
@@ -28,12 +31,39 @@ class IPIntf(_m.Intf):
         # Only one IP broadcast domain per interface, VLANs are supported
         # by aliasing interfaces.
         self.broadcast_domain = None
-        self.addresses = {4: [], 6: []}
+        self._addresses = {4: [], 6: []}
+        self._state = None
+        # There is nothing to read while the interface is being created
+        self._addresses_loaded = True
         self.ra_prefixes = kwargs.pop('ra', [])
         self.rdnss_list = kwargs.pop('rdnss', [])
         super(IPIntf, self).__init__(*args, **kwargs)
         self.isUp(setUp=True)
-        self._refresh_addresses()
+        # The addresses will be read on first use, from a dump of all the
+        # interfaces of the node
+        _invalidate_addresses(self.node)
+        self._addresses_loaded = False
+
+    @property
+    def addresses(self):
+        """The addresses of this interface, as a dict keyed by IP version"""
+        if not self._addresses_loaded:
+            self._load_addresses(cached=True)
+        return self._addresses
+
+    @addresses.setter
+    def addresses(self, addresses):
+        self._addresses = addresses
+        self._addresses_loaded = True
+        _addresses_changed()
+
+    @property
+    def state(self):
+        """Return the operational state of this interface (e.g., UP, DOWN),
+        as reported when its addresses were last read"""
+        if not self._addresses_loaded:
+            self._load_addresses(cached=True)
+        return self._state
 
     @property
     def igp_area(self):
@@ -128,7 +158,7 @@ class IPIntf(_m.Intf):
     def prefixLen6(self, prefixLen):
         self.setIP6(self.ip6, prefixLen=prefixLen)
 
-    def _set_ip(self, ip, prefixLen=None):
+    def _set_ip(self, ip, prefixLen=None, batch=None):
         """Set one or more IP addresses, possibly from different families.
         This will remove previously set addresses of the affected families.
 
@@ -136,13 +166,14 @@ class IPIntf(_m.Intf):
                     or an ip_interface like, or a sequence of both
         :param prefixLen: the prefix length to use for all cases where
                           the addresses is given as a string without a given
-                          prefix."""
+                          prefix.
+        :param batch: an AddressBatch collecting the changes, which will then
+                      be applied together with the other changes on this
+                      node. If None, the changes are applied right away."""
         if not ip:
             return
         setv4 = setv6 = False
-        # Make sure we have an up-to-date view of our addresses
-        self._refresh_addresses()
-        cmds = []
+        addrs = []
         # We want to iterate over the new ip sets
         if not is_container(ip):
             ip = (ip,)
@@ -155,10 +186,7 @@ class IPIntf(_m.Intf):
                 else:
                     # no prefixLen defaults to full /128 or /32
                     addr = ip_interface(str(addr))
-
-            # Prepare assignment commands
-            cmds.append('ip address add dev %s %s'
-                        % (self.name, addr.with_prefixlen))
+            addrs.append(addr)
             # Record assignment family
             if addr.version == 4:
                 setv4 = True
@@ -170,12 +198,27 @@ class IPIntf(_m.Intf):
             cleanup.append(self.ips())
         if setv6:
             cleanup.append(self.ip6s(exclude_lls=True))
-        for ip in chain.from_iterable(cleanup):
-            self._del_ip(ip)
+        cmds = ['address del dev %s %s' % (self.name, old.with_prefixlen)
+                for old in chain.from_iterable(cleanup)]
         # Assign IP
-        rval = [self.cmd(cmd) for cmd in cmds]
-        self._refresh_addresses()
-        return rval.pop() if rval and len(rval) == 1 else rval
+        cmds.extend('address add dev %s %s' % (self.name, addr.with_prefixlen)
+                    for addr in addrs)
+        # Update our view of the addresses with the expected result
+        if setv4:
+            self.addresses[4] = sorted((a for a in addrs if a.version == 4),
+                                       key=OrderedAddress, reverse=True)
+        if setv6:
+            self.addresses[6] = sorted(chain((a for a in self.addresses[6]
+                                              if a.is_link_local),
+                                             (a for a in addrs
+                                              if a.version == 6)),
+                                       key=OrderedAddress, reverse=True)
+        _invalidate_addresses(self.node)
+        _addresses_changed()
+        if batch is not None:
+            batch.add(self.node, *cmds)
+            return None
+        return _ip_batch(self.node, cmds)
 
     def _del_ip(self, ip):
         """Remove an assigned IP fom this interface.
@@ -186,10 +229,33 @@ class IPIntf(_m.Intf):
 
     setIP = setIP6 = _set_ip
 
+    def setMAC(self, macstr):
+        _invalidate_addresses(self.node)
+        return super(IPIntf, self).setMAC(macstr)
+
+    def _load_addresses(self, cached=False):
+        """Read the addresses of this interface
+
+        :param cached: whether the last dump of the node addresses can be
+                       used"""
+        known = (self._addresses[4], self._addresses[6])
+        self.mac, self._addresses[4], self._addresses[6], self._state = \
+            _link_state_of(self.name, self.node, cached=cached)
+        self._addresses_loaded = True
+        if known != (self._addresses[4], self._addresses[6]):
+            _addresses_changed()
+
     def _refresh_addresses(self):
         """Request and parse the addresses of this interface"""
-        self.mac, self.addresses[4], self.addresses[6] = _addresses_of(
-                                                               self.name, self)
+        self._load_addresses()
+
+    def invalidate_addresses(self):
+        """Mark the known addresses of this interface as outdated, e.g., as
+        they were changed outside of ipmininet. They will be read again on
+        next use."""
+        _invalidate_addresses(self.node)
+        self._addresses_loaded = False
+        _addresses_changed()
 
     def updateIP(self):
         self._refresh_addresses()
@@ -208,22 +274,177 @@ class IPIntf(_m.Intf):
         return self.ip, self.mac
 
 
-def _addresses_of(devname, node=None):
-    """Return the addresses of a named interface"""
-    cmdline = ['ip', 'address', 'show', 'dev', devname]
+class AddressBatch(object):
+    """This class collects the address changes to perform on the interfaces
+    of one or more nodes, and then applies them with a single `ip -batch`
+    call per node."""
+
+    def __init__(self):
+        self._cmds = OrderedDict()  # node -> [ip commands]
+
+    def __len__(self):
+        return sum(len(cmds) for cmds in self._cmds.values())
+
+    def add(self, node, *cmds):
+        """Register ip commands to run on a node
+
+        :param node: the node, or None for the root namespace
+        :param cmds: ip commands, without the leading 'ip'"""
+        if cmds:
+            self._cmds.setdefault(node, []).extend(cmds)
+
+    def apply(self):
+        """Apply all the registered changes, and clear this batch
+
+        :return: dict node -> output of ip"""
+        out = OrderedDict()
+        for node, cmds in self._cmds.items():
+            out[node] = _ip_batch(node, cmds)
+            _invalidate_addresses(node)
+        self._cmds.clear()
+        return out
+
+
+def _ip_batch(node, cmds):
+    """Run a sequence of ip commands in a single process
+
+    :param node: the node in which the commands are run, or None for the
+                 root namespace
+    :param cmds: ip commands, without the leading 'ip'
+    :return: the output of ip"""
+    if not cmds:
+        return ''
+    cmdline = ['ip', '-force', '-batch', '-']
+    kwargs = {'stdin': subprocess.PIPE, 'stdout': subprocess.PIPE,
+              'stderr': subprocess.STDOUT}
+    try:
+        p = (node.popen(cmdline, **kwargs) if node is not None
+             else subprocess.Popen(cmdline, **kwargs))
+        out, _ = p.communicate(('\n'.join(cmds) + '\n').encode('utf-8'))
+    except OSError:
+        log.error('Failed to run ip -batch!')
+        return ''
+    out = out.decode('utf-8')
+    if p.returncode:
+        log.error('Some address changes failed on', getattr(node, 'name', ''),
+                  ':\n', out)
+    return out
+
+
+# node -> {devname: (mac, [ipv4], [ipv6], state)}, for the last address dump
+# of every node
+_ADDRESS_DUMPS = weakref.WeakKeyDictionary()
+
+
+# Incremented every time the known addresses of an interface might have
+# changed
+_ADDRESS_GENERATION = 0
+
+
+def _addresses_changed():
+    global _ADDRESS_GENERATION
+    _ADDRESS_GENERATION += 1
+
+
+def address_generation():
+    """Return a counter that is incremented every time the known addresses
+    of any interface change, e.g., to know when indexes of these addresses
+    are outdated"""
+    return _ADDRESS_GENERATION
+
+
+def _invalidate_addresses(node):
+    """Discard the last address dump of a node, e.g., as its addresses
+    have been changed"""
+    if node is not None:
+        _ADDRESS_DUMPS.pop(node, None)
+
+
+def _node_addresses(node=None, cached=False):
+    """Return the addresses of all interfaces of a node, as obtained through
+    a single ip call
+
+    :param node: the node, or None for the root namespace
+    :param cached: whether the last dump for this node can be returned
+    :return: {devname: (mac, [ipv4], [ipv6], state)}"""
+    if cached and node is not None:
+        try:
+            return _ADDRESS_DUMPS[node]
+        except KeyError:
+            pass
+    cmdline = ['ip', 'address', 'show']
+    # Use a separate process rather than the shell of the node, such that
+    # the addresses of a node can be read while its shell is busy, e.g.,
+    # from another thread
     try:
-        addrstr = node.cmd(*cmdline)
-    except AttributeError:
-        addrstr = subprocess.check_output(cmdline).decode("utf-8")
-    except (OSError, subprocess.CalledProcessError):
+        p = (node.popen(cmdline, stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE) if node is not None
+             else subprocess.Popen(cmdline, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE))
+        addrstr = p.communicate()[0].decode("utf-8")
+    except OSError:
         addrstr = None
     if not addrstr:
         log.warning('Failed to run ip address!')
-        return None, (), ()
-    mac, v4, v6 = _parse_addresses(addrstr)
-    return (mac,
-            sorted(v4, key=OrderedAddress, reverse=True),
-            sorted(v6, key=OrderedAddress, reverse=True))
+        return {}
+    dump = {name: (mac,
+                   sorted(v4, key=OrderedAddress, reverse=True),
+                   sorted(v6, key=OrderedAddress, reverse=True),
+                   state)
+            for name, (mac, v4, v6, state)
+            in _parse_address_dump(addrstr).items()}
+    if node is not None:
+        _ADDRESS_DUMPS[node] = dump
+    return dump
+
+
+def _link_state_of(devname, node=None, cached=False):
+    """Return the addresses and the state of a named interface
+
+    :return: mac, [ipv4], [ipv6], state"""
+    dump = _node_addresses(node, cached=cached)
+    if cached and devname not in dump:
+        # The interface was created after the last dump
+        dump = _node_addresses(node)
+    try:
+        mac, v4, v6, state = dump[devname]
+    except KeyError:
+        log.warning('Failed to find the addresses of', devname, '!')
+        return None, [], [], None
+    return mac, list(v4), list(v6), state
+
+
+def _addresses_of(devname, node=None):
+    """Return the addresses of a named interface"""
+    mac, v4, v6, _ = _link_state_of(devname, node)
+    return mac, v4, v6
+
+
+def _parse_address_dump(out):
+    """Parse the output of an ip address command covering several interfaces
+    :return: {devname: (mac, [ipv4], [ipv6], state)}"""
+    # 2: r1-eth0@if3: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 ... state UP
+    #    link/ether 32:5a:1e:74:0b:c2 brd ff:ff:ff:ff:ff:ff link-netnsid 0
+    #    inet 10.0.0.1/24 scope global r1-eth0
+    #    ...
+    devices = OrderedDict()
+    lines = []
+    for line in out.strip(' \n\t\r').split('\n'):
+        parts = line.strip(' \n\t\r').split(' ')
+        if parts[0].endswith(':') and parts[0][:-1].isdigit():
+            # New device
+            lines = []
+            try:
+                name = parts[1].rstrip(':').split('@')[0]
+            except IndexError:
+                log.error('Malformed ip-address line:', line)
+                continue
+            state = (parts[parts.index('state') + 1]
+                     if 'state' in parts[:-1] else None)
+            devices[name] = (lines, state)
+        lines.append(line)
+    return OrderedDict((name, _parse_addresses('\n'.join(lines)) + (state,))
+                       for name, (lines, state) in devices.items())
 
 
 def _parse_addresses(out):
@@ -253,6 +474,68 @@ def _parse_addresses(out):
     return mac, v4, v6
 
 
+class AddressWatcher(object):
+    """This class watches the address and link changes made by the kernel in
+    a set of nodes (e.g., SLAAC addresses), through one `ip monitor` process
+    per node, and invalidates the known addresses of the affected
+    interfaces."""
+
+    def __init__(self, nodes=()):
+        """:param nodes: the nodes to watch"""
+        self.nodes = list(nodes)
+        self._processes = []
+        self._threads = []
+
+    def start(self):
+        """Start watching the nodes"""
+        for node in self.nodes:
+            p = node.popen(['ip', '-o', 'monitor', 'address', 'link'],
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            t = threading.Thread(target=self._watch, args=(node, p))
+            t.daemon = True
+            t.start()
+            self._processes.append(p)
+            self._threads.append(t)
+
+    def stop(self):
+        """Stop watching the nodes"""
+        for p in self._processes:
+            try:
+                p.terminate()
+                p.wait()
+            except OSError:
+                pass  # Process is already dead
+        for t in self._threads:
+            t.join()
+        self._processes = []
+        self._threads = []
+
+    @staticmethod
+    def _watch(node, p):
+        """Invalidate the addresses of the interfaces reported by ip monitor"""
+        for line in iter(p.stdout.readline, b''):
+            name = _monitored_device(line.decode('utf-8'))
+            if name is None:
+                continue
+            _invalidate_addresses(node)
+            itf = node.nameToIntf.get(name)
+            if isinstance(itf, IPIntf):
+                itf.invalidate_addresses()
+
+
+def _monitored_device(line):
+    """Return the name of the interface concerned by an ip monitor line
+
+    :return: the interface name or None"""
+    # [ADDR]Deleted 3: r1-eth0    inet 10.0.0.1/24 scope global r1-eth0 ...
+    # 3: r1-eth0@if2: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 ...
+    parts = line.replace(']', '] ').split()
+    for i, part in enumerate(parts[:-1]):
+        if part.endswith(':') and part[:-1].isdigit():
+            return parts[i + 1].rstrip(':').split('@')[0]
+    return None
+
+
 class IPLink(_m.Link):
     """A Link class that defaults to IPIntf"""
     def __init__(self, node1, node2, intf=IPIntf, *args, **kwargs):
@@ -0,0 +1,173 @@
+"""This module defines an engine testing the reachability between nodes,
+by sending pings from many sources towards many destinations concurrently,
+and collecting the results in a matrix"""
+import re
+from collections import OrderedDict, deque
+from subprocess import PIPE, STDOUT
+
+from mininet.net import Mininet
+
+from .utils import has_cmd
+
+# ping6 is not provided by default on newer systems
+PING6_CMD = 'ping6' if has_cmd('ping6') else 'ping -6'
+
+_RTT = re.compile(r'(?:rtt|round-trip) min/avg/max/(?:mdev|stddev) = '
+                  r'[\d.]+/([\d.]+)/')
+
+
+class PingResult(object):
+    """The outcome of the pings sent from a source to a destination"""
+
+    def __init__(self, src, dst, dst_ip, version, sent=0, received=0,
+                 rtt=None):
+        """:param src: the source node
+        :param dst: the destination node
+        :param dst_ip: the destination address
+        :param version: the IP version used
+        :param sent: the number of packets sent
+        :param received: the number of packets received
+        :param rtt: the average round-trip time in ms, None if unknown"""
+        self.src = src
+        self.dst = dst
+        self.dst_ip = dst_ip
+        self.version = version
+        self.sent = sent
+        self.received = received
+        self.rtt = rtt
+
+    @property
+    def lost(self):
+        return self.sent - self.received
+
+    def __repr__(self):
+        return '%s(%s -> %s [IPv%d], %d/%d received, rtt=%s)' % (
+            self.__class__.__name__, self.src.name, self.dst.name,
+            self.version, self.received, self.sent, self.rtt)
+
+
+class ReachabilityMatrix(object):
+    """The results of the pings between a set of sources and destinations,
+    keyed by source name, destination name and IP version"""
+
+    def __init__(self):
+        self._results = OrderedDict()
+        # The results by source node and IP version, in insertion order
+        self._by_source = {}
+
+    def add(self, result):
+        """Register a PingResult"""
+        key = (result.src.name, result.dst.name, result.version)
+        bucket = self._by_source.setdefault((result.src, result.version), [])
+        previous = self._results.get(key)
+        if previous is not None and previous in bucket:
+            bucket[bucket.index(previous)] = result
+        else:
+            bucket.append(result)
+        self._results[key] = result
+
+    def __getitem__(self, key):
+        """:param key: a tuple (source name, destination name, IP version)
+        :return: the PingResult"""
+        return self._results[key]
+
+    def __iter__(self):
+        return iter(self._results.values())
+
+    def __len__(self):
+        return len(self._results)
+
+    def results_from(self, src, version):
+        """Return the results of the pings sent by a source node in a
+        given IP version"""
+        return list(self._by_source.get((src, version), ()))
+
+    @property
+    def sent(self):
+        return sum(r.sent for r in self)
+
+    @property
+    def received(self):
+        return sum(r.received for r in self)
+
+    @property
+    def lost(self):
+        return self.sent - self.received
+
+    def loss(self):
+        """Return the packet loss percentage, 0 if no packet was sent"""
+        sent = self.sent
+        return 100.0 * self.lost / sent if sent else 0
+
+
+class PingEngine(object):
+    """Sends pings from many sources concurrently.
+
+    Each source runs a single prober in its namespace, a shell pinging all
+    its destinations in parallel. Up to max_probers sources are probed at
+    the same time."""
+
+    def __init__(self, count=1, timeout=None, max_probers=32):
+        """:param count: the number of packets to send to each destination
+        :param timeout: the time to wait for a response, as string
+        :param max_probers: the maximum number of sources pinging at the
+                            same time"""
+        self.count = count
+        self.timeout = timeout
+        self.max_probers = max(1, max_probers)
+
+    def _ping_cmd(self, result):
+        return '%s -c%d %s %s' % ('ping' if result.version == 4
+                                  else PING6_CMD, self.count,
+                                  '-W %s' % self.timeout if self.timeout
+                                  else '', result.dst_ip)
+
+    def _launch(self, src, results):
+        """Start the prober of a source node"""
+        # Each output line is tagged with the index of its destination, to
+        # demultiplex the outputs of the concurrent pings
+        script = ' '.join('(%s 2>&1 | sed "s/^/%d /") &'
+                          % (self._ping_cmd(r), i)
+                          for i, r in enumerate(results))
+        return src.popen(['sh', '-c', script + ' wait'],
+                         stdout=PIPE, stderr=STDOUT)
+
+    @staticmethod
+    def _collect(results, prober):
+        """Wait for the end of a prober and parse its output"""
+        out = prober.communicate()[0]
+        if not isinstance(out, str):
+            out = out.decode('utf-8', 'replace')
+        outputs = [[] for _ in results]
+        for line in out.splitlines():
+            idx, _, line = line.partition(' ')
+            try:
+                outputs[int(idx)].append(line)
+            except (ValueError, IndexError):
+                continue
+        for result, lines in zip(results, outputs):
+            output = '\n'.join(lines)
+            result.sent, result.received = Mininet._parsePing(output)
+            match = _RTT.search(output)
+            result.rtt = float(match.group(1)) if match else None
+
+    def run(self, probes):
+        """Ping all destinations
+
+        :param probes: an iterable of (source node, destination node,
+                       destination address, IP version)
+        :return: a ReachabilityMatrix"""
+        matrix = ReachabilityMatrix()
+        by_src = OrderedDict()
+        for src, dst, dst_ip, version in probes:
+            result = PingResult(src, dst, dst_ip, version)
+            matrix.add(result)
+            by_src.setdefault(src, []).append(result)
+        running = deque()
+        for src, results in by_src.items():
+            if len(running) >= self.max_probers:
+                self._collect(*running.popleft())
+            running.append((results, self._launch(src, results)))
+        while running:
+            self._collect(*running.popleft())
+        return matrix
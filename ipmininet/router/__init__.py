@@ -1,6 +1,6 @@
 """This module defines a modular router that is able to support multiple
 routing daemons
 """
-from .__router import Router, ProcessHelper
+from .__router import Router, ProcessHelper, ConfigCheckError
 
-__all__ = ['Router', 'ProcessHelper']
+__all__ = ['Router', 'ProcessHelper', 'ConfigCheckError']
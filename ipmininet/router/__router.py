@@ -1,12 +1,24 @@
 """This modules defines a L3 router class, with a modulable config system."""
 from builtins import str
 
+import functools
+import os
 import sys
+import threading
 import time
+try:
+    from shlex import quote
+except ImportError:  # Python 2
+    from pipes import quote
 
 from ipmininet import DEBUG_FLAG
 from ipmininet.utils import L3Router
+from ipmininet.scheduler import Task, TaskGraph
+from ipmininet.teardown import TERMINATE_TIMEOUT, daemon_pids
 from .config import BasicRouterConfig
+from .config.cache import dry_run_cache
+from .config.readiness import readiness_monitor
+from .supervisor import Supervisor
 
 import mininet.clean
 from mininet.node import Node
@@ -14,17 +26,55 @@ from mininet.log import lg
 import shlex
 
 
+class ConfigCheckError(ValueError):
+    """Raised when the configuration check of a daemon fails"""
+
+
+def sysctl_script(values, root='/proc/sys'):
+    """Return a shell script printing the current value of a set of sysctls
+    as key=value lines, and setting the new values that differ
+
+    :param values: an iterable of (key, value)
+    :param root: the directory of the sysctls"""
+    script = []
+    for key, val in values:
+        path = quote(os.path.join(root, key if '/' in key
+                                  else key.replace('.', '/')))
+        val = quote(str(val))
+        script.append('if v=$(cat {path} 2>/dev/null); then '
+                      'printf "%s=%s\\n" {key} "$v"; '
+                      '[ "$v" = {val} ] || echo {val} > {path}; '
+                      'else echo "No such sysctl: "{key} >&2; fi'
+                      .format(path=path, key=quote(key), val=val))
+    return '\n'.join(script)
+
+
+def parse_sysctl_output(out):
+    """Return the values printed by a sysctl_script(), by key"""
+    values = {}
+    for line in out.splitlines():
+        key, _, val = line.partition('=')
+        values[key] = val.strip(' \t\r')
+    return values
+
+
 class ProcessHelper(object):
     """This class holds processes that are part of a given family, e.g. routing
     daemons. This also provides the abstraction to execute a new process,
     currently in a mininet namespace, but could be extended to execute in
-    a different environment."""
+    a different environment.
+
+    The processes are supervised: their output is drained into bounded
+    buffers, and their exits are recorded (see status())."""
 
     def __init__(self, node, *args, **kwargs):
         """:param node: The object to use to create subprocesses."""
         self.node = node
         self._pid_gen = 0
         self._processes = {}
+        self._supervisor = Supervisor(node)
+        # Processes can be started from several threads at once
+        self._lock = threading.Lock()
         super(ProcessHelper, self).__init__(*args, **kwargs)
 
     def call(self, *args, **kwargs):
@@ -39,10 +89,19 @@ class ProcessHelper(object):
 
         :param args: the command + arguments
         :param kwargs: key-val arguments, as used in subprocess.Popen
+        :param name: the name of the process in the logs and status()
+        :param restart: the RestartPolicy of the process, None to never
+                        restart it when it exits
+        :param output_file: the path of a file also receiving its output
         :return: a process index in this family"""
-        self._pid_gen += 1
-        self._processes[self._pid_gen] = self.node.popen(*args, **kwargs)
-        return self._pid_gen
+        supervision = {k: kwargs.pop(k) for k in ('name', 'restart',
+                                                  'output_file')
+                       if k in kwargs}
+        record = self._supervisor.spawn(args, kwargs, **supervision)
+        with self._lock:
+            self._pid_gen += 1
+            self._processes[self._pid_gen] = record
+            return self._pid_gen
 
     def pexec(self, *args, **kw):
         """Call a command, wait for it to terminate and save stdout, stderr and
@@ -53,15 +112,34 @@ class ProcessHelper(object):
         """Return a given process handle in this family
 
         :param pid: a process index, as return by popen"""
-        return self._processes[pid]
+        return self._processes[pid].process
 
-    def terminate(self):
-        """Terminate all processes in this family"""
-        for p in self._processes.values():
-            try:
-                p.terminate()
-            except OSError:
-                pass  # Process is already dead
+    def output(self, pid):
+        """Return the last bytes written by a process on stdout and stderr
+
+        :param pid: a process index, as return by popen"""
+        return self._processes[pid].output.getvalue()
+
+    def status(self, pid=None):
+        """Return the state of a process, i.e., a dict with its name, pid,
+        whether it is running, its uptime, restart count and exit codes
+
+        :param pid: a process index, as return by popen, or None to get the
+                    status of all processes keyed by index"""
+        if pid is not None:
+            return self._processes[pid].status()
+        return {i: r.status() for i, r in self._processes.items()}
+
+    def terminate(self, timeout=TERMINATE_TIMEOUT, deadline=None, pids=()):
+        """Terminate all processes in this family, and kill the ones that are
+        still running after a timeout
+
+        :param timeout: the time given to the processes to exit, in seconds
+        :param deadline: the time at which the remaining processes are
+                         killed, overrides timeout
+        :param pids: other processes to terminate together"""
+        self._supervisor.terminate(timeout=timeout, deadline=deadline,
+                                   pids=pids)
 
 
 class Router(Node, L3Router):
@@ -92,6 +170,7 @@ class Router(Node, L3Router):
         self.password = password
         self.cwd = cwd
         self._old_sysctl = {}
+        self._daemon_pids = {}  # daemon name -> process index
         try:
             self.config = config[0](self, **config[1])
         except (TypeError, IndexError):
@@ -100,55 +179,157 @@ class Router(Node, L3Router):
 
     def start(self):
         """Start the router: Configure the daemons, set the relevant sysctls,
-        and fire up all needed processes"""
-        self.cmd('ip', 'link', 'set', 'dev', 'lo', 'up')
-        # Build the config
-        self.config.build()
-        # Check them
-        err_code = False
-        for d in self.config.daemons:
-            out, err, code = self._processes.pexec(shlex.split(d.dry_run))
-            err_code = err_code or code
-            if code:
-                lg.error(d.NAME, 'configuration check failed ['
-                         'rcode:', str(code), ']\n'
-                         'stdout:', str(out), '\n'
-                         'stderr:', str(err))
-        if err_code:
-            lg.error('Config checks failed, aborting!')
+        and fire up all needed processes. If the configuration check of a
+        daemon fails, everything is cleaned up and the program exits."""
+        try:
+            TaskGraph(self.start_tasks()).run(max_workers=1)
+        except ConfigCheckError as e:
+            lg.error('%s, aborting!\n' % e)
             mininet.clean.cleanup()
             sys.exit(1)
-        # Set relevant sysctls
-        for opt, val in self.config.sysctl:
-            self._old_sysctl[opt] = self._set_sysctl(opt, val)
-        # Fire up all daemons
+
+    def start_tasks(self):
+        """Return the tasks starting this router, such that they can be
+        scheduled with the ones of other nodes. Daemons are started by
+        increasing priority, and after their dependencies.
+
+        :return: a list of Task, whose names are prefixed by the router
+                 name"""
+        name = self.name + ':%s'
+        tasks = [Task(name % 'lo', functools.partial(
+                     self.cmd, 'ip', 'link', 'set', 'dev', 'lo', 'up')),
+                 Task(name % 'config', self._build_config, [name % 'lo'])]
+        # The daemons are only known once the config has been built
+        self.config.register_dependencies()
+        failed = []
+        checks = [name % ('check-' + d.NAME) for d in self.config.daemons]
+        tasks.extend(Task(check, functools.partial(self._check_daemon, d,
+                                                   failed),
+                          [name % 'config'])
+                     for check, d in zip(checks, self.config.daemons))
+        tasks.append(Task(name % 'sysctl', functools.partial(
+            self._apply_sysctls, failed), checks))
+        previous_prio = []
+        prio = None
         for d in self.config.daemons:
-            self._processes.popen(shlex.split(d.startup_line))
-            # Busy-wait if the daemon needs some time before being started
-            while not d.has_started():
-                time.sleep(.001)
-
-    def terminate(self):
-        """Stops this router and sets back all sysctls to their old values"""
-        self._processes.terminate()
+            if d.PRIO != prio:
+                # Daemons with the same priority can start concurrently
+                deps = [name % 'sysctl'] + [name % ('start-' + x.NAME)
+                                            for x in previous_prio
+                                            if x.PRIO == prio]
+                prio = d.PRIO
+            tasks.append(Task(name % ('start-' + d.NAME),
+                              functools.partial(self._start_daemon, d),
+                              deps + [name % ('start-' + c.NAME)
+                                      for c in d.DEPENDS]))
+            previous_prio.append(d)
+        return tasks
+
+    def _build_config(self):
+        """Build the configuration files, unless they were already rendered
+        for the whole network"""
+        if not self.config.built:
+            self.config.build()
+
+    def _check_daemon(self, d, failed):
+        """Check the configuration of a daemon
+
+        :param failed: the list in which the daemon is added if the check
+                       fails"""
+        key = dry_run_cache.key(d)
+        if dry_run_cache.is_valid(key):
+            return  # This file was already validated by the same binary
+        out, err, code = self._processes.pexec(shlex.split(d.dry_run))
+        if code:
+            lg.error(d.NAME, 'configuration check failed ['
+                     'rcode:', str(code), ']\n'
+                     'stdout:', str(out), '\n'
+                     'stderr:', str(err))
+            failed.append(d)
+        else:
+            dry_run_cache.set_valid(key)
+
+    def _apply_sysctls(self, failed):
+        """Abort if a configuration check failed, otherwise set the
+        relevant sysctls
+
+        :raise ConfigCheckError: if a configuration check failed"""
+        if failed:
+            raise ConfigCheckError('Config checks failed [%s]'
+                                   % ', '.join(d.NAME for d in failed))
+        for opt, val in self._set_sysctls(self.config.sysctl).items():
+            self._old_sysctl.setdefault(opt, val)
+
+    def _start_daemon(self, d):
+        """Start a daemon and wait until it is ready to serve, such that the
+        daemons depending on it can be started"""
+        pid = self._processes.popen(shlex.split(d.startup_line),
+                                    name=d.NAME, restart=d.RESTART)
+        self._daemon_pids[d.NAME] = pid
+        probes = d.readiness_probes()
+        if not probes:
+            return
+        readiness = readiness_monitor.wait_ready(
+            '%s:%s' % (self.name, d.NAME), probes,
+            process=self._processes.get_process(pid),
+            timeout=d.STARTUP_TIMEOUT)
+        if readiness.error is not None:
+            lg.error('Daemon', d.NAME, 'of', self.name, 'failed to start:',
+                     readiness.error, '\n')
+            lg.error('Last output of', d.NAME, ':\n',
+                     self._processes.output(pid).decode('utf-8', 'replace'),
+                     '\n')
+            raise ValueError('Cannot start a daemon [%s: %s]: %s'
+                             % (self.name, d.NAME, readiness.error))
+
+    def daemon_status(self):
+        """Return the state of the daemons of this router, keyed by daemon
+        name, see ProcessHelper.status()"""
+        return {name: self._processes.status(pid)
+                for name, pid in self._daemon_pids.items()}
+
+    def daemon_output(self, name):
+        """Return the last output of a daemon, as bytes
+
+        :param name: the name of the daemon"""
+        return self._processes.output(self._daemon_pids[name])
+
+    def terminate(self, deadline=None):
+        """Stops this router and sets back all sysctls to their old values
+
+        :param deadline: the time at which the daemons still running are
+                         killed, in TERMINATE_TIMEOUT seconds if None"""
+        if deadline is None:
+            deadline = time.time() + TERMINATE_TIMEOUT
+        # Daemons running in the background are only known by their pid file
+        background = daemon_pids({f: d.NAME for d in self.config.daemons
+                                  for f in d.pid_files()})
+        self._processes.terminate(deadline=deadline, pids=background)
+        self._daemon_pids = {}
         if not DEBUG_FLAG:
             self.config.cleanup()
-        for opt, val in self._old_sysctl.items():
-            self._set_sysctl(opt, val)
+        self._set_sysctls(self._old_sysctl.items())
+        self._old_sysctl = {}
         super(Router, self).terminate()
 
     def _set_sysctl(self, key, val):
         """Change a sysctl value, and return the previous set value"""
-        val = str(val)
-        try:
-            v = self._processes.call('sysctl', key)\
-                    .split('=')[1]\
-                    .strip(' \n\t\r')
-        except IndexError:
-            v = None
-        if v != val:
-            self._processes.call('sysctl', '-w', '%s=%s' % (key, val))
-        return v
+        return self._set_sysctls([(key, val)]).get(key)
+
+    def _set_sysctls(self, values):
+        """Change a set of sysctls in a single pass through /proc/sys in the
+        namespace of the router, writing only the values that differ
+
+        :param values: an iterable of (key, value)
+        :return: the previous values of the sysctls that exist, by key"""
+        script = sysctl_script(values)
+        if not script:
+            return {}
+        out, err, _ = self._processes.pexec(['sh', '-c', script])
+        if err:
+            lg.warning('Failed to set sysctls on %s: %s\n'
+                       % (self.name, err.strip()))
+        return parse_sysctl_output(out)
 
     def get(self, key, val=None):
         """Check for a given key in the router parameters"""
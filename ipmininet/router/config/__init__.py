@@ -1,21 +1,52 @@
 """This module holds the configuration generators for routing daemons
-that can be used in a router."""
+that can be used in a router.
+
+The daemon modules are only imported when one of their names is accessed,
+such that importing this package remains cheap."""
+import importlib
+import sys
+
 from .base import BasicRouterConfig, RouterConfig
-from .zebra import Zebra
-from .staticd import STATIC, StaticRoute
-from .ospf import OSPF, OSPFArea
-from .ospf6 import OSPF6
-from .bgp import BGP, AS, iBGPFullMesh, bgp_peering, bgp_fullmesh, ebgp_session
-from .radvd import RADVD, AdvPrefix, AdvRDNSS, AdvConnectedPrefix
-from .iptables import IPTables, IP6Tables
-from .sshd import SSHd
-from .pimd import PIMD
-from .ripng import RIPng
-from .openrd import OpenrDaemon
-from .openr import Openr, OpenrDomain
+
+# The module defining each lazily imported name
+_LAZY = {'Zebra': 'zebra',
+         'STATIC': 'staticd', 'StaticRoute': 'staticd',
+         'OSPF': 'ospf', 'OSPFArea': 'ospf',
+         'OSPF6': 'ospf6',
+         'BGP': 'bgp', 'AS': 'bgp', 'iBGPFullMesh': 'bgp',
+         'bgp_peering': 'bgp', 'bgp_fullmesh': 'bgp', 'ebgp_session': 'bgp',
+         'RADVD': 'radvd', 'AdvPrefix': 'radvd', 'AdvRDNSS': 'radvd',
+         'AdvConnectedPrefix': 'radvd',
+         'IPTables': 'iptables', 'IP6Tables': 'iptables',
+         'SSHd': 'sshd',
+         'PIMD': 'pimd',
+         'RIPng': 'ripng',
+         'OpenrDaemon': 'openrd',
+         'Openr': 'openr', 'OpenrDomain': 'openr'}
 
 __all__ = ['BasicRouterConfig', 'Zebra', 'OSPF', 'OSPF6', 'OSPFArea', 'BGP',
            'AS', 'iBGPFullMesh', 'bgp_peering', 'RouterConfig', 'bgp_fullmesh',
            'ebgp_session', 'IPTables', 'IP6Tables', 'SSHd', 'RADVD',
            'AdvPrefix', 'AdvConnectedPrefix', 'AdvRDNSS', 'PIMD', 'RIPng',
            'STATIC', 'StaticRoute', 'OpenrDaemon', 'Openr', 'OpenrDomain']
+
+
+def __getattr__(name):
+    try:
+        module = _LAZY[name]
+    except KeyError:
+        raise AttributeError('module %s has no attribute %s'
+                             % (__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+
+if sys.version_info < (3, 7):
+    # Module attributes cannot be computed lazily
+    for _name in _LAZY:
+        __getattr__(_name)
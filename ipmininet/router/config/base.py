@@ -7,22 +7,21 @@ from ipmininet import basestring
 
 import os
 import abc
-from contextlib import closing
 from operator import attrgetter
 from ipaddress import ip_address
 
-from .utils import ConfigDict, template_lookup, ip_statement
+from .utils import ConfigDict, template_lookup, ip_statement, \
+    render_template, write_config
+from .readiness import CallableProbe, DEFAULT_TIMEOUT
 from ipmininet.utils import require_cmd, realIntfList
 from ipmininet.link import OrderedAddress
+from ipmininet.teardown import remove_files
 
 import mako.exceptions
 
 from mininet.log import lg as log
 
 
-last_routerid = ip_address(u'0.0.0.1')
-
-
 class RouterConfig(object):
     """This class manages a set of daemons, and generates the global
     configuration for a router"""
@@ -44,6 +43,7 @@ class RouterConfig(object):
         self._sysctl = {'net.ipv4.ip_forward': 1,
                         'net.ipv6.conf.all.forwarding': 1}
         self.routerid = None
+        self.built = False  # Whether the configuration files are written
         if sysctl:
             self._sysctl.update(sysctl)
         super(RouterConfig, self).__init__(*args, **kwargs)
@@ -51,29 +51,45 @@ class RouterConfig(object):
     def build(self):
         """Build the configuration for each daemon, then write the
         configuration files"""
+        self.build_tree()
+        # Write their config, using the global ConfigDict to handle
+        # dependencies
+        for d in self._daemons.values():
+            d.render_file(self._cfg)
+        self.built = True
+
+    def build_tree(self):
+        """Build the configuration tree of each daemon, without writing
+        the configuration files
+
+        :return: the global ConfigDict of the node"""
+        self.built = False
         self._cfg.clear()
         self._cfg.password = self._node.password
         self._cfg.name = self._node.name
-        # Check that all daemons have their dependencies satisfied
-        for cls in list(self._daemons.values()):
-            for c in cls.DEPENDS:
-                if c.NAME not in self._daemons:
-                    self.register_daemon(c)
+        self.register_dependencies()
         # Set the router id
         self.routerid = self.compute_routerid()
         # Build their config
         for name, d in self._daemons.items():
             self._cfg[name] = d.build()
-        # Write their config, using the global ConfigDict to handle
-        # dependencies
-        for d in self._daemons.values():
-            cfg = d.render(self._cfg)
-            d.write(cfg)
+        return self._cfg
+
+    @property
+    def tree(self):
+        """The global ConfigDict of the node, as built by build_tree()"""
+        return self._cfg
 
     def cleanup(self):
-        """Cleanup all temporary files for the daemons"""
+        """Cleanup all temporary files for the daemons, in one sweep"""
+        self.built = False
+        files = []
         for d in self._daemons.values():
-            d.cleanup()
+            if d.CLEANUP_FILES_ONLY:
+                files.extend(d.release_files())
+            else:
+                d.cleanup()
+        remove_files(files)
 
     def register_daemon(self, cls, **daemon_opts):
         """Add a new daemon to this configuration
@@ -118,6 +134,14 @@ class RouterConfig(object):
                 raise ValueError('sysctl must be specified using `key=val` '
                                  'format. Ignoring %s' % value)
 
+    def register_dependencies(self):
+        """Check that all daemons have their dependencies satisfied, and
+        register the missing ones"""
+        for cls in list(self._daemons.values()):
+            for c in cls.DEPENDS:
+                if c.NAME not in self._daemons:
+                    self.register_daemon(c)
+
     @property
     def daemons(self):
         return sorted(self._daemons.values(), key=attrgetter('PRIO'))
@@ -132,72 +156,90 @@ class RouterConfig(object):
             key = key.NAME
         return self._daemons[key]
 
-    @staticmethod
-    def incr_last_routerid():
-        global last_routerid
-        last_routerid += 1
-
-    def _equal_routerid(self, n):
-
-        # Router id of 'n' already set
-        if n.config.routerid:
-            return str(n.config.routerid) != str(last_routerid)
-
-        # Check that a router id explicitly set
-        # in any other daemon is not in conflict
-        # with the current router id
-        for d in n.config.daemons:
-            if d != self \
-                    and d.options.routerid \
-                    and str(d.options.routerid) == str(last_routerid):
-                return True
-
-        # Check that the most-visible IPv4 address is not in conflict
-        # with the current router id
-        ip_list = sorted((ip for itf in realIntfList(n)
-                          for ip in itf.ips()),
-                         key=OrderedAddress)
-        if len(ip_list) != 0 \
-                and str(ip_list.pop().ip) == str(last_routerid):
-            return True
-
-        return False
+    def preferred_routerid(self):
+        """Return the router id that this router would pick for itself,
+        i.e., the router id explicitly set for its daemon with the highest
+        priority or its most-visible IPv4 address.
+
+        :return: the router id or None if there is none"""
+        for d in self.daemons:
+            if d.options.routerid:
+                return d.options.routerid
+        ips = [ip for itf in realIntfList(self._node) for ip in itf.ips()]
+        if ips:
+            return max(ips, key=OrderedAddress).ip.compressed
+        return None
 
     def compute_routerid(self):
         """Computes the default router id for all daemons.
         If a router ids were explicitly set for some of its daemons,
         the router id set to the daemon with the highest priority is chosen as the global router id.
         Otherwise if it has IPv4 addresses, it returns the most-visible one among its router interfaces.
-        If both conditions are wrong, it generates a unique router id."""
+        If both conditions are wrong, it keeps the router id allocated by
+        the network, or generates a unique router id among the routers
+        reachable from this one."""
+        routerid = self.preferred_routerid()
+        if routerid is not None:
+            return routerid
+        if self.routerid:
+            return self.routerid
+        return RouterIdAllocator(_reachable_routers(self._node)).next_id()
+
+
+def _reachable_routers(node):
+    """Return the routers that can be reached from a node, through the
+    broadcast domains of its interfaces"""
+    visited = set()
+    routers = []
+    to_visit = realIntfList(node)
+    while to_visit:
+        itf = to_visit.pop()
+        for i in itf.broadcast_domain.routers:
+            if i.node in visited:
+                continue
+            visited.add(i.node)
+            routers.append(i.node)
+            to_visit.extend(realIntfList(i.node))
+    return routers
+
+
+class RouterIdAllocator(object):
+    """Allocates unique router ids to a set of routers.
+
+    Routers keep their preferred router id (see
+    RouterConfig.preferred_routerid). The others get the lowest router ids
+    that are not used by any router of the set. All router ids are collected
+    in a single pass and kept as integers in a set."""
+
+    def __init__(self, routers):
+        """:param routers: the routers among which router ids are unique"""
+        self.routers = list(routers)
+        self._preferred = {}
+        self._used = set()
+        self._next = int(ip_address(u'0.0.0.1'))
+        for r in self.routers:
+            routerid = r.config.preferred_routerid() or r.config.routerid
+            if not routerid:
+                continue
+            self._preferred[r] = routerid
+            try:
+                self._used.add(int(ip_address(str(routerid))))
+            except ValueError:
+                log.warning('Router id %s of %s is not an IPv4 address\n'
+                            % (routerid, r.name))
 
-        for d in self.daemons:
-            if d.options.routerid:
-                return d.options.routerid
+    def next_id(self):
+        """Return the lowest router id that is still free"""
+        while self._next in self._used:
+            self._next += 1
+        self._used.add(self._next)
+        return ip_address(self._next).compressed
 
-        ip_list = sorted((ip for itf in realIntfList(self._node)
-                          for ip in itf.ips()),
-                         key=OrderedAddress)
-        if len(ip_list) == 0:
-
-            to_visit = realIntfList(self._node)
-            # Explore all routers to check that none has the same router id
-            while to_visit:
-                self.incr_last_routerid()
-                visited = set()
-                while to_visit:
-                    i = to_visit.pop()
-                    if i in visited:
-                        continue
-                    visited.add(i)
-                    for n in i.broadcast_domain.routers:
-                        if self._equal_routerid(n.node):
-                            break  # We need to change the router id
-                        to_visit.extend(realIntfList(n.node))
-                to_visit = realIntfList(self._node) if to_visit else []
-            return last_routerid.compressed
-        else:
-            id = ip_list.pop().ip.compressed
-            return id
+    def allocate(self):
+        """Set the router id of every router in the set"""
+        for r in self.routers:
+            routerid = self._preferred.get(r)
+            r.config.routerid = routerid if routerid else self.next_id()
 
 
 class Daemon(with_metaclass(abc.ABCMeta, object)):
@@ -211,6 +253,20 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
     DEPENDS = ()
     # The kill patterns to cleanup any processes started by this daemon
     KILL_PATTERNS = ()
+    # The maximal time to wait for this daemon to be ready, in seconds
+    STARTUP_TIMEOUT = DEFAULT_TIMEOUT
+    # The RestartPolicy of this daemon if it exits, None to never restart it
+    RESTART = None
+    # Whether the configuration is rendered straight to its file by
+    # render_file(), set it to False if render() or write() is overridden
+    RENDERS_TO_FILE = True
+    # Whether cleanup() only removes the files of release_files(), such that
+    # those of all daemons are removed at once, set it to False if cleanup()
+    # is overridden
+    CLEANUP_FILES_ONLY = True
+    # Whether the readiness is polled through has_started(), set it to True
+    # if has_started() is overridden instead of readiness_probes()
+    POLL_HAS_STARTED = False
 
     def __init__(self, node, **kwargs):
         """:param node: The node for which we build the config
@@ -218,6 +274,8 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
         self._node = node
         self._startup_line = None
         self.files = []
+        # The sha256 digest of the last configuration file written
+        self.cfg_digest = None
         self._options = self._defaults(**kwargs)
         super(Daemon, self).__init__()
 
@@ -238,12 +296,26 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
 
     def cleanup(self):
         """Cleanup the files belonging to this daemon"""
-        for f in self.files:
-            try:
-                os.unlink(f)
-            except (IOError, OSError):
-                pass
+        remove_files(self.release_files())
+
+    def release_files(self):
+        """Forget the files belonging to this daemon
+
+        :return: the paths of the files to remove"""
+        files = self.files + self.runtime_files()
         self.files = []
+        self.cfg_digest = None
+        return files
+
+    def pid_files(self):
+        """Return the paths of the pid files written by this daemon once
+        started, to find its processes even if it runs in the background"""
+        return []
+
+    def runtime_files(self):
+        """Return the paths of the files created by this daemon once started,
+        removed at cleanup"""
+        return self.pid_files()
 
     def render(self, cfg, **kwargs):
         """Render the configuration file for this daemon
@@ -259,19 +331,40 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
                                           ip_statement=ip_statement,
                                           **kwargs)
         except:
-            # Display template errors in a less cryptic way
-            log.error('Couldn''t render a config file(',
-                      self.template_filename, ')')
-            log.error(mako.exceptions.text_error_template().render())
-            raise ValueError('Cannot render a configuration [%s: %s]' % (
-                self._node.name, self.NAME))
+            self._render_error(mako.exceptions.text_error_template().render())
 
     def write(self, cfg):
         """Write down the configuration for this daemon
 
         :param cfg: The configuration string"""
-        with closing(open(self.cfg_filename, 'w')) as f:
-            f.write(cfg)
+        self.cfg_digest = write_config(self.cfg_filename, cfg)
+
+    def render_file(self, cfg):
+        """Render the configuration file for this daemon, writing the
+        template output straight to the file
+
+        :param cfg: The global config for the node"""
+        if not self.RENDERS_TO_FILE:
+            self.write(self.render(cfg))
+            return
+        self.files.append(self.cfg_filename)
+        log.debug('Generating %s\n' % self.cfg_filename)
+        try:
+            self.cfg_digest = render_template(self.template_filename,
+                                              self.cfg_filename, node=cfg)
+        except:
+            self._render_error(mako.exceptions.text_error_template().render())
+
+    def _render_error(self, error):
+        """Display template errors in a less cryptic way
+
+        :param error: the text describing the template error
+        :raise ValueError: in all cases"""
+        log.error('Couldn''t render a config file(',
+                  self.template_filename, ')')
+        log.error(error)
+        raise ValueError('Cannot render a configuration [%s: %s]' % (
+            self._node.name, self.NAME))
 
     @abc.abstractproperty
     def startup_line(self):
@@ -321,9 +414,18 @@ class Daemon(with_metaclass(abc.ABCMeta, object)):
     def set_defaults(self, defaults):
         """Update defaults to contain the defaults specific to this daemon"""
 
+    def readiness_probes(self):
+        """Return the list of ReadinessProbe that must all succeed for this
+        daemon to be ready to serve, once its process is started. The daemon
+        is ready as soon as it is started if the list is empty."""
+        if self.POLL_HAS_STARTED:
+            return [CallableProbe(self.has_started,
+                                  '%s.has_started()' % self.NAME)]
+        return []
+
     def has_started(self):
         """Return whether this daemon has started or not"""
-        return True
+        return all(p.check() for p in self.readiness_probes())
 
 
 class BasicRouterConfig(RouterConfig):
@@ -6,7 +6,8 @@ import itertools
 from ipaddress import ip_network, ip_address
 
 from ipmininet.overlay import Overlay
-from ipmininet.utils import realIntfList
+from ipmininet.utils import adjacency_index
+from .readiness import TCPPortProbe
 from .zebra import QuaggaDaemon, Zebra
 
 
@@ -90,6 +91,10 @@ class BGP(QuaggaDaemon):
         super(BGP, self).__init__(node=node, *args, **kwargs)
         self.port = port
 
+    def readiness_probes(self):
+        # Wait until the daemon accepts BGP sessions
+        return [TCPPortProbe(self.port, pid=self._node.pid)]
+
     def build(self):
         cfg = super(BGP, self).build()
         cfg.asn = self._node.asn
@@ -170,23 +175,11 @@ class Peer(object):
     def _find_peer_address(base, peer, v6=False):
         """Return the IP address that base should try to contact to establish
         a peering"""
-        visited = set()
-        to_visit = realIntfList(base)
-        # Explore all interfaces in base ASN recursively, until we find one
-        # connected to the peer
-        while to_visit:
-            i = to_visit.pop()
-            if i in visited:
-                continue
-            visited.add(i)
-            for n in i.broadcast_domain.routers:
-                if n.node.name == peer:
-                    if not v6:
-                        return n.ip, n.node
-                    elif n.ip6 and not ip_address(n.ip6).is_link_local:
-                        return n.ip6, n.node
-                    else:
-                        return None, None
-                elif n.node.asn == base.asn or not n.node.asn:
-                    to_visit.extend(realIntfList(n.node))
+        n = adjacency_index(base).find_peer(base, peer)
+        if n is None:
+            return None, None
+        if not v6:
+            return n.ip, n.node
+        elif n.ip6 and not ip_address(n.ip6).is_link_local:
+            return n.ip6, n.node
         return None, None
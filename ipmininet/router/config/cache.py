@@ -0,0 +1,98 @@
+"""This module caches the results of the configuration checks of the
+daemons on disk, such that a configuration file that was already validated
+by the same daemon binary is not checked again"""
+import hashlib
+import os
+import shlex
+
+from mininet.log import lg as log
+
+from ipmininet.utils import find_cmd, cache_directory
+from .utils import file_digest
+
+
+def binary_identity(cmd):
+    """Return a string identifying the version of an executable, without
+    running it, or None if it cannot be found
+
+    :param cmd: the name or the path of the executable"""
+    path = find_cmd(cmd)
+    if path is None:
+        return None
+    path = os.path.realpath(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return '%s:%d:%d' % (path, st.st_size, int(st.st_mtime))
+
+
+class DryRunCache(object):
+    """A cache of the successful configuration checks of the daemons.
+
+    Each check is keyed by the identity of the daemon binary, the command
+    line of the check and the digest of the configuration file. A
+    successful check is recorded as an empty file named after its key."""
+
+    def __init__(self, directory=None, enabled=True):
+        """:param directory: the directory of the cache, see
+                             cache_directory() if None
+        :param enabled: whether the cache is used"""
+        self.directory = directory or cache_directory('dry_run')
+        self.enabled = enabled
+        self._binaries = {}  # cmd -> identity
+
+    def key(self, daemon):
+        """Return the key of the configuration check of a daemon, or None if
+        the check cannot be cached"""
+        try:
+            cmdline = daemon.dry_run
+            cmd = shlex.split(cmdline)[0]
+        except (IndexError, ValueError):
+            return None
+        try:
+            binary = self._binaries[cmd]
+        except KeyError:
+            binary = self._binaries[cmd] = binary_identity(cmd)
+        digest = daemon.cfg_digest or file_digest(daemon.cfg_filename)
+        if binary is None or digest is None:
+            return None
+        return hashlib.sha256(('\n'.join((binary, cmdline, digest)))
+                              .encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def is_valid(self, key):
+        """Return whether a check was already successful"""
+        return self.enabled and key is not None and \
+            os.path.exists(self._path(key))
+
+    def set_valid(self, key):
+        """Record that a check was successful"""
+        if not self.enabled or key is None:
+            return
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            pass  # The directory already exists
+        try:
+            with open(self._path(key), 'w'):
+                pass
+        except (IOError, OSError) as e:
+            log.debug('Cannot cache a configuration check: %s\n' % e)
+
+    def clear(self):
+        """Remove all recorded checks"""
+        try:
+            keys = os.listdir(self.directory)
+        except OSError:
+            return
+        for key in keys:
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+
+dry_run_cache = DryRunCache()
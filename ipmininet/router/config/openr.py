@@ -5,6 +5,10 @@ from ipmininet.overlay import Overlay
 from ipmininet.utils import otherIntf, L3Router, realIntfList
 from .utils import ConfigDict
 from .openrd import OpenrDaemon
+from .readiness import TCPPortProbe
+
+# The port on which OpenR answers the requests to its Decision module
+OPENR_DECISION_REP_PORT = 60004
 
 
 class OpenrDomain(Overlay):
@@ -89,6 +93,12 @@ class Openr(OpenrDaemon):
         defaults.log_dir="/var/log"
         super(Openr, self).set_defaults(defaults)
 
+    def readiness_probes(self):
+        # Wait until the Decision module accepts requests
+        return [TCPPortProbe(self.options.get('decision_rep_port',
+                                              OPENR_DECISION_REP_PORT),
+                             pid=self._node.pid)]
+
     def is_active_interface(self, itf):
         """Return whether an interface is active or not for the OpenR daemon"""
         return L3Router.is_l3router_intf(otherIntf(itf))
@@ -0,0 +1,45 @@
+"""This module compiles the configuration templates ahead of time, e.g.,
+right after the installation of ipmininet, and reports the time needed to
+load them in a new process with and without the compiled templates.
+
+Usage: python -m ipmininet.router.config.precompile"""
+from __future__ import print_function
+
+import time
+
+from .utils import template_lookup, make_template_lookup, \
+    precompile_templates, templates_module_dir
+
+
+def measure_cold_start(directories=None):
+    """Measure the time needed to get all templates from a new lookup,
+    compiling them from their source or loading their compiled module
+
+    :param directories: the template directories, the ones of
+                        template_lookup if None
+    :return: (seconds from source, seconds from compiled modules or None if
+              the compiled templates are not cached)"""
+    if directories is None:
+        directories = template_lookup.directories
+    timings = []
+    for module_directory in (None, templates_module_dir()):
+        if timings and module_directory is None:
+            timings.append(None)
+            continue
+        lookup = make_template_lookup(directories, module_directory)
+        start = time.time()
+        precompile_templates(lookup)
+        timings.append(time.time() - start)
+    return tuple(timings)
+
+
+if __name__ == '__main__':
+    for name, duration in precompile_templates():
+        print('Compiled %-20s %8.2f ms' % (name, duration * 1000))
+    from_source, compiled = measure_cold_start()
+    print('Cold start from source:   %8.2f ms' % (from_source * 1000))
+    if compiled is None:
+        print('The compiled templates cannot be cached')
+    else:
+        print('Cold start from compiled: %8.2f ms (%s)'
+              % (compiled * 1000, templates_module_dir()))
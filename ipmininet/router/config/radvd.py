@@ -5,6 +5,7 @@ from ipaddress import ip_address
 from ipmininet.utils import find_node
 from ipmininet.utils import realIntfList
 from .base import Daemon
+from .readiness import PidFileProbe
 from .utils import ConfigDict
 from ipmininet.utils import is_container
 
@@ -120,14 +121,9 @@ class RADVD(Daemon):
     def dry_run(self):
         return 'radvd -c -C {cfg} -u root'.format(cfg=self.cfg_filename)
 
-    def cleanup(self):
-        try:
-            with open(self._file('pid'), 'r') as f:
-                for line in f:
-                    if len(line) > 1:
-                        pid = int(line[:-1])
-                        self._node._processes.call('kill -9 %d ' % pid)
-        except (IOError, OSError):
-            pass
-        super(RADVD, self).cleanup()
+    def pid_files(self):
+        return [self._file('pid')]
 
+    def readiness_probes(self):
+        # radvd runs in the background once it has written its pid file
+        return [PidFileProbe(self._file('pid'))]
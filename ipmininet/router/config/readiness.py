@@ -0,0 +1,470 @@
+"""This module defines the readiness probes of the daemons, i.e., the
+conditions telling that a daemon is ready to serve once its process is
+started, and a monitor waiting for the probes of many daemons at once from
+a single event loop.
+
+The monitor sleeps on the inotify events of the directories in which the
+probes expect files to appear, and polls with an exponential backoff the
+conditions that cannot be watched (e.g., a TCP port in a network namespace
+or a socket that is bound but not yet listening)."""
+import ctypes
+import ctypes.util
+import errno
+import os
+import re
+import select
+import socket
+import struct
+import threading
+import time
+
+from mininet.log import lg as log
+
+# The default time to wait for a daemon to be ready, in seconds
+DEFAULT_TIMEOUT = 30.
+# The bounds of the interval between two checks of a probe, in seconds
+POLL_MIN = .001
+POLL_MAX = .1
+
+
+class ReadinessProbe(object):
+    """A condition telling that a daemon is ready"""
+
+    # The directory in which the probe expects changes, watched for events
+    # if not None
+    directory = None
+
+    def reset(self):
+        """Called when the daemon is started, e.g., to forget the state left
+        by a previous run"""
+
+    def check(self):
+        """Return whether the condition is met"""
+        raise NotImplementedError
+
+    def __str__(self):
+        return self.__class__.__name__
+
+
+class CallableProbe(ReadinessProbe):
+    """A condition evaluated by a function without argument"""
+
+    def __init__(self, func, description=None):
+        self.func = func
+        self.description = description or repr(func)
+
+    def check(self):
+        return bool(self.func())
+
+    def __str__(self):
+        return self.description
+
+
+class UnixSocketProbe(ReadinessProbe):
+    """Wait until a UNIX socket accepts connections"""
+
+    def __init__(self, path, connect_timeout=.1):
+        """:param path: the path of the socket
+        :param connect_timeout: the maximal time to wait for a connection"""
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.connect_timeout = connect_timeout
+
+    def check(self):
+        if not os.path.exists(self.path):
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.connect_timeout)
+        try:
+            sock.connect(self.path)
+            return True
+        except socket.error:
+            return False
+        finally:
+            sock.close()
+
+    def __str__(self):
+        return 'UNIX socket %s' % self.path
+
+
+def listening_ports(pid=None):
+    """Return the set of TCP ports listened to in the network namespace of a
+    process
+
+    :param pid: the process, the current one if None"""
+    proc = '/proc/%s/net' % ('self' if pid is None else pid)
+    ports = set()
+    for table in ('tcp', 'tcp6'):
+        try:
+            with open(os.path.join(proc, table)) as f:
+                next(f)  # Skip the header
+                for line in f:
+                    fields = line.split()
+                    if len(fields) > 3 and fields[3] == '0A':  # LISTEN
+                        ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+        except (IOError, OSError, StopIteration):
+            continue
+    return ports
+
+
+class TCPPortProbe(ReadinessProbe):
+    """Wait until a TCP port is listened to. As the sockets of another
+    network namespace cannot be watched, the probe reads the socket table of
+    a process of that namespace."""
+
+    def __init__(self, port, pid=None):
+        """:param port: the TCP port
+        :param pid: a process of the network namespace, the current process
+                    if None"""
+        self.port = int(port)
+        self.pid = pid
+
+    def check(self):
+        return self.port in listening_ports(self.pid)
+
+    def __str__(self):
+        return 'TCP port %d' % self.port
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime
+
+
+class PidFileProbe(ReadinessProbe):
+    """Wait until a pid file is written with the pid of a running
+    process"""
+
+    def __init__(self, path):
+        """:param path: the path of the pid file"""
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self._stale = None
+
+    def reset(self):
+        self._stale = _stat(self.path)
+
+    def check(self):
+        st = _stat(self.path)
+        if st is None or st == self._stale:
+            return False
+        try:
+            with open(self.path) as f:
+                pid = int(f.read().strip())
+        except (IOError, OSError, ValueError):
+            return False  # Not completely written yet
+        return os.path.exists('/proc/%d' % pid)
+
+    def __str__(self):
+        return 'pid file %s' % self.path
+
+
+class LogLineProbe(ReadinessProbe):
+    """Wait until a line matching a regular expression is appended to a
+    log file"""
+
+    def __init__(self, path, pattern):
+        """:param path: the path of the log file
+        :param pattern: the regular expression to search in its new lines"""
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.pattern = re.compile(pattern)
+        self._offset = 0
+        self._partial = b''
+
+    def reset(self):
+        st = _stat(self.path)
+        self._offset = st[1] if st else 0
+        self._partial = b''
+
+    def check(self):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < self._offset:
+                    self._offset = 0  # The file was truncated
+                f.seek(self._offset)
+                data = self._partial + f.read()
+                self._offset = f.tell()
+        except (IOError, OSError):
+            return False
+        lines = data.split(b'\n')
+        self._partial = lines.pop()
+        return any(self.pattern.search(line.decode('utf-8', 'replace'))
+                   for line in lines)
+
+    def __str__(self):
+        return 'log line /%s/ in %s' % (self.pattern.pattern, self.path)
+
+
+class Inotify(object):
+    """A minimal binding to the inotify API of Linux, reporting the
+    directories in which files were created, written or moved"""
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        """:raise OSError: if inotify is not available"""
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            init, self._add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise OSError(errno.ENOSYS, 'inotify is not available: %s' % e)
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                    ctypes.c_uint32]
+        self.fd = init(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0o2000000))
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._directories = {}  # watch descriptor -> directory
+        self._watches = {}  # directory -> watch descriptor
+
+    def watch(self, directory):
+        """Watch a directory if it is not already the case
+
+        :return: whether the directory is watched"""
+        if directory in self._watches:
+            return True
+        wd = self._add_watch(self.fd, directory.encode('utf-8'), self.MASK)
+        if wd < 0:
+            return False
+        self._watches[directory] = wd
+        self._directories[wd] = directory
+        return True
+
+    def read(self):
+        """Return the set of directories that changed since the last call"""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    return changed
+                raise
+            if not data:
+                return changed
+            offset = 0
+            while offset + self._EVENT.size <= len(data):
+                wd, _, _, length = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size + length
+                if wd in self._directories:
+                    changed.add(self._directories[wd])
+
+    def close(self):
+        os.close(self.fd)
+        self._watches.clear()
+        self._directories.clear()
+
+
+class Readiness(object):
+    """The readiness of a started daemon, as tracked by a
+    ReadinessMonitor"""
+
+    def __init__(self, name, probes, process=None, timeout=DEFAULT_TIMEOUT):
+        """:param name: the name of the daemon, used in error messages
+        :param probes: the list of ReadinessProbe that must all succeed
+        :param process: the Popen object of the daemon, to detect its
+                        failure
+        :param timeout: the maximal time to wait, in seconds"""
+        self.name = name
+        self.pending = list(probes)
+        self.process = process
+        self.started = time.time()
+        self.deadline = self.started + timeout
+        self.timeout = timeout
+        # The time at which the daemon was ready, None otherwise
+        self.ready_at = None
+        # The reason why the daemon is not ready, None otherwise
+        self.error = None
+        self._interval = {p: POLL_MIN for p in self.pending}
+        self._next_check = {p: self.started for p in self.pending}
+        self._done = threading.Event()
+        for p in self.pending:
+            p.reset()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self):
+        """Wait until the daemon is ready or failed
+
+        :return: whether the daemon is ready"""
+        while not self._done.wait(1):
+            pass  # Wait by small steps to remain interruptible
+        return self.error is None
+
+    def _update(self, now, changed):
+        """Check the probes that are due or whose directory changed
+
+        :param changed: the set of directories that changed
+        :return: the next time at which a probe must be checked"""
+        for p in list(self.pending):
+            if p.directory in changed:
+                self._interval[p] = POLL_MIN
+            elif self._next_check[p] > now:
+                continue
+            try:
+                ok = p.check()
+            except Exception as e:
+                log.debug('Readiness probe %s of %s failed: %s\n'
+                          % (p, self.name, e))
+                ok = False
+            if ok:
+                self.pending.remove(p)
+                continue
+            self._next_check[p] = now + self._interval[p]
+            self._interval[p] = min(POLL_MAX, self._interval[p] * 2)
+        if not self.pending:
+            self._finish(now)
+        elif self.process is not None and self.process.poll():
+            # Daemonizing processes exit with 0 while their child runs on
+            self._finish(now, 'exited with code %d' % self.process.returncode)
+        elif now >= self.deadline:
+            self._finish(now, 'not ready after %gs, waiting for %s' % (
+                self.timeout, ', '.join(str(p) for p in self.pending)))
+        else:
+            return min([self.deadline] +
+                       [self._next_check[p] for p in self.pending])
+        return None
+
+    def _finish(self, now, error=None):
+        self.error = error
+        if error is None:
+            self.ready_at = now
+            log.debug('%s ready after %.3fs\n'
+                      % (self.name, now - self.started))
+        self._done.set()
+
+
+class ReadinessMonitor(object):
+    """Waits for the readiness of many daemons from a single thread.
+
+    The thread runs an event loop as long as some daemons are not ready,
+    sleeping on the inotify events of the directories watched by the probes
+    (if inotify is available) until the next probe must be polled."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._thread = None
+        self._wakeup = None
+
+    def watch(self, name, probes, process=None, timeout=DEFAULT_TIMEOUT):
+        """Start tracking the readiness of a daemon that was just started
+
+        :param name: the name of the daemon, used in error messages
+        :param probes: the list of ReadinessProbe that must all succeed
+        :param process: the Popen object of the daemon, to detect its
+                        failure
+        :param timeout: the maximal time to wait, in seconds
+        :return: a Readiness object, to wait on"""
+        readiness = Readiness(name, probes, process=process, timeout=timeout)
+        with self._lock:
+            self._pending.append(readiness)
+            if self._thread is None:
+                self._wakeup = os.pipe()
+                self._thread = threading.Thread(target=self._loop,
+                                                name='readiness-monitor')
+                self._thread.daemon = True
+                self._thread.start()
+            else:
+                os.write(self._wakeup[1], b'x')
+        return readiness
+
+    def wait_ready(self, name, probes, process=None, timeout=DEFAULT_TIMEOUT):
+        """Wait for the readiness of a daemon, see watch()
+
+        :return: the Readiness object of the daemon"""
+        readiness = self.watch(name, probes, process=process,
+                               timeout=timeout)
+        readiness.wait()
+        return readiness
+
+    @staticmethod
+    def _poller(fds):
+        """Return a function waiting for events on fds for a given time"""
+        if hasattr(select, 'epoll'):
+            epoll = select.epoll()
+            for fd in fds:
+                epoll.register(fd, select.EPOLLIN)
+            return (lambda timeout: [fd for fd, _ in epoll.poll(timeout)]), \
+                epoll.close
+        return (lambda timeout: select.select(fds, [], [], timeout)[0]), \
+            lambda: None
+
+    def _loop(self):
+        wakeup = self._wakeup[0]
+        try:
+            inotify = Inotify()
+        except OSError as e:
+            log.debug('Polling the readiness probes: %s\n' % e)
+            inotify = None
+        poll, close = self._poller([wakeup] + ([inotify.fd]
+                                               if inotify else []))
+        changed = set()
+        try:
+            while True:
+                now = time.time()
+                with self._lock:
+                    pending = list(self._pending)
+                next_check = None
+                for readiness in pending:
+                    if inotify is not None:
+                        for p in readiness.pending:
+                            if p.directory is not None and \
+                                    not inotify.watch(p.directory):
+                                p.directory = None  # Poll it instead
+                    t = readiness._update(now, changed)
+                    if t is None:
+                        with self._lock:
+                            self._pending.remove(readiness)
+                    elif next_check is None or t < next_check:
+                        next_check = t
+                with self._lock:
+                    if not self._pending:
+                        self._thread = None
+                        for fd in self._wakeup:
+                            os.close(fd)
+                        self._wakeup = None
+                        return
+                    if next_check is None:
+                        next_check = now  # New daemons are waiting
+                changed = set()
+                try:
+                    ready = poll(max(0, next_check - time.time()))
+                except (IOError, OSError, select.error):
+                    continue  # Interrupted by a signal
+                if wakeup in ready:
+                    os.read(wakeup, 4096)
+                if inotify is not None and inotify.fd in ready:
+                    changed = inotify.read()
+        except Exception as e:
+            # Do not leave the daemons waiting forever
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._thread = None
+                for fd in self._wakeup:
+                    os.close(fd)
+                self._wakeup = None
+            for readiness in pending:
+                readiness._finish(time.time(), 'readiness monitor failed: %s'
+                                  % e)
+        finally:
+            close()
+            if inotify is not None:
+                inotify.close()
+
+
+readiness_monitor = ReadinessMonitor()
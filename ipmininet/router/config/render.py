@@ -0,0 +1,132 @@
+"""This module renders the configuration files of many routers at once,
+spreading the template rendering over a pool of processes"""
+import multiprocessing
+import pickle
+from collections import OrderedDict
+
+import mako.exceptions
+
+from mininet.log import lg as log
+
+from .utils import render_template
+
+
+class RenderReport(OrderedDict):
+    """The outcome of the rendering of configuration files, as a dict
+    keyed by router name, whose values are dicts mapping daemon names to
+    their error message or None if their configuration was written.
+    Errors that prevent building the whole configuration of a router are
+    keyed by None instead of a daemon name."""
+
+    def set(self, router, daemon, error=None):
+        self.setdefault(router, OrderedDict())[daemon] = error
+
+    def errors(self):
+        """Return the list of (router, daemon, error message) that failed"""
+        return [(router, daemon, error)
+                for router, daemons in self.items()
+                for daemon, error in daemons.items()
+                if error is not None]
+
+    def __bool__(self):
+        """Whether all configurations were rendered"""
+        return not self.errors()
+    __nonzero__ = __bool__
+
+
+def _render_job(job):
+    """Render the configuration files of a router, possibly in a separate
+    process
+
+    :param job: (pickled global ConfigDict of the router,
+                 [(daemon name, template name, file path)])
+    :return: the list of (daemon name, error message or None,
+                          digest of the file or None)"""
+    tree, daemons = job
+    cfg = pickle.loads(tree)
+    result = []
+    for name, template, path in daemons:
+        try:
+            result.append((name, None,
+                           render_template(template, path, node=cfg)))
+        except Exception:
+            result.append((name,
+                           mako.exceptions.text_error_template().render(),
+                           None))
+    return result
+
+
+def render_configs(routers, processes=None):
+    """Build and write the configuration files of all daemons of a set of
+    routers.
+
+    The configuration trees are built in this process, as they depend on
+    the state of the network. The templates of the daemons are then rendered
+    to their files by a pool of processes, if more than one router has to
+    be rendered. Daemons overriding Daemon.render or Daemon.write, and
+    routers whose configuration tree cannot be pickled, are rendered in this
+    process.
+
+    :param routers: the routers to configure
+    :param processes: the size of the process pool, the number of cpus
+                      if None
+    :return: a RenderReport"""
+    report = RenderReport()
+    jobs = []
+    local = []  # (router, daemon) to render in this process
+    for r in routers:
+        config = r.config
+        try:
+            tree = config.build_tree()
+        except Exception as e:
+            log.error('Cannot build the configuration of', r.name, ':',
+                      str(e), '\n')
+            report.set(r.name, None, str(e))
+            continue
+        report.setdefault(r.name, OrderedDict())
+        daemons = [d for d in config.daemons if d.RENDERS_TO_FILE]
+        for d in config.daemons:
+            if not d.RENDERS_TO_FILE:
+                local.append((r, d))
+        try:
+            job = (pickle.dumps(tree, pickle.HIGHEST_PROTOCOL),
+                   [(d.NAME, d.template_filename, d.cfg_filename)
+                    for d in daemons])
+        except Exception:
+            local.extend((r, d) for d in daemons)
+            continue
+        for d in daemons:
+            d.files.append(d.cfg_filename)
+        jobs.append((r, job))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if len(jobs) > 1 and processes > 1:
+        pool = multiprocessing.Pool(min(processes, len(jobs)))
+        try:
+            results = pool.map(_render_job, [job for _, job in jobs])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_render_job(job) for _, job in jobs]
+    for (r, _), result in zip(jobs, results):
+        for daemon, error, digest in result:
+            r.config.daemon(daemon).cfg_digest = digest
+            report.set(r.name, daemon, error)
+            if error is not None:
+                log.error('Cannot render the configuration of', r.name,
+                          '(%s):\n' % daemon, error, '\n')
+
+    for r, d in local:
+        try:
+            d.render_file(r.config.tree)
+        except Exception as e:
+            report.set(r.name, d.NAME, str(e))
+        else:
+            report.set(r.name, d.NAME)
+
+    for r in routers:
+        r.config.built = all(error is None for error
+                             in report.get(r.name, {}).values())
+    return report
@@ -1,27 +1,60 @@
 """This module defines an sshd configuration."""
-from distutils.spawn import find_executable
-import subprocess
+import atexit
 import os
+import shutil
+import subprocess
+import sys
 import tempfile
+import threading
 
+from ipmininet.utils import find_cmd
 from .base import Daemon
+from .readiness import TCPPortProbe
+
+SSH_PORT = 22
+
+_keys = []  # The (private key, public key) files of this run, once created
+_keys_lock = threading.Lock()
+
+
+def ssh_keys():
+    """Return the paths of the ssh keypair authorized by the SSH daemons.
+    A new keypair is generated on first use in each run, and removed when
+    the run ends.
 
+    :return: (private key file, public key file)"""
+    with _keys_lock:
+        if not _keys:
+            directory = tempfile.mkdtemp(dir='/tmp')
+            atexit.register(shutil.rmtree, directory, True)
+            keyfile = os.path.join(directory, 'id_rsa')
+            subprocess.call(['ssh-keygen', '-b', '2048', '-t', 'rsa',
+                             '-f', keyfile, '-q', '-P', ''])
+            _keys.extend((keyfile, '%s.pub' % keyfile))
+        return tuple(_keys)
 
-# Generate a new ssh keypair at each run
-KEYFILE = tempfile.mktemp(dir='/tmp')
-PUBKEY = '%s.pub' % KEYFILE
-if os.path.exists(KEYFILE):
-    os.unlink(KEYFILE)
-if os.path.exists(PUBKEY):
-    os.unlink(PUBKEY)
-subprocess.call(['ssh-keygen', '-b', '2048', '-t', 'rsa', '-f', KEYFILE, '-q',
-                 '-P', ''])
+
+# The names of the key files, kept for backward compatibility
+_KEY_FILES = {'KEYFILE': 0, 'PUBKEY': 1}
+
+
+def __getattr__(name):
+    try:
+        return ssh_keys()[_KEY_FILES[name]]
+    except KeyError:
+        raise AttributeError('module %s has no attribute %s'
+                             % (__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # Module attributes cannot be computed lazily
+    KEYFILE, PUBKEY = ssh_keys()
 
 
 class SSHd(Daemon):
 
     NAME = 'sshd'
-    STARTUP_LINE_BASE = '{name} -D -u0'.format(name=find_executable(NAME))
+    STARTUP_LINE_BASE = '{name} -D -u0'.format(name=find_cmd(NAME))
     KILL_PATTERNS = (STARTUP_LINE_BASE,)
 
     @property
@@ -37,7 +70,11 @@ class SSHd(Daemon):
     def set_defaults(self, defaults):
         super(SSHd, self).set_defaults(defaults)
 
+    def readiness_probes(self):
+        # Wait until the daemon accepts connections
+        return [TCPPortProbe(SSH_PORT, pid=self._node.pid)]
+
     def build(self):
         cfg = super(SSHd, self).build()
-        cfg.authorized_keys = PUBKEY
+        cfg.authorized_keys = ssh_keys()[1]
         return cfg
@@ -2,14 +2,117 @@
 from builtins import str
 from ipmininet import basestring
 
+import hashlib
+import io
 import os
+import threading
+import time
+from contextlib import closing
 
 from ipaddress import ip_interface
+import mako
 from mako.lookup import TemplateLookup
+from mako.runtime import Context
+
+from ipmininet.utils import cache_directory
 
 __TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
 
-template_lookup = TemplateLookup(directories=[__TEMPLATES_DIR])
+# Whether the templates should be checked for changes every time they are
+# used (i.e., when editing them while the network runs). Compiled templates
+# are always checked when they are loaded in a new process.
+TEMPLATE_CHECKS = os.environ.get('IPMININET_TEMPLATE_CHECKS', '') not in \
+    ('', '0')
+
+
+def _templates_version():
+    """Return a tag identifying the version of mako and the content of our
+    templates, such that compiled templates are never reused across
+    upgrades, even if the mtime of the new templates is older"""
+    h = hashlib.sha256(mako.__version__.encode('utf-8'))
+    for name in sorted(os.listdir(__TEMPLATES_DIR)):
+        h.update(name.encode('utf-8'))
+        with open(os.path.join(__TEMPLATES_DIR, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+# The directory of the compiled templates, see templates_module_dir()
+_module_dir = []
+_module_dir_lock = threading.Lock()
+
+
+def _module_directory():
+    """Return the directory storing the compiled templates, or None if it
+    cannot be used"""
+    path = cache_directory('templates', _templates_version())
+    try:
+        os.makedirs(path)
+    except OSError:
+        pass  # The directory already exists or cannot be created
+    return path if os.access(path, os.W_OK) else None
+
+
+def templates_module_dir():
+    """Return the directory storing our compiled templates, None if they
+    cannot be cached. It is only looked up when the first template is
+    loaded, such that importing the configuration modules stays cheap."""
+    with _module_dir_lock:
+        if not _module_dir:
+            _module_dir.append(_module_directory())
+        return _module_dir[0]
+
+
+def _module_filename(module_directory):
+    def module_filename(filename, uri):
+        """Name compiled templates after the full path of their source,
+        such that the templates of different directories never collide"""
+        directory = module_directory() if callable(module_directory) \
+            else module_directory
+        if directory is None:
+            return None  # Compile the template in memory
+        key = hashlib.sha256(os.path.abspath(filename).encode('utf-8'))
+        return os.path.join(directory, '%s_%s.py' % (
+            key.hexdigest()[:16], os.path.basename(filename)))
+    return module_filename
+
+
+def make_template_lookup(directories, module_directory=None,
+                         filesystem_checks=TEMPLATE_CHECKS):
+    """Create a TemplateLookup, whose compiled templates are stored in
+    module_directory (if not None)
+
+    :param module_directory: the directory of the compiled templates, or a
+                             function returning it (or None) when the first
+                             template is loaded"""
+    return TemplateLookup(
+        directories=directories,
+        filesystem_checks=filesystem_checks,
+        modulename_callable=(_module_filename(module_directory)
+                             if module_directory else None))
+
+
+template_lookup = make_template_lookup([__TEMPLATES_DIR],
+                                       templates_module_dir)
+
+
+def precompile_templates(lookup=None):
+    """Compile all the templates found in the directories of a lookup, such
+    that they are loaded from their compiled module on first use
+
+    :param lookup: the TemplateLookup, template_lookup if None
+    :return: the list of (template name, time to get it in seconds)"""
+    if lookup is None:
+        lookup = template_lookup
+    timings = []
+    for d in lookup.directories:
+        for name in sorted(os.listdir(d)):
+            if not name.endswith('.mako'):
+                continue
+            start = time.time()
+            lookup.get_template(name)
+            timings.append((name, time.time() - start))
+    return timings
 
 
 class ConfigDict(dict):
@@ -46,3 +149,79 @@ def ip_statement(ip):
         ip = (ip_interface(ip) if not isinstance(ip, basestring) else
               ip_interface(str(ip))).version
     return 'ipv6' if ip == 6 else 'ip'
+
+
+def file_digest(path):
+    """Return the sha256 hex digest of the content of a file, or None if it
+    cannot be read"""
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+    except (IOError, OSError):
+        return None
+    return h.hexdigest()
+
+
+class _HashingWriter(object):
+    """A file wrapper hashing the data written into it"""
+
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        self.f.write(data)
+        self.hash.update(data.encode('utf-8'))
+
+
+def _write_if_changed(path, render):
+    """Write a file through a temporary file, and only replace the original
+    one if its content changed
+
+    :param path: the path of the file to write
+    :param render: a function writing the content in the file object that
+                   it is given
+    :return: the sha256 hex digest of the content"""
+    tmp = '%s.%d-%d.tmp' % (path, os.getpid(),
+                            threading.current_thread().ident)
+    try:
+        with closing(io.open(tmp, 'w', encoding='utf-8')) as f:
+            writer = _HashingWriter(f)
+            render(writer)
+        digest = writer.hash.hexdigest()
+        if file_digest(path) == digest:
+            os.unlink(tmp)  # Keep the file untouched
+        else:
+            os.rename(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return digest
+
+
+def write_config(path, content):
+    """Write a configuration file, unless it already has the given content
+
+    :param path: the path of the file to write
+    :param content: the content of the file
+    :return: the sha256 hex digest of the content"""
+    return _write_if_changed(path, lambda f: f.write(str(content)))
+
+
+def render_template(template, path, **data):
+    """Render a template straight into a file, without building the whole
+    output in memory. The file is left untouched if its content would not
+    change.
+
+    :param template: the name of the template in template_lookup
+    :param path: the path of the file to write
+    :param data: the variables passed to the template
+    :return: the sha256 hex digest of the content of the file"""
+    tmpl = template_lookup.get_template(template)
+    return _write_if_changed(path, lambda f: tmpl.render_context(
+        Context(f, ip_statement=ip_statement, **data)))
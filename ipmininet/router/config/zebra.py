@@ -1,8 +1,8 @@
 import os
-import socket
 
 from ipmininet.utils import realIntfList
 from .base import Daemon
+from .readiness import UnixSocketProbe
 from .utils import ConfigDict
 
 # Zebra actions
@@ -31,6 +31,9 @@ class QuaggaDaemon(Daemon):
         return os.path.join(self._node.cwd,
                             '%s_%s.api' % ('quagga', self._node.name))
 
+    def pid_files(self):
+        return [self._file('pid')]
+
     def build(self):
         cfg = super(QuaggaDaemon, self).build()
         cfg.debug = self.options.debug
@@ -78,19 +81,16 @@ class Zebra(QuaggaDaemon):
         defaults.route_maps = []
         super(Zebra, self).set_defaults(defaults)
 
-    def has_started(self):
-        # We override this such that we wait until we have the API socket
-        # and until wa can connect to it
-        return os.path.exists(self.zebra_socket) and self.listening()
+    def runtime_files(self):
+        return super(Zebra, self).runtime_files() + [self.zebra_socket]
 
     def listening(self):
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        try:
-            sock.connect(self.zebra_socket)
-            sock.close()
-            return True
-        except socket.error:
-            return False
+        """Return whether the API socket accepts connections"""
+        return UnixSocketProbe(self.zebra_socket).check()
+
+    def readiness_probes(self):
+        # Wait until we can connect to the API socket
+        return [UnixSocketProbe(self.zebra_socket)]
 
 
 class AccessListEntry(object):
@@ -0,0 +1,383 @@
+"""This module defines a supervisor for the processes of a node: it drains
+their output into bounded buffers, detects their exits, restarts them if
+requested and terminates them within a deadline."""
+import errno
+import fcntl
+import os
+import select
+import signal
+import threading
+import time
+from collections import deque
+
+from mininet.log import lg as log
+
+from ipmininet import basestring
+from ipmininet.teardown import TERMINATE_TIMEOUT, is_alive, signal_pids
+
+# The default number of bytes of output kept per process
+OUTPUT_BUFFER_SIZE = 64 * 1024
+# The maximal time between two checks of the processes, in seconds
+CHECK_INTERVAL = .5
+# The maximal number of reads draining a pipe at once, e.g., when its
+# process exits while its children keep writing to it
+MAX_DRAIN_READS = 64
+
+
+class RingBuffer(object):
+    """Keeps the last bytes written to it"""
+
+    def __init__(self, size=OUTPUT_BUFFER_SIZE):
+        """:param size: the maximal number of bytes kept"""
+        self.size = size
+        self._chunks = deque()
+        self._length = 0
+        # The total number of bytes written, including the discarded ones
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        self._chunks.append(data)
+        self._length += len(data)
+        while self._length - len(self._chunks[0]) >= self.size:
+            self._length -= len(self._chunks.popleft())
+
+    def getvalue(self):
+        """Return the last bytes written"""
+        return b''.join(self._chunks)[-self.size:] if self.size else b''
+
+
+class BoundedFile(object):
+    """A file whose content is rotated once it exceeds a given size, such
+    that at most twice its size is kept on disk"""
+
+    def __init__(self, path, size=1024 * 1024):
+        """:param path: the path of the file, rotated to path.1
+        :param size: the maximal size of the file"""
+        self.path = path
+        self.size = size
+        self._file = open(path, 'ab')
+
+    def write(self, data):
+        if self._file.tell() + len(data) > self.size:
+            self._file.close()
+            os.rename(self.path, self.path + '.1')
+            self._file = open(self.path, 'ab')
+        self._file.write(data)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class RestartPolicy(object):
+    """Describes when and how often a supervised process is restarted"""
+
+    def __init__(self, max_restarts=5, backoff=1., max_backoff=30.,
+                 on_success=False):
+        """:param max_restarts: the maximal number of restarts, None for no
+                                limit
+        :param backoff: the delay before the first restart, doubled for each
+                        following one, in seconds
+        :param max_backoff: the maximal delay before a restart
+        :param on_success: whether processes exiting with a 0 code are also
+                           restarted. Note that daemons forking in the
+                           background exit with 0 at startup."""
+        self.max_restarts = max_restarts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.on_success = on_success
+
+    def delay(self, record):
+        """Return the delay before restarting a process that exited, None if
+        it should not be restarted
+
+        :param record: the ProcessRecord of the process"""
+        if not self.on_success and record.returncode == 0:
+            return None
+        if self.max_restarts is not None and \
+                record.restarts >= self.max_restarts:
+            return None
+        return min(self.max_backoff, self.backoff * 2 ** record.restarts)
+
+
+class ProcessRecord(object):
+    """The state of a supervised process"""
+
+    def __init__(self, name, args, kwargs, restart=None, output_file=None,
+                 buffer_size=OUTPUT_BUFFER_SIZE):
+        """:param name: the name of the process, used in the logs
+        :param args: the positional arguments of node.popen
+        :param kwargs: the keyword arguments of node.popen
+        :param restart: the RestartPolicy, None to never restart
+        :param output_file: the path of a BoundedFile also receiving the
+                            output, None to only keep it in memory
+        :param buffer_size: the number of bytes of output kept in memory"""
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.restart = restart
+        self.process = None
+        self.output = RingBuffer(buffer_size)
+        self._file = BoundedFile(output_file) if output_file else None
+        self._pipes = []
+        # The time at which the process was last started
+        self.started_at = None
+        self.restarts = 0
+        # The exit codes of all past runs of the process
+        self.exit_codes = []
+        # The time at which the process should be restarted, if any
+        self.restart_at = None
+        self.stopping = False
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def returncode(self):
+        return self.exit_codes[-1] if self.exit_codes else None
+
+    @property
+    def uptime(self):
+        """The number of seconds since the process was started, 0 if it is
+        not running"""
+        return time.time() - self.started_at if self.running else 0
+
+    def status(self):
+        """Return a dict summarizing the state of the process"""
+        return {'name': self.name,
+                'pid': self.process.pid if self.process else None,
+                'running': self.running,
+                'uptime': self.uptime,
+                'restarts': self.restarts,
+                'exit_codes': list(self.exit_codes)}
+
+    def _write(self, data):
+        self.output.write(data)
+        if self._file is not None:
+            self._file.write(data)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Supervisor(object):
+    """Supervises the processes started in a node, with a single thread
+    draining their output and watching their exits"""
+
+    def __init__(self, node, buffer_size=OUTPUT_BUFFER_SIZE):
+        """:param node: the node in which the processes are started
+        :param buffer_size: the number of bytes of output kept per process"""
+        self.node = node
+        self.buffer_size = buffer_size
+        self._records = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wakeup = None
+        self._stopped = False
+
+    def spawn(self, args, kwargs, name=None, restart=None, output_file=None):
+        """Start a supervised process
+
+        :param args: the positional arguments of node.popen
+        :param kwargs: the keyword arguments of node.popen
+        :param name: the name of the process, its command if None
+        :param restart: the RestartPolicy of the process, None to never
+                        restart it
+        :param output_file: the path of a file also receiving its output
+        :return: the ProcessRecord of the process"""
+        if name is None:
+            cmd = args[0] if args else kwargs.get('args', '')
+            name = cmd if isinstance(cmd, basestring) else ' '.join(cmd)
+        record = ProcessRecord(name, args, kwargs, restart=restart,
+                               output_file=output_file,
+                               buffer_size=self.buffer_size)
+        self._start(record)
+        with self._lock:
+            self._stopped = False
+            self._records.append(record)
+            if self._thread is None:
+                self._wakeup = os.pipe()
+                self._thread = threading.Thread(
+                    target=self._loop, name='supervisor-%s' % self.node.name)
+                self._thread.daemon = True
+                self._thread.start()
+            else:
+                os.write(self._wakeup[1], b'x')
+        return record
+
+    def _start(self, record):
+        # The pipes still held open by the children of a previous run of
+        # the process are not drained anymore
+        for pipe in record._pipes:
+            pipe.close()
+        record.process = self.node.popen(*record.args, **record.kwargs)
+        record.started_at = time.time()
+        record.restart_at = None
+        record._pipes = [f for f in (record.process.stdout,
+                                     record.process.stderr) if f is not None]
+        # Reading a pipe must never block the supervisor, which could
+        # happen if the process lets its children inherit it
+        for pipe in record._pipes:
+            flags = fcntl.fcntl(pipe.fileno(), fcntl.F_GETFL)
+            fcntl.fcntl(pipe.fileno(), fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    @property
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def _drain(self, record, pipe):
+        """Read the available output of a process, without blocking
+
+        :return: True if data was read, None if there was nothing to read
+                 and False if the pipe is closed"""
+        try:
+            data = os.read(pipe.fileno(), 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return None
+            data = b''
+        if data:
+            record._write(data)
+            return True
+        record._pipes.remove(pipe)
+        pipe.close()
+        return False
+
+    def _drain_available(self, record):
+        """Read the output already written by a process, in a bounded
+        number of reads. The pipes still open are left to the main loop."""
+        for pipe in list(record._pipes):
+            for _ in range(MAX_DRAIN_READS):
+                if not self._drain(record, pipe):
+                    break
+
+    def _reap(self, record, now):
+        """Record the exit of a process and schedule its restart"""
+        self._drain_available(record)  # Keep the last words of the process
+        record.exit_codes.append(record.process.returncode)
+        if record.stopping or self._stopped:
+            return
+        delay = record.restart.delay(record) if record.restart else None
+        if record.returncode:
+            log.warning('%s: %s exited with code %d%s\n' % (
+                self.node.name, record.name, record.returncode,
+                '' if delay is None else ', restarting in %gs' % delay))
+        if delay is not None:
+            record.restart_at = now + delay
+
+    def _loop(self):
+        wakeup = self._wakeup[0]
+        while True:
+            now = time.time()
+            pipes = {}
+            timeout = CHECK_INTERVAL
+            with self._lock:
+                records = list(self._records)
+                if self._stopped:
+                    self._thread = None
+                    for fd in self._wakeup:
+                        os.close(fd)
+                    self._wakeup = None
+                    return
+            for record in records:
+                if record.restart_at is not None and not record.stopping:
+                    if record.restart_at <= now:
+                        record.restarts += 1
+                        log.info('%s: restarting %s\n'
+                                 % (self.node.name, record.name))
+                        try:
+                            self._start(record)
+                        except OSError as e:
+                            log.error('%s: cannot restart %s: %s\n'
+                                      % (self.node.name, record.name, e))
+                            record.restart_at = None
+                            continue
+                    else:
+                        timeout = min(timeout, record.restart_at - now)
+                if record.process is None:
+                    continue
+                if len(record.exit_codes) <= record.restarts and \
+                        record.process.poll() is not None:
+                    self._reap(record, now)
+                # The children of an exited process may still write to
+                # its pipes
+                for pipe in record._pipes:
+                    pipes[pipe.fileno()] = (record, pipe)
+            try:
+                ready = select.select([wakeup] + list(pipes), [], [],
+                                      max(0, timeout))[0]
+            except (IOError, OSError, select.error):
+                continue  # Interrupted by a signal
+            for fd in ready:
+                if fd == wakeup:
+                    os.read(wakeup, 4096)
+                else:
+                    self._drain(*pipes[fd])
+
+    def terminate(self, timeout=TERMINATE_TIMEOUT, deadline=None, pids=()):
+        """Terminate all processes, kill the ones still running after the
+        timeout and stop supervising them
+
+        :param timeout: the time given to the processes to exit, in seconds
+        :param deadline: the time at which the remaining processes are
+                         killed, overrides timeout
+        :param pids: other processes to terminate together, e.g., daemons
+                     running in the background
+        :return: the names of the processes that had to be killed"""
+        records = self.records
+        for record in records:
+            record.stopping = True
+            record.restart_at = None
+            self._signal(record, signal.SIGTERM)
+        signal_pids(pids, signal.SIGTERM)
+        if deadline is None:
+            deadline = time.time() + timeout
+        pending = [r for r in records if r.process is not None]
+        pids = [p for p in pids if is_alive(p)]
+        delay = .001
+        while (pending or pids) and time.time() < deadline:
+            time.sleep(min(delay, max(0, deadline - time.time())))
+            delay = min(.05, delay * 2)
+            pending = [r for r in pending if r.process.poll() is None]
+            pids = [p for p in pids if is_alive(p)]
+        for record in pending:
+            log.warning('%s: killing %s, still running at the deadline\n'
+                        % (self.node.name, record.name))
+            self._signal(record, signal.SIGKILL)
+        signal_pids(pids, signal.SIGKILL)
+        for record in pending:
+            try:
+                record.process.wait()
+            except OSError:
+                pass
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+            if self._wakeup is not None:
+                os.write(self._wakeup[1], b'x')
+        if thread is not None:
+            thread.join()
+        for record in records:
+            if record.process is not None and \
+                    len(record.exit_codes) <= record.restarts:
+                record.exit_codes.append(record.process.returncode)
+            self._drain_available(record)
+            for pipe in record._pipes:
+                pipe.close()
+            record._pipes = []
+            record._close()
+        return [r.name for r in pending] + [str(p) for p in pids]
+
+    @staticmethod
+    def _signal(record, sig):
+        if record.process is None or record.process.returncode is not None:
+            return
+        try:
+            record.process.send_signal(sig)
+        except OSError:
+            pass  # Process is already dead
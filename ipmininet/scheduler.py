@@ -0,0 +1,173 @@
+"""This module defines a scheduler running a graph of dependent tasks with
+a bounded pool of worker threads, e.g., to start or stop the nodes of a
+network in parallel while respecting the ordering constraints of each
+node."""
+import sys
+import threading
+from collections import OrderedDict, deque
+from multiprocessing import cpu_count
+
+from future.utils import raise_
+
+from mininet.log import lg as log
+
+
+def default_workers():
+    """The default number of worker threads. Tasks mostly wait for
+    subprocesses, hence we can use more threads than cpus."""
+    try:
+        cpus = cpu_count()
+    except NotImplementedError:
+        cpus = 1
+    return min(32, cpus + 4)
+
+
+class Task(object):
+    """A task of a TaskGraph"""
+
+    def __init__(self, name, func, deps=()):
+        """:param name: the unique name of the task
+        :param func: the function to call, without argument
+        :param deps: the names of the tasks that must be done before this
+                     one starts"""
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.name)
+
+
+class TaskGraph(object):
+    """A directed acyclic graph of tasks.
+
+    When run, tasks are started in insertion order as soon as all their
+    dependencies are done, by at most max_workers threads. If a task fails,
+    no new task is started and its exception is raised again once the
+    running tasks are over."""
+
+    def __init__(self, tasks=()):
+        """:param tasks: an initial iterable of Task"""
+        self._tasks = OrderedDict()
+        self.extend(tasks)
+
+    def add(self, name, func, deps=()):
+        """Add a new task to the graph
+
+        :param name: the unique name of the task
+        :param func: the function to call, without argument
+        :param deps: the names of the tasks that must be done before it
+        :return: the name of the task"""
+        return self.add_task(Task(name, func, deps))
+
+    def add_task(self, task):
+        if task.name in self._tasks:
+            raise ValueError('Task %s is defined twice' % task.name)
+        self._tasks[task.name] = task
+        return task.name
+
+    def extend(self, tasks):
+        """Add an iterable of Task to the graph"""
+        for t in tasks:
+            self.add_task(t)
+        return self
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, name):
+        return name in self._tasks
+
+    def _dependents(self):
+        """Return the number of dependencies of each task and the tasks
+        depending on each task
+
+        :raise ValueError: if a dependency is unknown or if there is a
+                           cycle"""
+        pending = OrderedDict((name, len(set(t.deps)))
+                              for name, t in self._tasks.items())
+        dependents = {name: [] for name in self._tasks}
+        for name, t in self._tasks.items():
+            for dep in set(t.deps):
+                try:
+                    dependents[dep].append(name)
+                except KeyError:
+                    raise ValueError('Task %s depends on the unknown task %s'
+                                     % (name, dep))
+        if len(self.order(dict(pending), dependents)) != len(self._tasks):
+            raise ValueError('The task graph contains a cycle')
+        return pending, dependents
+
+    def order(self, pending=None, dependents=None):
+        """Return the names of the tasks in the order in which they are run
+        by a single worker"""
+        if pending is None:
+            pending, dependents = self._dependents()
+            pending = dict(pending)
+        ready = deque(name for name in self._tasks if not pending[name])
+        order = []
+        while ready:
+            name = ready.popleft()
+            order.append(name)
+            for d in dependents[name]:
+                pending[d] -= 1
+                if not pending[d]:
+                    ready.append(d)
+        return order
+
+    def run(self, max_workers=None):
+        """Run all tasks of the graph
+
+        :param max_workers: the maximal number of tasks run concurrently,
+                            see default_workers() if None"""
+        if max_workers is None:
+            max_workers = default_workers()
+        if max_workers <= 1:
+            for name in self.order():
+                self._tasks[name].func()
+            return
+        pending, dependents = self._dependents()
+        ready = deque(name for name in self._tasks if not pending[name])
+        lock = threading.Condition()
+        state = {'running': 0, 'done': 0, 'error': None}
+
+        def worker():
+            while True:
+                with lock:
+                    while not ready and state['running'] and \
+                            state['error'] is None:
+                        lock.wait()
+                    if not ready or state['error'] is not None:
+                        # Nothing left to do, or a task failed
+                        lock.notify_all()
+                        return
+                    name = ready.popleft()
+                    state['running'] += 1
+                error = None
+                try:
+                    self._tasks[name].func()
+                except BaseException:
+                    error = sys.exc_info()
+                    log.debug('Task %s failed\n' % name)
+                with lock:
+                    state['running'] -= 1
+                    if error is not None:
+                        if state['error'] is None:
+                            state['error'] = error
+                    else:
+                        state['done'] += 1
+                        for d in dependents[name]:
+                            pending[d] -= 1
+                            if not pending[d]:
+                                ready.append(d)
+                    lock.notify_all()
+
+        workers = [threading.Thread(target=worker)
+                   for _ in range(min(max_workers, len(self._tasks)))]
+        for w in workers:
+            w.daemon = True
+            w.start()
+        for w in workers:
+            w.join()
+        if state['error'] is not None:
+            raise_(*state['error'])
@@ -0,0 +1,52 @@
+"""This module measures the time needed to start scripts using ipmininet,
+each in a new Python process.
+
+Usage: python -m ipmininet.startup_time [runs]"""
+from __future__ import print_function
+
+import subprocess
+import sys
+import time
+
+# The commands to measure, run with the current Python interpreter
+COMMANDS = (('import ipmininet', ['-c', 'import ipmininet']),
+            ('import ipmininet.ipnet', ['-c', 'import ipmininet.ipnet']),
+            ('python -m ipmininet.examples --help',
+             ['-m', 'ipmininet.examples', '--help']))
+
+
+def measure(args, runs=5):
+    """Run a Python command several times
+
+    :param args: the arguments of the Python interpreter
+    :param runs: the number of runs
+    :return: the sorted list of the durations of the runs, in seconds
+    :raise ValueError: if the command fails"""
+    timings = []
+    for _ in range(runs):
+        start = time.time()
+        p = subprocess.Popen([sys.executable] + list(args),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, err = p.communicate()
+        timings.append(time.time() - start)
+        if p.returncode:
+            raise ValueError('%s failed: %s' % (' '.join(args), err))
+    return sorted(timings)
+
+
+def startup_times(runs=5, commands=COMMANDS):
+    """Measure the startup time of each command
+
+    :return: the list of (command description, best time, median time)"""
+    results = []
+    for name, args in commands:
+        timings = measure(args, runs)
+        results.append((name, timings[0], timings[len(timings) // 2]))
+    return results
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print('%-40s %10s %10s' % ('Command', 'Best', 'Median'))
+    for name, best, median in startup_times(runs):
+        print('%-40s %8.1fms %8.1fms' % (name, best * 1000, median * 1000))
@@ -0,0 +1,144 @@
+"""This module reads the spanning tree state of the Linux bridges of the
+switches from sysfs, and waits for the spanning tree to converge.
+
+>>> net.start()
+>>> states = net.wait_stp_converged(timeout=60)
+>>> states['s1'].ports
+OrderedDict([('s1-eth1', 'forwarding'), ('s1-eth2', 'blocking')])"""
+import glob
+import os
+import time
+from collections import OrderedDict
+
+from mininet.log import lg as log
+
+SYSFS_NET = '/sys/class/net'
+# The port states, as numbered in /sys/class/net/<br>/brif/<port>/state
+PORT_STATES = {0: 'disabled', 1: 'listening', 2: 'learning',
+               3: 'forwarding', 4: 'blocking'}
+# The states of the ports whose role is not decided yet
+TRANSIENT_STATES = ('listening', 'learning')
+POLL_INTERVAL = .1
+
+
+class BridgeState(object):
+    """The spanning tree state of a bridge"""
+
+    def __init__(self, name, stp, bridge_id, root_id, ports):
+        """:param name: the name of the bridge
+        :param stp: whether the spanning tree protocol is enabled
+        :param bridge_id: the id of the bridge
+        :param root_id: the id of the root bridge, as known by this bridge
+        :param ports: an OrderedDict mapping the port names to their state,
+                      by port number"""
+        self.name = name
+        self.stp = stp
+        self.bridge_id = bridge_id
+        self.root_id = root_id
+        self.ports = ports
+
+    @property
+    def is_root(self):
+        return self.bridge_id is not None and self.bridge_id == self.root_id
+
+    @property
+    def converged(self):
+        """Whether all ports of the bridge have a stable state"""
+        return not self.stp or all(s not in TRANSIENT_STATES
+                                   for s in self.ports.values())
+
+    def __repr__(self):
+        return '%s(%s, root=%s, %s)' % (self.__class__.__name__, self.name,
+                                        self.root_id, dict(self.ports))
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _read_bridge_files(switch, sysfs):
+    """Return the content of the sysfs files of a bridge, by path relative
+    to its directory. The files of a switch in its own namespace are read
+    with a single command."""
+    directory = os.path.join(sysfs, str(switch))
+    patterns = [os.path.join(directory, 'bridge', f)
+                for f in ('stp_state', 'bridge_id', 'root_id')] + \
+               [os.path.join(directory, 'brif', '*', f)
+                for f in ('state', 'port_no')]
+    files = {}
+    if getattr(switch, 'inNamespace', False):
+        out = switch.cmd('grep -H . %s 2>/dev/null' % ' '.join(patterns))
+        for line in out.splitlines():
+            path, _, value = line.partition(':')
+            files[os.path.relpath(path, directory)] = value.strip()
+    else:
+        for pattern in patterns:
+            for path in glob.glob(pattern):
+                value = _read(path)
+                if value is not None:
+                    files[os.path.relpath(path, directory)] = value
+    return files
+
+
+def bridge_state(switch, sysfs=SYSFS_NET):
+    """Return the spanning tree state of the bridge of a switch
+
+    :param switch: the switch, or the name of a bridge of this namespace
+    :param sysfs: the directory of the network devices in sysfs
+    :return: a BridgeState"""
+    files = _read_bridge_files(switch, sysfs)
+    ports = []
+    for path, value in files.items():
+        parts = path.split(os.sep)
+        if parts[0] != 'brif' or parts[-1] != 'state':
+            continue
+        try:
+            number = int(files.get(os.path.join('brif', parts[1], 'port_no'),
+                                   '0'), 0)
+            state = PORT_STATES.get(int(value), value)
+        except ValueError:
+            continue
+        ports.append((number, parts[1], state))
+    return BridgeState(str(switch),
+                       stp=files.get(os.path.join('bridge', 'stp_state'),
+                                     '0') != '0',
+                       bridge_id=files.get(os.path.join('bridge',
+                                                        'bridge_id')),
+                       root_id=files.get(os.path.join('bridge', 'root_id')),
+                       ports=OrderedDict((name, state) for _, name, state
+                                         in sorted(ports)))
+
+
+def stp_states(switches, sysfs=SYSFS_NET):
+    """Return the spanning tree state of the bridges of switches
+
+    :return: an OrderedDict mapping the switch names to their BridgeState"""
+    return OrderedDict((str(s), bridge_state(s, sysfs)) for s in switches)
+
+
+def wait_stp_converged(switches, timeout=60, sysfs=SYSFS_NET,
+                       poll=POLL_INTERVAL):
+    """Wait until the ports of all bridges have a stable state
+
+    :param switches: the switches to wait for
+    :param timeout: the maximal number of seconds to wait
+    :param sysfs: the directory of the network devices in sysfs
+    :param poll: the number of seconds between two reads of the states
+    :return: the states of the bridges, as stp_states
+    :raise ValueError: if the bridges have not converged before timeout"""
+    deadline = time.time() + timeout
+    while True:
+        states = stp_states(switches, sysfs)
+        pending = [name for name, s in states.items() if not s.converged]
+        if not pending:
+            return states
+        if time.time() >= deadline:
+            log.error('The spanning tree has not converged on:',
+                      ', '.join(pending), '\n')
+            raise ValueError('The spanning tree has not converged after %ss'
+                             ' [%s]' % (timeout, ', '.join(pending)))
+        time.sleep(min(poll, max(0., deadline - time.time())))
@@ -1,17 +1,45 @@
 """
 SwitchHub class
 """
+from subprocess import PIPE
 
 from mininet.node import Node, Switch
-from mininet.log import info, warn
+from mininet.log import info, warn, error
 from mininet.moduledeps import pathCheck
 from mininet.util import quietRun
 
+from ipmininet.stp import bridge_state
+
+IPROUTE = 'iproute'
+BRCTL = 'brctl'
+# The VLAN of the untagged frames of the ports without vlan parameter
+DEFAULT_VLAN = 1
+
+
+def port_vlans( intf ):
+    """Return the VLAN of the untagged frames of a bridge port, given by its
+       vlan parameter, and the set of VLANs that it carries tagged, given by
+       its vlans parameter (e.g., on trunks between switches)"""
+    params = getattr( intf, 'params', {} )
+    return ( params.get( 'vlan', DEFAULT_VLAN ),
+             frozenset( params.get( 'vlans', () ) ) )
+
+
+def bridge_backend():
+    """Return IPROUTE if ip can create bridges with their STP settings,
+    BRCTL otherwise"""
+    usage = quietRun( 'ip link add type bridge help' )
+    if 'stp_state' in usage and 'priority' in usage:
+        return IPROUTE
+    return BRCTL
+
 
 class SwitchHub( Switch ):
     "Linux Bridge (with optional spanning tree) extended to include the hubs"
 
     nextPrio = 100  # next bridge priority for spanning tree
+    # How bridges are configured, IPROUTE or BRCTL, detected on setup if None
+    backend = None
 
     def __init__( self, name, stp=False, hub=False, prio=None, **kwargs ):
         """stp: use spanning tree protocol? (default False)
@@ -26,51 +54,141 @@ class SwitchHub( Switch ):
         Switch.__init__( self, name, **kwargs )
 
     def connected( self ):
-        "Are we forwarding yet?"
+        "Have all ports left the listening and learning states?"
+        return not self.stp or self.stpState().converged
+
+    def stpState( self ):
+        "Return the spanning tree state of the bridge, read from sysfs"
+        return bridge_state( self )
+
+    def ports( self ):
+        "Return the interfaces enslaved to the bridge"
+        return [ i for i in self.intfList() if self.name in i.name ]
+
+    def pathCosts( self ):
+        """Return the (port, cost) pairs of the ports with an STP path cost,
+           given by the stp_cost1 (resp. stp_cost2) parameter of the link
+           for the port on its first (resp. second) side"""
+        costs = []
+        for i in self.ports():
+            link = i.link
+            if link is None:
+                continue
+            key = 'stp_cost1' if i is link.intf1 else 'stp_cost2'
+            cost = None
+            # The parameters of the second interface take precedence
+            for intf in ( link.intf1, link.intf2 ):
+                cost = intf.params.get( key, cost )
+            if cost is not None:
+                costs.append( ( i, cost ) )
+        return costs
+
+    def vlanFiltering( self ):
+        "Do the ports of the bridge filter the frames by VLAN?"
+        return any( 'vlan' in i.params or 'vlans' in i.params
+                    for i in self.ports() )
+
+    def vlanBatch( self ):
+        """Return the bridge -batch commands assigning the ports to their
+           VLANs"""
+        lines = []
+        for i in self.ports():
+            access, tagged = port_vlans( i )
+            if access != DEFAULT_VLAN:
+                lines += [ 'vlan del dev %s vid %d' % ( i, DEFAULT_VLAN ),
+                           'vlan add dev %s vid %d pvid untagged' % (
+                               i, access ) ]
+            lines += [ 'vlan add dev %s vid %d' % ( i, vid )
+                       for vid in sorted( tagged - { access } ) ]
+        return lines
+
+    def batch( self ):
+        """Return the ip -batch commands (re)creating the bridge with its
+           ports, ageing, priority, STP, path costs and VLAN filtering"""
+        options = [ 'stp_state', '1' if self.stp else '0' ]
+        if self.vlanFiltering():
+            options += [ 'vlan_filtering', '1' ]
+        if self.hub:
+            options += [ 'ageing_time', '0' ]
         if self.stp:
-            return 'forwarding' in self.cmd( 'brctl showstp', self )
-        else:
-            return True
+            options += [ 'priority', str( self.prio ) ]
+        lines = [ 'link del dev %s' % self,
+                  'link add name %s type bridge %s' % ( self,
+                                                        ' '.join( options ) ) ]
+        lines += [ 'link set dev %s master %s' % ( i, self )
+                   for i in self.ports() ]
+        lines += [ 'link set dev %s type bridge_slave cost %d' % ( i, cost )
+                   for i, cost in self.pathCosts() ]
+        lines.append( 'link set dev %s up' % self )
+        return lines
+
+    def brctlCommands( self ):
+        """Return the brctl commands (re)creating the bridge, as used when
+           ip cannot configure bridges"""
+        cmds = [ 'ifconfig %s down' % self,
+                 'brctl delbr %s' % self,
+                 'brctl addbr %s' % self ]
+        if self.hub:
+            cmds.append( 'brctl setageing %s 0' % self )
+        if self.stp:
+            cmds += [ 'brctl setbridgeprio %s %s' % ( self, self.prio ),
+                      'brctl stp %s on' % self ]
+        if self.vlanFiltering():
+            cmds.append( 'echo 1 > /sys/class/net/%s/bridge/vlan_filtering'
+                         % self )
+        cmds += [ 'brctl addif %s %s' % ( self, i ) for i in self.ports() ]
+        cmds += [ 'bridge %s' % line for line in self.vlanBatch() ]
+        cmds += [ 'brctl setpathcost %s %s %d' % ( self, i, cost )
+                  for i, cost in self.pathCosts() ]
+        cmds.append( 'ifconfig %s up' % self )
+        return cmds
 
     def start( self, _controllers ):
-        "Start Linux bridge"
-        self.cmd( 'ifconfig', self, 'down' )
-        self.cmd( 'brctl delbr', self )
-        self.cmd( 'brctl addbr', self )
+        """Start Linux bridge, in a single ip -batch transaction (and a
+           bridge -batch one for VLANs) unless falling back to brctl"""
         if self.hub:
-            self.cmd( 'brctl setageing 0', self )
             print('THERE IS A HUB CONNECTED')
-        if self.stp:
-            self.cmd( 'brctl setbridgeprio', self, self.prio )
-            self.cmd( 'brctl stp', self, 'on' )
-        for i in self.intfList():
-            if self.name in i.name:
-                self.cmd( 'brctl addif', self, i )
-            link = i.link
-            if link is not None:
-                if 'stp_cost1' in link.intf1.params:
-                    portName = link.intf1
-                    node = str(portName).split('-')[0]
-                    self.cmd('brctl setpathcost %s %s %d'%(node, portName, link.intf1.params['stp_cost1']))
-                if 'stp_cost2' in link.intf1.params:
-                    portName = link.intf2
-                    node = str(portName).split('-')[0]
-                    self.cmd('brctl setpathcost %s %s %d'%(node, portName, link.intf1.params['stp_cost2']))
-                if 'stp_cost1' in link.intf2.params:  # redundant because of the two intf
-                    portName = link.intf1
-                    node = str(portName).split('-')[0]
-                    self.cmd('brctl setpathcost %s %s %d'%(node, portName, link.intf2.params['stp_cost1']))
-                if 'stp_cost2' in link.intf2.params:
-                    portName = link.intf2
-                    node = str(portName).split('-')[0]
-                    self.cmd('brctl setpathcost %s %s %d'%(node, portName, link.intf2.params['stp_cost2']))
-        self.cmd( 'ifconfig', self, 'up' )
+        if self.backend == BRCTL:
+            # One command per line, but a single round-trip to the shell
+            self.cmd( '; '.join( self.brctlCommands() ) )
+            return
+        # The bridge does not exist yet on the first start
+        self._runBatch( 'ip', self.batch(), ignored=( 1, ) )
+        if self.vlanFiltering():
+            self._runBatch( 'bridge', self.vlanBatch() )
+
+    def _runBatch( self, cmd, lines, ignored=() ):
+        """Run commands in one cmd -batch transaction, and report the
+           failures of the lines whose number is not ignored"""
+        p = self.popen( [ cmd, '-force', '-batch', '-' ], stdin=PIPE,
+                        stdout=PIPE, stderr=PIPE )
+        _, err = p.communicate( ( '\n'.join( lines ) + '\n' ).encode() )
+        failed = self._failedLines( err.decode( 'utf-8', 'replace' ) )
+        failed.difference_update( ignored )
+        if failed:
+            error( 'Cannot configure the bridge %s: %s\n' % (
+                self, ', '.join( lines[ n - 1 ] for n in sorted( failed ) ) ) )
+
+    @staticmethod
+    def _failedLines( err ):
+        "Return the line numbers of the failed commands of a -batch run"
+        failed = set()
+        for line in err.splitlines():
+            if line.startswith( 'Command failed -:' ):
+                try:
+                    failed.add( int( line.rsplit( ':', 1 )[ 1 ] ) )
+                except ValueError:
+                    pass
+        return failed
 
     def stop( self, deleteIntfs=True ):
         """Stop Linux bridge
            deleteIntfs: delete interfaces? (True)"""
-        self.cmd( 'ifconfig', self, 'down' )
-        self.cmd( 'brctl delbr', self )
+        if self.backend == BRCTL:
+            self.cmd( 'ifconfig', self, 'down' )
+            self.cmd( 'brctl delbr', self )
+        else:
+            self.cmd( 'ip link del dev', self )
         super( SwitchHub, self ).stop( deleteIntfs )
 
     def dpctl( self, *args ):
@@ -80,7 +198,10 @@ class SwitchHub( Switch ):
     @classmethod
     def setup( cls ):
         "Check dependencies and warn about firewalling"
-        pathCheck( 'brctl', moduleName='bridge-utils' )
+        if cls.backend is None:
+            cls.backend = bridge_backend()
+        if cls.backend == BRCTL:
+            pathCheck( 'brctl', moduleName='bridge-utils' )
         # Disable Linux bridge firewalling so that traffic can flow!
         for table in 'arp', 'ip', 'ip6':
             cmd = 'sysctl net.bridge.bridge-nf-call-%stables' % table
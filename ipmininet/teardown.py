@@ -0,0 +1,132 @@
+"""This module provides the building blocks to tear a network down quickly:
+signalling a set of processes and escalating from SIGTERM to SIGKILL at a
+deadline, finding processes with a single scan of /proc, and removing files
+in one sweep."""
+import errno
+import os
+import re
+import signal
+import time
+
+from mininet.log import lg as log
+
+# The default time given to processes to exit when terminated, in seconds
+TERMINATE_TIMEOUT = 5.
+
+
+def is_alive(pid):
+    """Return whether a process exists and is not a zombie"""
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            # The state follows the command name, which is in parentheses
+            return f.read().rpartition(')')[2].split()[0] != 'Z'
+    except (IOError, OSError, IndexError):
+        return False
+
+
+def signal_pids(pids, sig):
+    """Send a signal to a set of processes, ignoring the dead ones"""
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                log.debug('Cannot signal process %d: %s\n' % (pid, e))
+
+
+def wait_pids(pids, deadline, alive=is_alive):
+    """Wait until a set of processes are gone or until a deadline
+
+    :param pids: the processes
+    :param deadline: the time at which we stop waiting
+    :param alive: the function telling whether a process is running
+    :return: the processes still running"""
+    pending = [p for p in pids if alive(p)]
+    delay = .001
+    while pending and time.time() < deadline:
+        time.sleep(min(delay, max(0, deadline - time.time())))
+        delay = min(.05, delay * 2)
+        pending = [p for p in pending if alive(p)]
+    return pending
+
+
+def terminate_pids(pids, deadline):
+    """Send SIGTERM to a set of processes, and SIGKILL to the ones still
+    running at the deadline
+
+    :return: the processes that had to be killed"""
+    signal_pids(pids, signal.SIGTERM)
+    stubborn = wait_pids(pids, deadline)
+    signal_pids(stubborn, signal.SIGKILL)
+    return stubborn
+
+
+def read_pid_files(paths):
+    """Return the (pid file, pid) pairs of the processes still running
+    according to a set of pid files"""
+    pids = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                pid = int(f.read().strip())
+        except (IOError, OSError, ValueError):
+            continue
+        if pid != os.getpid() and is_alive(pid):
+            pids.append((path, pid))
+    return pids
+
+
+def cmdline(pid):
+    """Return the command line of a process, None if it does not exist"""
+    try:
+        with open('/proc/%d/cmdline' % pid, 'rb') as f:
+            return f.read().replace(b'\0', b' ').strip()\
+                .decode('utf-8', 'replace')
+    except (IOError, OSError):
+        return None
+
+
+def daemon_pids(pid_files):
+    """Return the pids of the daemons still running according to their pid
+    files, skipping the unrelated processes that reused the pid of a daemon
+    that is gone
+
+    :param pid_files: a dict mapping the pid files to the name of their
+                      daemon, which must appear in the command line of the
+                      process"""
+    return [pid for path, pid in read_pid_files(pid_files)
+            if pid_files[path] in (cmdline(pid) or '')]
+
+
+def scan_processes(patterns):
+    """Find the processes whose command line matches any pattern, by
+    reading /proc once. The patterns are regular expressions, as for
+    pkill -f.
+
+    :return: the list of (pid, command line)"""
+    if not patterns:
+        return []
+    regex = re.compile('|'.join('(?:%s)' % p for p in patterns))
+    me = os.getpid()
+    found = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit() or int(entry) == me:
+            continue
+        cmd = cmdline(int(entry))
+        if cmd and regex.search(cmd):
+            found.append((int(entry), cmd))
+    return found
+
+
+def remove_files(paths):
+    """Remove a set of files, ignoring the missing ones
+
+    :return: the number of removed files"""
+    removed = 0
+    for path in set(paths):
+        try:
+            os.unlink(path)
+            removed += 1
+        except (IOError, OSError):
+            pass
+    return removed
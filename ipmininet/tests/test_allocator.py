@@ -0,0 +1,69 @@
+"""This module tests the prefix allocation engine"""
+import pytest
+from ipaddress import ip_network, ip_interface
+
+from ipmininet.allocator import PrefixAllocator, SubnetIndex, interface_at
+
+
+def _nets(*nets):
+    return [ip_network(n) for n in nets]
+
+
+@pytest.mark.parametrize("indexed,net,overlaps,covers", [
+    ([], u"10.0.0.0/24", False, False),
+    ([u"10.0.0.0/24"], u"10.0.0.0/24", True, True),
+    ([u"10.0.0.0/24"], u"10.0.0.128/25", True, True),
+    ([u"10.0.0.0/24"], u"10.0.0.0/16", True, False),
+    ([u"10.0.0.0/24"], u"10.0.1.0/24", False, False),
+    ([u"10.0.0.0/24", u"10.0.0.0/26"], u"10.0.0.64/26", True, True),
+    ([u"10.0.2.0/24", u"10.0.0.0/24"], u"10.0.1.0/24", False, False),
+    ([u"2001:db8::/48"], u"2001:db8::/64", True, True),
+    ([u"2001:db8::/48"], u"10.0.0.0/8", False, False),
+])
+def test_subnet_index(indexed, net, overlaps, covers):
+    index = SubnetIndex(_nets(*indexed))
+    assert index.overlaps(ip_network(net)) == overlaps
+    assert index.covers(ip_network(net)) == covers
+
+
+def test_allocator_best_fit():
+    allocator = PrefixAllocator(_nets(u"10.0.0.0/16", u"10.1.0.0/23"))
+    assert allocator.allocate(24) == ip_network(u"10.1.0.0/24")
+    assert allocator.allocate(24) == ip_network(u"10.1.1.0/24")
+    assert allocator.allocate(25) == ip_network(u"10.0.0.0/25")
+    assert allocator.allocate(24) == ip_network(u"10.0.1.0/24")
+    assert allocator.allocate(25) == ip_network(u"10.0.0.128/25")
+
+
+def test_allocator_reserved():
+    allocator = PrefixAllocator(_nets(u"10.0.0.0/22"),
+                                reserved=_nets(u"10.0.0.0/24",
+                                               u"10.0.2.0/25"))
+    allocated = [allocator.allocate(24), allocator.allocate(25)]
+    assert allocated == _nets(u"10.0.1.0/24", u"10.0.2.128/25")
+    assert allocator.free_subnets() == _nets(u"10.0.3.0/24")
+    allocator.allocate(24)
+    with pytest.raises(ValueError):
+        allocator.allocate(24)
+
+
+def test_allocator_too_big():
+    allocator = PrefixAllocator(_nets(u"fc00::/48"))
+    with pytest.raises(ValueError):
+        allocator.allocate(32)
+    assert allocator.allocate(64) == ip_network(u"fc00::/64")
+
+
+@pytest.mark.parametrize("net,offset,expected", [
+    (u"10.0.0.0/24", 1, u"10.0.0.1/24"),
+    (u"10.0.0.0/24", 255, u"10.0.0.255/24"),
+    (u"fc00::/48", 1, u"fc00::1/48"),
+    (u"::/96", 1, u"::1/96"),
+])
+def test_interface_at(net, offset, expected):
+    assert interface_at(ip_network(net), offset) == ip_interface(expected)
+
+
+def test_interface_at_out_of_range():
+    with pytest.raises(IndexError):
+        interface_at(ip_network(u"10.0.0.0/31"), 2)
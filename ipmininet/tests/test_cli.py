@@ -1,5 +1,6 @@
 import os
 import re
+import subprocess
 import tempfile
 
 import pytest
@@ -91,6 +92,10 @@ def perm(*args):
                    "h2 --IPv6--> h1 "]),
     ("h1 echo h4", ["10.2.0.3"]),
     ("h1", ["*** Enter a command for node: h1 <cmd>"]),
+    ("hosts: echo h4", ["[h1] 10.2.0.3", "[h2] 10.2.0.3", "[h3] 10.2.0.3",
+                        "[h4] 10.2.0.3"]),
+    ("summary r1,r2,h1: echo same", ["*** r1, r2, h1 (3 nodes):", "same"]),
+    ("h1,invalid: echo", ["*** Unknown node or group: invalid"]),
     ("invalid_command", ["*** Unknown command: invalid_command"])
 ])
 def test_cli(tmp, net, input_line, expected_lines):
@@ -115,3 +120,79 @@ def test_cli(tmp, net, input_line, expected_lines):
             assert l in capture.out, \
                 "Line '%s' cannot be found in the output of '%s':\n%s" \
                 % (l, input_line, "\n".join(capture.out))
+
+
+class FakeShellNode(object):
+    """A node running the commands sent to its shell in a subprocess"""
+
+    def __init__(self, name, asn=None):
+        self.name = name
+        self.asn = asn
+        self.waiting = False
+        self.commands = []
+
+    def sendCmd(self, cmd):
+        self.commands.append(cmd)
+        env = dict(os.environ, NODE=self.name)
+        self.process = subprocess.Popen(
+            ['sh', '-c', cmd + '; printf "\\177"'], stdout=subprocess.PIPE,
+            env=env)
+        self.stdout = self.process.stdout
+        self.waiting = True
+
+    def monitor(self, timeoutms=None):
+        data = os.read(self.stdout.fileno(), 1024).decode()
+        if chr(127) in data:
+            self.waiting = False
+            self.process.wait()
+            self.stdout.close()
+        return data.replace(chr(127), '')
+
+    def sendInt(self):
+        self.process.terminate()
+
+
+class FakeNet(dict):
+
+    def __init__(self, routers, hosts):
+        self.routers, self.hosts, self.switches = routers, hosts, []
+        super(FakeNet, self).__init__((n.name, n) for n in routers + hosts)
+
+
+def _cli():
+    cli = IPCLI.__new__(IPCLI)
+    cli.mn = FakeNet([FakeShellNode('r1', 65001), FakeShellNode('r2', 65002),
+                      FakeShellNode('r3', 65001)],
+                     [FakeShellNode('h1')])
+    return cli
+
+
+def test_select_nodes():
+    cli = _cli()
+    names = lambda selector: [n.name for n in cli.select_nodes(selector)]
+    assert names('routers') == ['r1', 'r2', 'r3']
+    assert names('hosts, r2') == ['h1', 'r2']
+    assert names('r3,as65001,all') == ['r3', 'r1', 'r2', 'h1']
+    with pytest.raises(ValueError):
+        cli.select_nodes('r1,as')
+
+
+def test_fanout():
+    cli = _cli()
+    # r1 is the slowest, but the output of the others is not delayed
+    cmd = 'echo $NODE-1; case $NODE in r1) sleep .3;; esac; echo $NODE-2'
+    with CLICapture("info") as capture:
+        cli.onecmd('r1,as65001,r2: ' + cmd)
+    assert [n.commands for n in cli.mn.routers] == [[cmd]] * 3
+    assert sorted(capture.out) == sorted('[%s] %s-%d' % (n, n, i)
+                                         for n in ('r1', 'r2', 'r3')
+                                         for i in (1, 2))
+    assert capture.out[-1] == '[r1] r1-2'
+
+    with CLICapture("info") as capture:
+        # Partial lines are printed once complete
+        cli.onecmd('h1: printf a; sleep .1; echo b; printf c')
+        cli.onecmd('summary all: echo $NODE | cut -c1')
+    assert capture.out == ['[h1] ab', '[h1] c',
+                           '*** r1, r2, r3 (3 nodes):', 'r',
+                           '*** h1 (1 node):', 'h']
@@ -0,0 +1,76 @@
+"""This module tests the tracing of the commands run in the nodes"""
+import io
+import json
+import subprocess
+
+import pytest
+
+from mininet.node import Node
+
+from ipmininet.cmdtrace import CommandTracer, LatencyHistogram
+
+
+class FakeNode(Node):
+    """A node running its commands in the host, without a shell"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def cmd(self, *args, **kwargs):
+        return self.pexec(*args, shell=True)[0]
+
+    def popen(self, *args, **kwargs):
+        cmd = args[0] if len(args) == 1 else list(args)
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                shell=kwargs.get('shell', False))
+
+
+def _configure(node):
+    node.cmd('true')
+    node.pexec(['echo', 'a'])
+
+
+def test_histogram():
+    h = LatencyHistogram()
+    for d in (.00005, .0003, .0003, .002, 2.):
+        h.add(d)
+    assert h.count == 5 and h.max == 2.
+    assert h.buckets[0] == 1 and h.buckets[2] == 2 and h.buckets[-1] == 1
+    assert h.percentile(50) == .0005
+    assert h.percentile(100) == 2.
+    assert h.to_dict()['slower'] == 1
+
+
+def test_trace_commands():
+    original = Node.cmd
+    r1, r2 = FakeNode('r1'), FakeNode('r2')
+    with CommandTracer(keep=10) as tracer:
+        with pytest.raises(ValueError):
+            CommandTracer().install()
+        for node in (r1, r2):
+            _configure(node)
+        r1.popen('echo', 'b').communicate()
+    assert Node.cmd is original
+    r1.cmd('true')  # Not traced anymore
+
+    # The nested pexec and popen calls are not counted
+    assert tracer.total.count == 5
+    assert tracer.by_node['r1'].count == 3
+    assert tracer.by_node['r2'].count == 2
+    assert tracer.by_method['cmd'].count == 2
+    assert tracer.by_program['echo'].count == 3
+    assert tracer.by_subsystem == {__name__: tracer.by_subsystem[__name__]}
+    sites = [s for s in tracer.by_site if '(_configure)' in s]
+    assert len(sites) == 2
+    assert all(tracer.by_site[s].count == 2 for s in sites)
+    assert tracer.records[-1][:3] == ('r1', 'popen', 'echo b')
+
+    report = io.StringIO()
+    tracer.write_json(report, top=2)
+    report = json.loads(report.getvalue())
+    assert report['total']['count'] == 5
+    assert len(report['call_sites']) == 2
+    summary = tracer.summary(top=1)
+    assert summary.startswith('5 commands')
+    assert 'Top call sites' in summary
@@ -0,0 +1,75 @@
+"""This module tests the timing of the phases of the network lifecycle"""
+import io
+import json
+import time
+
+import pytest
+
+from ipmininet.instrumentation import Tracer, NULL_TRACER
+from ipmininet.scheduler import TaskGraph
+
+
+def _work():
+    return sum(i * i for i in range(10000))
+
+
+def test_nested_spans():
+    tracer = Tracer()
+    with tracer.span('build'):
+        with tracer.span('broadcast_domains', domains=3):
+            time.sleep(.01)
+        with pytest.raises(ValueError):
+            with tracer.span('allocate_IPs'):
+                raise ValueError('no more addresses')
+    with tracer.span('start'):
+        graph = TaskGraph()
+        for name in ('r1:config', 'r2:config', 'r3:config'):
+            graph.add(name, tracer.wrap(name, _work))
+        graph.run(max_workers=3)
+
+    [build, start] = tracer.roots
+    assert [c.name for c in build.children] == ['broadcast_domains',
+                                                'allocate_IPs']
+    domains, allocate = build.children
+    assert domains.attrs == {'domains': 3} and domains.duration >= .01
+    assert 'no more addresses' in allocate.error
+    # Tasks run by worker threads are nested in the span that runs them
+    assert sorted(c.name for c in start.children) == ['r1:config',
+                                                      'r2:config',
+                                                      'r3:config']
+    assert [(depth, s.name) for depth, s in tracer.spans()][:3] == \
+        [(0, 'build'), (1, 'broadcast_domains'), (1, 'allocate_IPs')]
+
+    report = io.StringIO()
+    tracer.write_json(report)
+    spans = json.loads(report.getvalue())['spans']
+    assert [s['name'] for s in spans] == ['build', 'start']
+    assert spans[0]['children'][0]['attrs'] == {'domains': 3}
+    summary = tracer.summary().splitlines()
+    assert len(summary) == 1 + 7
+    assert summary[2].startswith('  broadcast_domains')
+    assert 'no more addresses' in summary[3]
+
+
+def test_profile_and_memory():
+    tracer = Tracer(profile=['render'], trace_memory=True)
+    try:
+        with tracer.span('render'):
+            _work()
+            data = [bytearray(1024) for _ in range(100)]
+        with tracer.span('start'):
+            pass
+    finally:
+        tracer.close()
+    render, start = tracer.roots
+    assert any('_work' in f['function'] for f in render.profile)
+    assert start.profile is None
+    assert render.memory >= 100 * 1024
+    assert len(data) == 100
+
+
+def test_disabled_tracer():
+    with NULL_TRACER.span('build') as span:
+        assert span is None
+    assert NULL_TRACER.wrap('task', _work) is _work
+    assert not NULL_TRACER.roots
@@ -0,0 +1,132 @@
+"""This module tests the longest-prefix match index of IP addresses"""
+import pytest
+from ipaddress import ip_network, ip_interface
+
+from ipmininet.ipindex import PrefixTrie, IPIndex
+from ipmininet.ipnet import BroadcastDomain
+from ipmininet.link import IPIntf, AddressBatch
+
+
+@pytest.fixture
+def trie():
+    t = PrefixTrie()
+    for net in (u"10.0.0.0/8", u"10.0.0.0/24", u"10.0.1.0/24",
+                u"10.0.0.1/32", u"192.168.0.0/16", u"2001:db8::/32",
+                u"2001:db8:1::/48", u"::/0"):
+        t[net] = net
+    return t
+
+
+@pytest.mark.parametrize("ip,expected", [
+    (u"10.0.0.1", u"10.0.0.1/32"),
+    (u"10.0.0.2", u"10.0.0.0/24"),
+    (u"10.0.1.2/24", u"10.0.1.0/24"),
+    (u"10.0.0.0/23", u"10.0.0.0/8"),
+    (u"10.2.0.0/16", u"10.0.0.0/8"),
+    (u"172.16.0.1", None),
+    (u"192.168.1.1", u"192.168.0.0/16"),
+    (u"2001:db8:1:2::1", u"2001:db8:1::/48"),
+    (u"2001:db8:2::1", u"2001:db8::/32"),
+    (u"fc00::1", u"::/0"),
+])
+def test_longest_match(trie, ip, expected):
+    match = trie.longest_match(ip)
+    if expected is None:
+        assert match is None
+    else:
+        assert match == (ip_network(expected), expected)
+
+
+def test_exact_match(trie):
+    assert len(trie) == 8
+    assert trie[u"10.0.0.0/24"] == u"10.0.0.0/24"
+    assert u"10.0.0.0/16" not in trie
+    assert trie.get(u"10.0.0.2") is None
+    with pytest.raises(KeyError):
+        trie[u"0.0.0.0/0"]
+    assert trie.setdefault(u"10.0.0.0/24", []) == u"10.0.0.0/24"
+    assert trie.setdefault(u"10.0.0.0/16", []) == []
+    assert len(trie) == 9
+    trie[u"10.0.0.0/24"] = 1
+    assert trie[u"10.0.0.0/24"] == 1
+    assert len(trie) == 9
+
+
+class _FakeIntf(object):
+    def __init__(self, node, *ips):
+        self.node = node
+        self.broadcast_domain = None
+        self.addresses = [ip_interface(ip) for ip in ips]
+        node.intfs.append(self)
+
+    def ips(self):
+        return (ip for ip in self.addresses if ip.version == 4)
+
+    def ip6s(self, exclude_lls=False):
+        return (ip for ip in self.addresses if ip.version == 6 and
+                not (exclude_lls and ip.is_link_local))
+
+
+class _FakeNode(object):
+    def __init__(self, name):
+        self.name = name
+        self.intfs = []
+
+    def intfList(self):
+        return self.intfs
+
+
+def test_ip_index():
+    h1, r1 = _FakeNode('h1'), _FakeNode('r1')
+    _FakeIntf(h1, u"127.0.0.1/8", u"::1/128")
+    _FakeIntf(r1, u"127.0.0.1/8", u"::1/128")
+    h1_eth0 = _FakeIntf(h1, u"10.0.0.2/24", u"2001:db8::2/64",
+                        u"fe80::2/64")
+    r1_eth0 = _FakeIntf(r1, u"10.0.0.1/24", u"2001:db8::1/64",
+                        u"fe80::1/64")
+    index = IPIndex([h1, r1])
+
+    assert index.node_for_ip(u"10.0.0.1") is r1
+    assert index.node_for_ip(u"10.0.0.2/24") is h1
+    assert index.interface_for_ip(u"2001:db8::2") is h1_eth0
+    for ip in (u"10.0.0.3", u"127.0.0.1", u"fe80::1", u"not an ip"):
+        with pytest.raises(KeyError):
+            index.node_for_ip(ip)
+    assert index.interfaces_for_subnet(u"10.0.0.3") == [h1_eth0, r1_eth0]
+    assert index.interfaces_for_subnet(u"10.0.1.3") == []
+
+
+def test_ip_index_follows_set_ip():
+    r1 = _FakeNode('r1')
+    r1_eth0 = IPIntf.__new__(IPIntf)
+    r1_eth0.name, r1_eth0.node = 'r1-eth0', r1
+    r1_eth0._addresses = {4: [ip_interface(u"10.0.0.1/24")], 6: []}
+    r1_eth0._addresses_loaded = True
+    r1.intfs.append(r1_eth0)
+    index = IPIndex([r1])
+    assert index.node_for_ip(u"10.0.0.1") is r1
+
+    batch = AddressBatch()
+    r1_eth0.setIP([u"10.0.1.1/24", u"2001:db8::1/64"], batch=batch)
+    assert len(batch) == 3
+    assert index.node_for_ip(u"10.0.1.1") is r1
+    assert index.node_for_ip(u"2001:db8::1") is r1
+    assert index.interfaces_for_subnet(u"10.0.1.0/25") == [r1_eth0]
+    with pytest.raises(KeyError):
+        index.node_for_ip(u"10.0.0.1")
+
+
+def test_broadcast_domain_follows_set_ip():
+    r1, r2 = _FakeNode('r1'), _FakeNode('r2')
+    itfs = []
+    for node, ips in ((r1, [ip_interface(u"10.0.0.1/24")]), (r2, [])):
+        itf = IPIntf.__new__(IPIntf)
+        itf.name, itf.node, itf.params = node.name + '-eth0', node, {}
+        itf._addresses = {4: ips, 6: []}
+        itf._addresses_loaded = True
+        itfs.append(itf)
+    domain = BroadcastDomain(itfs, explore=False)
+    assert (domain.len_v4(), domain.len_v6()) == (1, 0)
+
+    itfs[1].setIP([u"10.0.0.2/24", u"2001:db8::2/64"], batch=AddressBatch())
+    assert (domain.len_v4(), domain.len_v6()) == (2, 1)
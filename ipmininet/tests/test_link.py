@@ -4,7 +4,8 @@ from ipaddress import ip_interface
 from ipmininet.clean import cleanup
 from ipmininet.examples.static_address_network import StaticAddressNet
 from ipmininet.ipnet import IPNet
-from ipmininet.link import OrderedAddress
+from ipmininet.link import OrderedAddress, IPIntf, AddressBatch,\
+    _monitored_device
 from ipmininet.tests import require_root
 
 
@@ -69,3 +70,60 @@ def test_addr_intf():
         net.stop()
     finally:
         cleanup()
+
+
+class FakeNode(object):
+    """A node recording the ip commands it receives"""
+
+    class Process(object):
+        returncode = 0
+
+        def __init__(self, node):
+            self.node = node
+
+        def communicate(self, data):
+            self.node.batches.append(data.decode('utf-8').splitlines())
+            return b'', b''
+
+    def __init__(self):
+        self.batches = []
+
+    def popen(self, *args, **kwargs):
+        return FakeNode.Process(self)
+
+
+def test_batched_set_ip():
+    node = FakeNode()
+    itf = IPIntf.__new__(IPIntf)
+    itf.name, itf.node = 'r1-eth0', node
+    itf.addresses = {4: [ip_interface(u"10.0.0.1/24")],
+                     6: [ip_interface(u"fe80::1/64"),
+                         ip_interface(u"2001::1/64")]}
+    batch = AddressBatch()
+    itf.setIP(u"10.1.0.1/24", batch=batch)
+    itf.setIP6([ip_interface(u"2001::2/64"), u"2002::2"], prefixLen=48,
+               batch=batch)
+    assert node.batches == [], "Address changes were applied too early"
+    assert [ip.with_prefixlen for ip in itf.ips()] == [u"10.1.0.1/24"]
+    assert ([ip.with_prefixlen for ip in itf.ip6s()] ==
+            [u"2002::2/48", u"2001::2/64", u"fe80::1/64"])
+    batch.apply()
+    assert node.batches == [["address del dev r1-eth0 10.0.0.1/24",
+                             "address add dev r1-eth0 10.1.0.1/24",
+                             "address del dev r1-eth0 2001::1/64",
+                             "address add dev r1-eth0 2001::2/64",
+                             "address add dev r1-eth0 2002::2/48"]]
+    assert len(batch) == 0
+
+
+@pytest.mark.parametrize("line,expected", [
+    ("3: r1-eth0    inet 10.0.0.1/24 scope global r1-eth0\\       valid_lft"
+     " forever preferred_lft forever", "r1-eth0"),
+    ("Deleted 3: r1-eth0    inet6 2001::1/64 scope global", "r1-eth0"),
+    ("[ADDR]4: h1-eth1    inet6 2001::a/64 scope global dynamic", "h1-eth1"),
+    ("3: r1-eth0@if2: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc"
+     " noqueue state UP", "r1-eth0"),
+    ("Deleted ff02::1 dev lo lladdr 33:33:00:00:00:01 NOARP", None),
+])
+def test_monitored_device(line, expected):
+    assert _monitored_device(line) == expected
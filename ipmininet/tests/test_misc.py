@@ -1,5 +1,6 @@
 import os
 import subprocess
+import sys
 
 import ipaddress
 import pytest
@@ -8,7 +9,9 @@ import ipmininet.utils as utils
 from ipmininet.clean import cleanup
 from ipmininet.examples.static_address_network import StaticAddressNet
 from ipmininet.ipnet import IPNet
-from ipmininet.link import _parse_addresses
+from ipmininet.link import _parse_addresses, _parse_address_dump
+from ipmininet.router.__router import sysctl_script, parse_sysctl_output
+from ipmininet.router.config.base import RouterIdAllocator
 from ipmininet.router.config.utils import ip_statement
 from . import require_root
 
@@ -76,6 +79,20 @@ def test_ip_address_format():
     assert len(out.strip('\n').split('\n')) == (2 + 2 * len(v4) + 2 * len(v6))
 
 
+def test_ip_address_dump_format():
+    """
+    Check that we can split the output of ip address for all interfaces
+    """
+    out = subprocess.check_output(['ip', 'address', 'show']).decode("utf-8")
+    dump = _parse_address_dump(out)
+    assert 'lo' in dump
+    for name, (mac, v4, v6, state) in dump.items():
+        single = subprocess.check_output(['ip', 'address', 'show', 'dev',
+                                          name]).decode("utf-8")
+        assert (mac, v4, v6) == _parse_addresses(single)
+        assert 'state %s' % state in single
+
+
 @pytest.mark.parametrize("cmd,present", [
     ("ls", True),
     ("/bin/sh", True),
@@ -151,3 +168,147 @@ def test_find_node(start, node, present):
 ])
 def test_ip_statement(test_input, expected):
     assert ip_statement(test_input) == expected
+
+
+def test_disjoint_set():
+    ds = utils.DisjointSet(range(6))
+    ds.union(0, 1)
+    ds.union(2, 3)
+    ds.union(1, 3)
+    assert ds.find(0) == ds.find(2) == ds.find(3)
+    assert ds.find(4) != ds.find(0)
+    assert ds.find(5) != ds.find(4)
+    assert 5 in ds and 6 not in ds
+    ds.union(6, 4)
+    assert 6 in ds and ds.find(6) == ds.find(4)
+
+
+class _FakeConfig(object):
+    def __init__(self, preferred=None):
+        self.preferred = preferred
+        self.routerid = None
+
+    def preferred_routerid(self):
+        return self.preferred
+
+
+class _FakeRouter(object):
+    def __init__(self, name, preferred=None):
+        self.name = name
+        self.config = _FakeConfig(preferred)
+
+
+def test_routerid_allocator():
+    routers = [_FakeRouter('r1'), _FakeRouter('r2', u'0.0.0.1'),
+               _FakeRouter('r3'), _FakeRouter('r4', u'0.0.0.3'),
+               _FakeRouter('r5', u'10.0.0.1')]
+    RouterIdAllocator(routers).allocate()
+    assert [r.config.routerid for r in routers] == \
+        [u'0.0.0.2', u'0.0.0.1', u'0.0.0.4', u'0.0.0.3', u'10.0.0.1']
+    # Already allocated router ids are kept
+    new = _FakeRouter('r6')
+    RouterIdAllocator(routers + [new]).allocate()
+    assert routers[0].config.routerid == u'0.0.0.2'
+    assert new.config.routerid == u'0.0.0.5'
+
+
+class _FakeNode(object):
+    def __init__(self, name, asn=None):
+        self.name = name
+        self.asn = asn
+        self.intfs = []
+
+    def intfList(self):
+        return self.intfs
+
+
+class _FakeL3Router(_FakeNode, utils.L3Router):
+    pass
+
+
+class _FakeDomain(object):
+    def __init__(self, *intfs):
+        self.interfaces = list(intfs)
+        self.routers = [i for i in intfs
+                        if utils.L3Router.is_l3router_intf(i)]
+        for i in intfs:
+            i.broadcast_domain = self
+
+
+class _FakeIntf(object):
+    def __init__(self, node):
+        self.name = '%s-eth%d' % (node.name, len(node.intfs))
+        self.node = node
+        node.intfs.append(self)
+
+
+def test_adjacency_index():
+    h1 = _FakeNode('h1')
+    r1, r2 = _FakeL3Router('r1', 1), _FakeL3Router('r2', 1)
+    r3, r4 = _FakeL3Router('r3', 2), _FakeL3Router('r4', 2)
+    _FakeDomain(_FakeIntf(h1), _FakeIntf(r1))
+    _FakeDomain(_FakeIntf(r1), _FakeIntf(r2))
+    _FakeDomain(_FakeIntf(r2), _FakeIntf(r3))
+    _FakeDomain(_FakeIntf(r3), _FakeIntf(r4))
+    index = utils.AdjacencyIndex([h1, r1, r2, r3, r4])
+
+    assert utils.adjacency_index(r1) is index
+    assert utils.find_node(h1, 'r4') is r4.intfs[0]
+    assert utils.find_node(r4, 'h1') is h1.intfs[0]
+    assert utils.find_node(h1, 'None') is None
+    # The exploration of the peers stays within the AS of the base router
+    assert index.find_peer(r1, 'r3') is r3.intfs[0]
+    assert index.find_peer(r1, 'r4') is None
+    assert index.find_peer(r3, 'r1') is None
+    assert index.find_peer(r4, 'r2') is r2.intfs[1]
+
+
+def test_sysctl_script(tmpdir):
+    tmpdir.join('net', 'ipv4').ensure(dir=True)
+    tmpdir.join('net', 'ipv4', 'ip_forward').write('0\n')
+    tmpdir.join('net', 'ipv4', 'conf', 'r1-eth0.10').ensure(dir=True)
+    tmpdir.join('net', 'ipv4', 'conf', 'r1-eth0.10', 'rp_filter')\
+        .write('1\n')
+    tmpdir.join('net', 'ipv4', 'tcp_rmem').write('4096\t87380\t6291456\n')
+    values = [('net.ipv4.ip_forward', 1),
+              ('net/ipv4/conf/r1-eth0.10/rp_filter', 0),
+              ('net.ipv4.tcp_rmem', '4096\t87380\t6291456'),
+              ('net.ipv4.missing', 1)]
+    p = subprocess.Popen(['sh', '-c', sysctl_script(values, str(tmpdir))],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         universal_newlines=True)
+    out, err = p.communicate()
+    assert parse_sysctl_output(out) == {
+        'net.ipv4.ip_forward': '0',
+        'net/ipv4/conf/r1-eth0.10/rp_filter': '1',
+        'net.ipv4.tcp_rmem': '4096\t87380\t6291456'}
+    assert 'net.ipv4.missing' in err
+    assert tmpdir.join('net', 'ipv4', 'ip_forward').read() == '1\n'
+    assert tmpdir.join('net', 'ipv4', 'conf', 'r1-eth0.10', 'rp_filter')\
+        .read() == '0\n'
+
+
+def test_lazy_daemon_imports():
+    script = ('import sys\n'
+              'import ipmininet.router.config as config\n'
+              'assert "ipmininet.router.config.sshd" not in sys.modules\n'
+              'assert "SSHd" in dir(config)\n'
+              'from ipmininet.router.config import SSHd, BGP\n'
+              'assert SSHd.__module__ == "ipmininet.router.config.sshd"\n'
+              'import ipmininet.router.config.sshd as sshd\n'
+              'assert not sshd._keys\n'
+              'from ipmininet.router.config import *\n'
+              'assert OpenrDomain and ebgp_session\n')
+    assert subprocess.call([sys.executable, '-c', script]) == 0
+
+
+@pytest.mark.skipif(not utils.has_cmd('ssh-keygen'),
+                    reason='ssh-keygen is not installed')
+def test_ssh_keys_generated_once():
+    from ipmininet.router.config import sshd
+    keys = sshd.ssh_keys()
+    assert sshd.ssh_keys() == keys
+    assert all(os.path.isfile(f) for f in keys)
+    # The former module constants are still available
+    from ipmininet.router.config.sshd import KEYFILE, PUBKEY
+    assert (KEYFILE, PUBKEY) == keys
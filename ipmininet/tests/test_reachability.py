@@ -0,0 +1,81 @@
+"""This module tests the concurrent reachability engine"""
+import os
+import stat
+import subprocess
+
+import ipmininet.ipnet
+from ipmininet.ipnet import IPNet
+from ipmininet.reachability import PingEngine, PingResult, ReachabilityMatrix
+
+# Answers to pings towards 10.0.0.2 and drops the others
+FAKE_PING = """#!/bin/sh
+for ip; do :; done
+echo "PING $ip ($ip) 56(84) bytes of data."
+if [ "$ip" = "10.0.0.2" ]; then
+    echo "1 packets transmitted, 1 received, 0% packet loss, time 0ms"
+    echo "rtt min/avg/max/mdev = 0.040/0.045/0.050/0.005 ms"
+else
+    echo "1 packets transmitted, 0 received, 100% packet loss, time 0ms"
+fi
+"""
+
+
+class FakeNode(object):
+    def __init__(self, name):
+        self.name = name
+
+    def popen(self, *args, **kwargs):
+        return subprocess.Popen(*args, **kwargs)
+
+
+def test_ping_engine(tmpdir, monkeypatch):
+    ping = tmpdir.join('ping')
+    ping.write(FAKE_PING)
+    os.chmod(str(ping), stat.S_IRWXU)
+    monkeypatch.setenv('PATH', '%s:%s' % (tmpdir, os.environ['PATH']))
+
+    h1, h2, h3 = FakeNode('h1'), FakeNode('h2'), FakeNode('h3')
+    probes = [(h1, h2, '10.0.0.2', 4), (h1, h3, '10.0.0.3', 4),
+              (h3, h2, '10.0.0.2', 4)]
+    matrix = PingEngine(max_probers=1).run(probes)
+
+    assert len(matrix) == 3
+    assert matrix['h1', 'h2', 4].received == 1
+    assert matrix['h1', 'h2', 4].rtt == 0.045
+    assert matrix['h1', 'h3', 4].lost == 1
+    assert matrix['h1', 'h3', 4].rtt is None
+    assert [r.dst for r in matrix.results_from(h1, 4)] == [h2, h3]
+    assert matrix.results_from(h1, 6) == []
+    assert (matrix.sent, matrix.received) == (3, 2)
+    assert round(matrix.loss()) == 33
+
+
+def test_results_by_source():
+    h1, h2, h3 = FakeNode('h1'), FakeNode('h2'), FakeNode('h3')
+    matrix = ReachabilityMatrix()
+    for src, dst, version in ((h1, h2, 4), (h2, h1, 4), (h1, h3, 4),
+                              (h1, h2, 6)):
+        matrix.add(PingResult(src, dst, None, version, 1, 0))
+    # A new result for the same pair replaces the previous one in place
+    matrix.add(PingResult(h1, h2, None, 4, 1, 1))
+    assert [(r.dst, r.received) for r in matrix.results_from(h1, 4)] == \
+        [(h2, 1), (h3, 0)]
+    assert [r.dst for r in matrix.results_from(h1, 6)] == [h2]
+    assert matrix.results_from(h3, 4) == []
+    assert len(matrix) == 4
+
+
+def test_ping_output(monkeypatch):
+    h1, h2, h3 = FakeNode('h1'), FakeNode('h2'), FakeNode('h3')
+    matrix = ReachabilityMatrix()
+    matrix.add(PingResult(h1, h2, None, 4, 1, 1))
+    matrix.add(PingResult(h1, h3, None, 4, 1, 0))
+    monkeypatch.setattr(ipmininet.ipnet.PingEngine, 'run',
+                        lambda self, probes: matrix)
+    monkeypatch.setattr(IPNet, '_ping_probes', lambda *args: [])
+    lines = []
+    monkeypatch.setattr(ipmininet.ipnet.log, 'output', lines.append)
+    net = IPNet.__new__(IPNet)
+    assert net.ping([h1, h2, h3], use_v6=False) == 50
+    # Each destination is followed by a space, as the CLI tests expect
+    assert 'h1 --IPv4--> h2 X \n' in lines
@@ -0,0 +1,134 @@
+"""This module tests the readiness probes of the daemons"""
+import os
+import socket
+import subprocess
+import threading
+
+from ipmininet.router.config import Zebra
+from ipmininet.router.config.base import Daemon
+from ipmininet.router.config.readiness import ReadinessMonitor, \
+    UnixSocketProbe, TCPPortProbe, PidFileProbe, LogLineProbe, CallableProbe
+
+
+def _later(func, delay=.05):
+    t = threading.Timer(delay, func)
+    t.start()
+    return t
+
+
+def test_unix_socket(tmpdir):
+    path = str(tmpdir.join('daemon.api'))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe = UnixSocketProbe(path)
+    try:
+        assert not probe.check()
+        # The socket is created before it accepts connections
+        sock.bind(path)
+        assert not probe.check()
+        _later(sock.listen)
+        readiness = ReadinessMonitor().wait_ready('r1:zebra', [probe],
+                                                  timeout=5)
+        assert readiness.error is None and readiness.ready_at is not None
+    finally:
+        sock.close()
+
+
+class _Node(object):
+    name = 'r1'
+
+    def __init__(self, cwd):
+        self.cwd = cwd
+
+
+def test_zebra_listening(tmpdir):
+    zebra = Zebra.__new__(Zebra)
+    zebra._node = _Node(str(tmpdir))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        assert not zebra.listening() and not zebra.has_started()
+        sock.bind(zebra.zebra_socket)
+        sock.listen(1)
+        assert zebra.listening() and zebra.has_started()
+    finally:
+        sock.close()
+
+
+class _PolledDaemon(Daemon):
+    NAME = 'polled'
+    POLL_HAS_STARTED = True
+    startup_line = dry_run = 'true'
+    started = False
+
+    def set_defaults(self, defaults):
+        pass
+
+    def has_started(self):
+        return self.started
+
+
+def test_polled_has_started():
+    daemon = _PolledDaemon.__new__(_PolledDaemon)
+    probes = daemon.readiness_probes()
+    assert [type(p) for p in probes] == [CallableProbe]
+    assert not probes[0].check()
+    daemon.started = True
+    assert probes[0].check()
+
+
+def test_tcp_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(('127.0.0.1', 0))
+        probe = TCPPortProbe(sock.getsockname()[1], pid=os.getpid())
+        assert not probe.check()
+        sock.listen(1)
+        assert probe.check()
+    finally:
+        sock.close()
+
+
+def test_pid_file(tmpdir):
+    path = tmpdir.join('daemon.pid')
+    path.write('%d\n' % os.getpid())
+    probe = PidFileProbe(str(path))
+    # A pid file left by a previous run is ignored
+    probe.reset()
+    assert not probe.check()
+    _later(lambda: path.write('%d\n' % os.getppid()))
+    readiness = ReadinessMonitor().wait_ready('r1:radvd', [probe], timeout=5)
+    assert readiness.error is None
+
+
+def test_log_line(tmpdir):
+    path = tmpdir.join('daemon.log')
+    path.write('ready from an old run\n')
+    probe = LogLineProbe(str(path), r'^ready')
+    probe.reset()
+    assert not probe.check()
+    path.write('starting\nrea', mode='a')
+    assert not probe.check()
+    path.write('dy\n', mode='a')
+    assert probe.check()
+
+
+def test_failures(tmpdir):
+    monitor = ReadinessMonitor()
+    never = monitor.watch('r1:never', [CallableProbe(lambda: False, 'never')],
+                          timeout=.2)
+    process = subprocess.Popen(['sh', '-c', 'exit 3'])
+    crashed = monitor.watch('r2:crash', [PidFileProbe(str(tmpdir.join('x')))],
+                            process=process, timeout=5)
+    assert not crashed.wait()
+    assert 'exited with code 3' in crashed.error
+    assert not never.wait()
+    assert 'never' in never.error
+
+
+def test_concurrent_waits(tmpdir):
+    monitor = ReadinessMonitor()
+    paths = [tmpdir.join('r%d.pid' % i) for i in range(20)]
+    pending = [monitor.watch('r%d' % i, [PidFileProbe(str(p))], timeout=5)
+               for i, p in enumerate(paths)]
+    for p in paths:
+        p.write('%d\n' % os.getpid())
+    assert all(r.wait() for r in pending)
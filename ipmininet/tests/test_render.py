@@ -0,0 +1,182 @@
+"""This module tests the rendering of the configuration files"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from ipmininet.router.config.base import Daemon, RouterConfig
+from ipmininet.router.config.cache import DryRunCache
+from ipmininet.router.config.render import render_configs
+from ipmininet.router.config.utils import template_lookup, file_digest, \
+    make_template_lookup, precompile_templates, ConfigDict
+import ipmininet.router.config.utils as config_utils
+
+
+class FakeDaemon(Daemon):
+    # The name of the daemon must be an available command
+    NAME = 'true'
+
+    @property
+    def startup_line(self):
+        return ''
+
+    @property
+    def dry_run(self):
+        return 'true %s' % self.cfg_filename
+
+    def set_defaults(self, defaults):
+        defaults.routerid = '1.1.1.1'
+
+    def build(self):
+        cfg = super(FakeDaemon, self).build()
+        cfg.values = self._node.values
+        return cfg
+
+
+class LegacyDaemon(FakeDaemon):
+    NAME = 'false'
+    RENDERS_TO_FILE = False
+    CLEANUP_FILES_ONLY = False
+
+    def render(self, cfg, **kwargs):
+        return 'legacy %s' % cfg.name
+
+    @property
+    def template_filename(self):
+        return 'true.mako'
+
+    def cleanup(self):
+        self.cleaned = True
+        super(LegacyDaemon, self).cleanup()
+
+
+class FakeRouter(object):
+    password = 'zebra'
+
+    def __init__(self, name, cwd, values, daemons=(FakeDaemon,)):
+        self.name = name
+        self.cwd = cwd
+        self.values = values
+        self.config = RouterConfig(self, daemons=daemons)
+
+    def intfList(self):
+        return []
+
+
+@pytest.fixture
+def templates(tmpdir, monkeypatch):
+    tmpdir.join('true.mako').write(
+        '${node.name} ${node["true"].routerid}\n'
+        '% for v in node["true"]["values"]:\n'
+        '${v}\n'
+        '% endfor\n')
+    monkeypatch.setattr(template_lookup, 'directories',
+                        template_lookup.directories + [str(tmpdir)])
+    return tmpdir
+
+
+@pytest.mark.parametrize("processes", [1, 4])
+def test_render_configs(templates, processes):
+    routers = [FakeRouter('r%d' % i, str(templates), range(i))
+               for i in range(4)]
+    routers.append(FakeRouter('r4', str(templates), None))  # Template error
+    routers.append(FakeRouter('r5', str(templates), [1],
+                              daemons=(FakeDaemon, LegacyDaemon)))
+    report = render_configs(routers, processes=processes)
+
+    assert not report
+    assert [(r, d) for r, d, _ in report.errors()] == [('r4', 'true')]
+    assert list(report.keys()) == ['r%d' % i for i in range(6)]
+    for i in range(4):
+        assert report['r%d' % i] == {'true': None}
+        assert routers[i].config.built
+        path = templates.join('true_r%d.cfg' % i)
+        assert path.read() == ''.join('%s\n' % line for line in
+                                      ['r%d 1.1.1.1' % i] + list(range(i)))
+    assert not routers[4].config.built
+    assert report['r5'] == {'true': None, 'false': None}
+    assert templates.join('false_r5.cfg').read() == 'legacy r5'
+
+    routers[5].config.cleanup()
+    assert routers[5].config.daemon('false').cleaned
+    assert not templates.join('true_r5.cfg').exists()
+
+
+def test_unchanged_config_not_rewritten(templates):
+    r = FakeRouter('r0', str(templates), [1, 2])
+    r.config.build()
+    daemon = r.config.daemon('true')
+    path = templates.join('true_r0.cfg')
+    digest = daemon.cfg_digest
+    assert digest == file_digest(str(path))
+    os.utime(str(path), (0, 0))
+    r.config.build()
+    assert daemon.cfg_digest == digest
+    assert path.mtime() == 0
+    r.values = [3]
+    r.config.build()
+    assert daemon.cfg_digest != digest
+    assert path.mtime() != 0
+    assert path.read() == 'r0 1.1.1.1\n3\n'
+
+
+def test_dry_run_cache(templates):
+    cache = DryRunCache(directory=str(templates.join('cache')))
+    r = FakeRouter('r0', str(templates), [1, 2])
+    r.config.build()
+    daemon = r.config.daemon('true')
+    key = cache.key(daemon)
+    assert key is not None
+    assert not cache.is_valid(key)
+    cache.set_valid(key)
+    assert cache.is_valid(key)
+    # The same content is still valid, but not a new one
+    r.config.build()
+    assert cache.key(daemon) == key
+    r.values = [3]
+    r.config.build()
+    assert not cache.is_valid(cache.key(daemon))
+    cache.clear()
+    assert not cache.is_valid(key)
+
+
+def test_compiled_templates(tmpdir):
+    src = tmpdir.mkdir('templates')
+    modules = tmpdir.mkdir('modules')
+    src.join('base.mako').write('<%block name="content">base</%block>\n')
+    src.join('child.mako').write('<%inherit file="base.mako"/>\n'
+                                 '<%block name="content">${node.x}</%block>\n')
+    lookup = make_template_lookup([str(src)], str(modules))
+    assert [name for name, _ in precompile_templates(lookup)] == \
+        ['base.mako', 'child.mako']
+    assert len([f for f in modules.listdir()
+                if f.basename.endswith('.py')]) == 2
+
+    # A new lookup loads the compiled modules, inheritance still works
+    lookup = make_template_lookup([str(src)], str(modules))
+    rendered = lookup.get_template('child.mako').render(node=ConfigDict(x=42))
+    assert rendered.strip() == '42'
+
+
+def test_templates_module_dir(tmpdir, monkeypatch):
+    cache = tmpdir.mkdir('cache')
+    env = dict(os.environ, IPMININET_CACHE_DIR=str(cache))
+    # Importing the configuration modules does not touch the cache
+    subprocess.check_call([sys.executable, '-c',
+                           'import ipmininet.router.config.utils'], env=env)
+    assert not cache.listdir()
+
+    # The templates are compiled in memory if the cache cannot be created
+    blocker = tmpdir.join('file')
+    blocker.write('')
+    monkeypatch.setattr(config_utils, 'cache_directory',
+                        lambda *subdirs: os.path.join(str(blocker), *subdirs))
+    monkeypatch.setattr(config_utils, '_module_dir', [])
+    assert config_utils.templates_module_dir() is None
+    src = tmpdir.mkdir('templates')
+    src.join('t.mako').write('${node.x}\n')
+    lookup = make_template_lookup([str(src)],
+                                  config_utils.templates_module_dir)
+    assert lookup.get_template('t.mako').render(
+        node=ConfigDict(x=42)).strip() == '42'
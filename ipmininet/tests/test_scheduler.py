@@ -0,0 +1,115 @@
+"""This module tests the task graph scheduler"""
+import functools
+import threading
+
+import mininet.clean
+import pytest
+
+from ipmininet.router import Router, ConfigCheckError
+from ipmininet.scheduler import Task, TaskGraph
+
+
+def _graph(done, lock=None):
+    def task(name):
+        def run():
+            if lock:
+                with lock:
+                    done.append(name)
+            else:
+                done.append(name)
+        return run
+    return TaskGraph([Task('r1:config', task('r1:config')),
+                      Task('r1:zebra', task('r1:zebra'), ['r1:config']),
+                      Task('r1:ospf', task('r1:ospf'), ['r1:zebra']),
+                      Task('r1:ospf6', task('r1:ospf6'), ['r1:zebra']),
+                      Task('r2:config', task('r2:config')),
+                      Task('r2:zebra', task('r2:zebra'), ['r2:config']),
+                      Task('h1:route', task('h1:route'))])
+
+
+def test_serial_order():
+    done = []
+    graph = _graph(done)
+    graph.run(max_workers=1)
+    assert done == graph.order() == ['r1:config', 'r2:config', 'h1:route',
+                                     'r1:zebra', 'r2:zebra', 'r1:ospf',
+                                     'r1:ospf6']
+
+
+@pytest.mark.parametrize("workers", [2, 4, 16])
+def test_parallel_order(workers):
+    done = []
+    _graph(done, threading.Lock()).run(max_workers=workers)
+    assert sorted(done) == sorted(_graph([]).order())
+    for before, after in (('r1:config', 'r1:zebra'), ('r1:zebra', 'r1:ospf'),
+                          ('r1:zebra', 'r1:ospf6'), ('r2:config', 'r2:zebra')):
+        assert done.index(before) < done.index(after)
+
+
+def test_parallel_tasks():
+    # Both tasks can only finish if they run at the same time
+    barrier = [threading.Event(), threading.Event()]
+
+    def task(i):
+        def run():
+            barrier[i].set()
+            assert barrier[1 - i].wait(5)
+        return run
+    TaskGraph([Task('a', task(0)), Task('b', task(1))]).run(max_workers=2)
+
+
+def test_failure():
+    done = []
+
+    def fail():
+        raise RuntimeError('failed')
+    graph = TaskGraph([Task('a', fail), Task('b', lambda: done.append('b'),
+                                             ['a'])])
+    with pytest.raises(RuntimeError):
+        graph.run(max_workers=4)
+    assert done == []
+
+
+class _Daemon(object):
+    NAME = 'ospfd'
+
+
+def test_config_check_failure():
+    done = []
+    router = Router.__new__(Router)
+    failed = [_Daemon()]
+    graph = TaskGraph([
+        Task('r1:sysctl', functools.partial(router._apply_sysctls, failed)),
+        Task('r1:ospfd', lambda: done.append('r1:ospfd'), ['r1:sysctl'])])
+    with pytest.raises(ConfigCheckError) as e:
+        graph.run(max_workers=4)
+    assert 'ospfd' in str(e.value)
+    assert done == []
+
+
+def test_router_start_config_check_failure(monkeypatch):
+    cleaned = []
+    router = Router.__new__(Router)
+    monkeypatch.setattr(router, 'start_tasks', lambda: [Task(
+        'r1:sysctl', functools.partial(router._apply_sysctls, [_Daemon()]))])
+    monkeypatch.setattr(mininet.clean, 'cleanup', lambda: cleaned.append(1))
+    # A router started on its own still cleans up and exits
+    with pytest.raises(SystemExit):
+        router.start()
+    assert cleaned == [1]
+
+
+@pytest.mark.parametrize("tasks", [
+    [Task('a', None, ['b']), Task('b', None, ['a'])],
+    [Task('a', None, ['c'])],
+])
+def test_invalid_graph(tasks):
+    with pytest.raises(ValueError):
+        TaskGraph(tasks).run()
+
+
+def test_duplicate_task():
+    graph = TaskGraph()
+    graph.add('a', None)
+    with pytest.raises(ValueError):
+        graph.add('a', None)
@@ -1,6 +1,3 @@
-import re
-import time
-
 import pytest
 
 from ipmininet.iptopo import IPTopo
@@ -63,21 +60,9 @@ def test_stp(switch, expected_lines):
     try:
         net = IPNet(topo=SimpleSpanningTree())
         net.start()
-        partial_cmd = "brctl showstp"
-        possible_states = "listening|learning|forwarding|blocking"
-        ignore_state = "listening", "learning"  # state to be ignored
-        cmd = ("%s %s" % (partial_cmd, switch))
-        out = net[switch].cmd(cmd)
-        states = re.findall(possible_states, out)
         # wait for the ports to be bounded
-        count = 0
-        while any(item in states for item in ignore_state):
-            if count == 60:  # system waited too long for the stp, a problem may have occurred
-                pytest.fail("[STP] system waited 60 seconds and the spanning tree wasn't fully computed")
-            time.sleep(1)
-            count += 1
-            out = net[switch].cmd(cmd)
-            states = re.findall(possible_states, out)
+        net.wait_stp_converged(timeout=60)
+        states = list(net[switch].stpState().ports.values())
         for i in range(len(states)):
             assert states[i] == expected_lines[i], "[STP] state of port %d of switch %s wasn't correct" % (i, switch)
         net.stop()
@@ -0,0 +1,51 @@
+"""This module tests the reading of the spanning tree state from sysfs"""
+import os
+import threading
+
+import pytest
+
+from ipmininet.stp import bridge_state, stp_states, wait_stp_converged
+
+
+def _bridge(sysfs, name, bridge_id, root_id, ports, stp=1):
+    bridge = sysfs.join(name, 'bridge').ensure(dir=True)
+    bridge.join('stp_state').write('%d\n' % stp)
+    bridge.join('bridge_id').write(bridge_id + '\n')
+    bridge.join('root_id').write(root_id + '\n')
+    for number, (port, state) in enumerate(ports, 1):
+        brif = sysfs.join(name, 'brif', port).ensure(dir=True)
+        brif.join('state').write('%d\n' % state)
+        brif.join('port_no').write('0x%x\n' % number)
+
+
+def test_bridge_state(tmpdir):
+    # Port 10 must come after port 2 although its name sorts before
+    ports = [('s1-eth%d' % i, 3) for i in range(1, 11)]
+    ports[1] = ('s1-eth2', 4)
+    _bridge(tmpdir, 's1', '0001.0a', '0001.0a', ports)
+    _bridge(tmpdir, 's2', '0002.0b', '0001.0a', [('s2-eth1', 1)])
+    _bridge(tmpdir, 's3', '8000.0c', '8000.0c', [('s3-eth1', 3)], stp=0)
+    states = stp_states(['s1', 's2', 's3'], sysfs=str(tmpdir))
+    s1, s2, s3 = states.values()
+    assert list(s1.ports) == ['s1-eth%d' % i for i in range(1, 11)]
+    assert s1.ports['s1-eth2'] == 'blocking'
+    assert s1.is_root and s1.converged
+    assert not s2.is_root and s2.root_id == s1.bridge_id
+    assert s2.ports == {'s2-eth1': 'listening'} and not s2.converged
+    assert not s3.stp and s3.converged
+    assert bridge_state('s4', sysfs=str(tmpdir)).ports == {}
+
+
+def test_wait_stp_converged(tmpdir):
+    _bridge(tmpdir, 's1', '0001.0a', '0001.0a', [('s1-eth1', 3)])
+    _bridge(tmpdir, 's2', '0002.0b', '0001.0a', [('s2-eth1', 2)])
+    with pytest.raises(ValueError):
+        wait_stp_converged(['s1', 's2'], timeout=.2, sysfs=str(tmpdir))
+
+    state = os.path.join(str(tmpdir), 's2', 'brif', 's2-eth1', 'state')
+    timer = threading.Timer(.2, lambda: open(state, 'w').write('4\n'))
+    timer.start()
+    states = wait_stp_converged(['s1', 's2'], timeout=5, sysfs=str(tmpdir),
+                                poll=.01)
+    timer.join()
+    assert states['s2'].ports == {'s2-eth1': 'blocking'}
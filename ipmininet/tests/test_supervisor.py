@@ -0,0 +1,90 @@
+"""This module tests the supervision of the processes of the routers"""
+import os
+import signal
+import subprocess
+import time
+
+from ipmininet.router import ProcessHelper
+from ipmininet.router.supervisor import RingBuffer, RestartPolicy
+
+
+class FakeNode(object):
+    name = 'r1'
+
+    @staticmethod
+    def popen(*args, **kwargs):
+        kwargs.setdefault('stdout', subprocess.PIPE)
+        kwargs.setdefault('stderr', subprocess.PIPE)
+        return subprocess.Popen(*args, **kwargs)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(.01)
+
+
+def test_ring_buffer():
+    buf = RingBuffer(10)
+    data = b''.join(b'%d,' % i for i in range(100))
+    for i in range(100):
+        buf.write(b'%d,' % i)
+    assert buf.getvalue() == data[-10:]
+    assert buf.written == len(data)
+
+
+def test_output_drained():
+    helper = ProcessHelper(FakeNode())
+    # Writes much more than the size of a pipe buffer
+    pid = helper.popen(['sh', '-c', 'yes chatty | head -c 700000; '
+                                    'echo done >&2'], name='chatty')
+    _wait_for(lambda: not helper.status(pid)['running'])
+    helper.terminate()
+    assert helper.status(pid)['exit_codes'] == [0]
+    assert helper.output(pid).endswith(b'chatty\ndone\n')
+    assert len(helper.output(pid)) <= 64 * 1024
+
+
+def test_restart():
+    helper = ProcessHelper(FakeNode())
+    pid = helper.popen(['sh', '-c', 'exit 3'], name='crash',
+                       restart=RestartPolicy(max_restarts=2, backoff=.01))
+    _wait_for(lambda: len(helper.status(pid)['exit_codes']) == 3)
+    helper.terminate()
+    status = helper.status(pid)
+    assert status['restarts'] == 2
+    assert status['exit_codes'] == [3, 3, 3]
+    assert not status['running'] and status['uptime'] == 0
+
+
+def test_terminate_deadline():
+    helper = ProcessHelper(FakeNode())
+    stubborn = helper.popen(['sh', '-c', 'trap "" TERM; while true; do '
+                                         'sleep .01; done'], name='stubborn')
+    sleeper = helper.popen(['sleep', '60'], name='sleeper')
+    _wait_for(lambda: helper.status(stubborn)['uptime'] > .1)
+    start = time.time()
+    assert helper._supervisor.terminate(timeout=.5) == ['stubborn']
+    assert time.time() - start < 5
+    assert helper.status(stubborn)['exit_codes'] == [-9]
+    assert helper.status(sleeper)['exit_codes'] == [-15]
+
+
+def test_exit_with_inherited_pipes():
+    helper = ProcessHelper(FakeNode())
+    # The background sleep keeps the output pipes of its parent open
+    forking = helper.popen(['sh', '-c', 'sleep 60 & echo $!'],
+                           name='forking')
+    _wait_for(lambda: not helper.status(forking)['running'])
+    child = int(helper.output(forking))
+    try:
+        # The other processes are still supervised
+        other = helper.popen(['sh', '-c', 'echo other'], name='other')
+        _wait_for(lambda: helper.output(other) == b'other\n')
+        start = time.time()
+        helper.terminate()
+        assert time.time() - start < 5
+        assert helper.status(forking)['exit_codes'] == [0]
+    finally:
+        os.kill(child, signal.SIGKILL)
@@ -3,6 +3,7 @@
 from ipmininet.clean import cleanup
 from ipmininet.examples.spanning_tree import SpanningTreeNet
 from ipmininet.ipnet import IPNet
+from ipmininet.iptopo import IPTopo, collapse_switches
 from ipmininet.tests import require_root
 from ipmininet.tests.utils import assert_connectivity
 
@@ -19,3 +20,64 @@ def test_stp_example():
         net.stop()
     finally:
         cleanup()
+
+
+class TwoPortSwitches(IPTopo):
+
+    def build(self, *args, **kwargs):
+        r1, r2 = self.addRouter('r1'), self.addRouter('r2')
+        h1, h2, h3 = self.addHost('h1'), self.addHost('h2'), \
+            self.addHost('h3')
+        s1, s2, s3 = self.addSwitch('s1'), self.addSwitch('s2'), \
+            self.addSwitch('s3')
+        # Collapsible, with the interface parameters of each side kept
+        self.addLink(r1, s1, params1={'igp_metric': 5})
+        self.addLink(s1, r2, params2={'ip': '10.0.0.2/24'})
+        # Not collapsible: three ports
+        self.addLink(r2, s2)
+        self.addLink(h1, s2)
+        self.addLink(h2, s2)
+        # Not collapsible: hub and spanning tree
+        hub = self.addHub('s4')
+        self.addLink(r1, hub)
+        self.addLink(hub, h3)
+        stp = self.addSwitch('s5', stp=True)
+        self.addLink(r2, stp)
+        self.addLink(stp, h3)
+        # Collapsible, the link options are kept
+        self.addLink(r1, s3, delay='1ms')
+        self.addLink(h1, s3, delay='1ms')
+        super(TwoPortSwitches, self).build(*args, **kwargs)
+
+
+def test_collapse_switches():
+    topo = TwoPortSwitches()
+    assert collapse_switches(topo) == ['s1', 's3']
+    assert topo.switches() == ['s2', 's4', 's5']
+    links = dict(((src, dst), info) for src, dst, info in
+                 topo.links(sort=True, withInfo=True))
+    r1_r2 = links['r1', 'r2']
+    assert (r1_r2['port1'], r1_r2['port2']) == (0, 0)
+    assert r1_r2['params1']['igp_metric'] == 5
+    assert r1_r2['params2']['ip'] == '10.0.0.2/24'
+    assert topo.port('r1', 'r2') == (0, 0)
+    h1_r1 = links['r1', 'h1']
+    assert h1_r1['delay'] == '1ms'
+    assert (h1_r1['node1'], h1_r1['port1']) == ('r1', 2)
+    assert not any('s1' in k or 's3' in k for k in links)
+    assert collapse_switches(topo) == []
+
+
+@require_root
+def test_collapsed_broadcast_domains():
+    try:
+        domains = []
+        for collapse in (False, True):
+            net = IPNet(topo=TwoPortSwitches(), collapse_switches=collapse)
+            domains.append(sorted(sorted(i.name for i in d)
+                                  for d in net.broadcast_domains))
+            net.stop()
+        assert domains[0] == domains[1]
+        assert net.collapsed_switches == ['s1', 's3']
+    finally:
+        cleanup()
@@ -0,0 +1,148 @@
+"""This module tests the commands configuring the bridges of SwitchHub"""
+from mininet.node import Host
+
+from ipmininet.ipnet import IPNet
+from ipmininet.switch_hub import SwitchHub
+
+
+class FakeIntf(object):
+
+    def __init__(self, name, node=None, **params):
+        self.name = name
+        self.node = node
+        self.params = params
+        self.link = None
+
+    def __str__(self):
+        return self.name
+
+    def ips(self):
+        return iter(())
+
+    def ip6s(self, exclude_lls=False):
+        return iter(())
+
+
+class FakeLink(object):
+
+    def __init__(self, intf1, intf2):
+        self.intf1, self.intf2 = intf1, intf2
+        intf1.link = intf2.link = self
+
+
+def _switch(name, intfs, **params):
+    switch = SwitchHub.__new__(SwitchHub)
+    switch.name = name
+    switch.stp = params.get('stp', False)
+    switch.hub = params.get('hub', False)
+    switch.prio = params.get('prio', 1)
+    switch.intfs = dict(enumerate(intfs))
+    for i in intfs:
+        i.node = switch
+    return switch
+
+
+def _host(name, intfs):
+    host = Host.__new__(Host)
+    host.name = name
+    host.intfs = dict(enumerate(intfs))
+    for i in intfs:
+        i.node = host
+    return host
+
+
+def _topology():
+    costs = {'stp_cost1': 10, 'stp_cost2': 20}
+    s1_1, s2_1 = FakeIntf('s1-eth1', **costs), FakeIntf('s2-eth1', **costs)
+    s1_2, h1 = FakeIntf('s1-eth2'), FakeIntf('h1-eth0')
+    FakeLink(s1_1, s2_1)
+    FakeLink(h1, s1_2)
+    return (_switch('s1', [s1_1, s1_2], stp=True, prio=4),
+            _switch('s2', [s2_1], hub=True))
+
+
+def test_batch():
+    s1, s2 = _topology()
+    assert s1.pathCosts() == [(s1.intfs[0], 10)]
+    assert s1.batch() == [
+        'link del dev s1',
+        'link add name s1 type bridge stp_state 1 priority 4',
+        'link set dev s1-eth1 master s1',
+        'link set dev s1-eth2 master s1',
+        'link set dev s1-eth1 type bridge_slave cost 10',
+        'link set dev s1 up']
+    assert s2.batch() == [
+        'link del dev s2',
+        'link add name s2 type bridge stp_state 0 ageing_time 0',
+        'link set dev s2-eth1 master s2',
+        'link set dev s2-eth1 type bridge_slave cost 20',
+        'link set dev s2 up']
+
+
+def test_brctl_fallback():
+    s1, _ = _topology()
+    assert s1.brctlCommands() == [
+        'ifconfig s1 down', 'brctl delbr s1', 'brctl addbr s1',
+        'brctl setbridgeprio s1 4', 'brctl stp s1 on',
+        'brctl addif s1 s1-eth1', 'brctl addif s1 s1-eth2',
+        'brctl setpathcost s1 s1-eth1 10', 'ifconfig s1 up']
+
+
+def test_failed_lines():
+    err = 'Cannot find device "s1"\nCommand failed -:1\n' \
+          'RTNETLINK answers: Invalid argument\nCommand failed -:5\n'
+    assert SwitchHub._failedLines(err) == {1, 5}
+
+
+def test_vlan_batch():
+    trunk = FakeIntf('s1-eth1', vlans=[20, 10])
+    access = FakeIntf('s1-eth2', vlan=10)
+    s1 = _switch('s1', [trunk, access, FakeIntf('s1-eth3')])
+    assert s1.vlanFiltering()
+    assert 'vlan_filtering 1' in s1.batch()[1]
+    assert s1.vlanBatch() == ['vlan add dev s1-eth1 vid 10',
+                              'vlan add dev s1-eth1 vid 20',
+                              'vlan del dev s1-eth2 vid 1',
+                              'vlan add dev s1-eth2 vid 10 pvid untagged']
+    assert 'bridge vlan add dev s1-eth1 vid 20' in s1.brctlCommands()
+    assert not _topology()[0].vlanFiltering()
+
+
+def _link(a, b, params1=None, **params):
+    i1 = FakeIntf('%s-eth%d' % (a.name, len(a.intfs)),
+                  **(params1 or params))
+    i2 = FakeIntf('%s-eth%d' % (b.name, len(b.intfs)), **params)
+    for node, i in ((a, i1), (b, i2)):
+        node.intfs[len(node.intfs)] = i
+        i.node = node
+    return FakeLink(i1, i2)
+
+
+def test_vlan_broadcast_domains():
+    """h1, h2 (VLAN 10) and h3, h4 (VLAN 20) share s1 and s2, whose trunks
+    are linked through s3, which does not filter VLANs. h5 is in the
+    default VLAN of s1, which reaches h6 untagged through s3. The trunks do
+    not carry the VLAN 30 of h7."""
+    hosts = [_host('h%d' % i, []) for i in range(1, 8)]
+    h1, h2, h3, h4, h5, h6, h7 = hosts
+    s1, s2, s3 = _switch('s1', []), _switch('s2', []), _switch('s3', [])
+    links = [_link(h1, s1, vlan=10), _link(h3, s1, vlan=20), _link(h5, s1),
+             _link(h2, s2, vlan=10), _link(h4, s2, vlan=20),
+             _link(h7, s2, vlan=30),
+             _link(s3, s1, params1={}, vlans=[10, 20]),
+             _link(s3, s2, params1={}, vlans=[10, 20]),
+             _link(h6, s3)]
+    net = IPNet.__new__(IPNet)
+    net.routers, net.hosts, net.controllers = [], hosts, []
+    net.switches = [s1, s2, s3]
+    net.links = links
+    net.nameToNode = dict((n.name, n) for n in hosts + net.switches)
+    domains = sorted(sorted(i.node.name for i in d)
+                     for d in net._broadcast_domains())
+    assert domains == [['h1', 'h2'], ['h3', 'h4'], ['h5', 'h6'], ['h7']]
+
+    # Without VLANs, all hosts are in the same domain
+    for link in links:
+        link.intf1.params = link.intf2.params = {}
+    domains = net._broadcast_domains()
+    assert len(domains) == 1 and len(domains[0].interfaces) == 7
@@ -0,0 +1,71 @@
+"""This module tests the helpers tearing the network down"""
+import os
+import subprocess
+import sys
+import time
+
+from ipmininet.teardown import scan_processes, terminate_pids, \
+    read_pid_files, daemon_pids, remove_files, is_alive
+
+
+def _spawn(script, tag):
+    p = subprocess.Popen([sys.executable, '-c', script, tag])
+    time.sleep(.2)  # Let the process set its signal handlers
+    return p
+
+
+def _reap(processes):
+    return [p.wait() for p in processes]
+
+
+def test_terminate_pids():
+    polite = _spawn('import time; time.sleep(60)',
+                    'ipmininet-teardown-polite')
+    stubborn = _spawn('import signal, time; '
+                      'signal.signal(signal.SIGTERM, signal.SIG_IGN); '
+                      'time.sleep(60)', 'ipmininet-teardown-stubborn')
+    pids = [polite.pid, stubborn.pid]
+    try:
+        found = scan_processes([r'ipmininet-teardown-\w+'])
+        assert set(pids) <= set(pid for pid, _ in found)
+
+        start = time.time()
+        # Processes that we did not reap are zombies, hence reported dead
+        assert terminate_pids(pids, time.time() + .5) == [stubborn.pid]
+        assert time.time() - start < 3
+        assert _reap([polite, stubborn]) == [-15, -9]
+        assert not any(is_alive(pid) for pid in pids)
+    finally:
+        for p in (polite, stubborn):
+            if p.poll() is None:
+                p.kill()
+
+
+def test_pid_files(tmpdir):
+    alive = tmpdir.join('alive.pid')
+    alive.write('%d\n' % os.getppid())
+    dead = tmpdir.join('dead.pid')
+    p = subprocess.Popen(['true'])
+    p.wait()
+    dead.write('%d\n' % p.pid)
+    garbage = tmpdir.join('garbage.pid')
+    garbage.write('zebra')
+    paths = [str(alive), str(dead), str(garbage), str(tmpdir.join('none'))]
+    assert read_pid_files(paths) == [(str(alive), os.getppid())]
+    assert remove_files(paths) == 3
+    assert not tmpdir.listdir()
+
+
+def test_daemon_pids(tmpdir):
+    p = _spawn('import time; time.sleep(60)', 'ipmininet-teardown-daemon')
+    try:
+        daemon = tmpdir.join('daemon.pid')
+        daemon.write('%d\n' % p.pid)
+        # A stale pid file whose pid was reused by another process
+        reused = tmpdir.join('reused.pid')
+        reused.write('%d\n' % p.pid)
+        assert daemon_pids({str(daemon): 'ipmininet-teardown-daemon',
+                            str(reused): 'zebra'}) == [p.pid]
+    finally:
+        p.kill()
+        p.wait()
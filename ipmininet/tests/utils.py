@@ -11,7 +11,6 @@ import signal
 import time
 
 import mininet.log
-from ipaddress import ip_address
 
 
 def traceroute(net, src, dst_ip, timeout=300):
@@ -48,21 +47,11 @@ def assert_path(net, expected_path, v6=False, timeout=300):
 
     path = [src]
     for path_ip in path_ips:
-        found = False
-        for n in net.routers + net.hosts:
-            for itf in n.intfList():
-                itf_ips = itf.ip6s() if v6 else itf.ips()
-                for ip in itf_ips:
-                    if ip.ip == ip_address(path_ip):
-                        found = True
-                        break
-                if found:
-                    break
-            if found:
-                path.append(n.name)
-                break
-        assert found, "Traceroute returned the address '%s' " \
-                      "that cannot be linked to a node" % path_ip
+        try:
+            path.append(net.node_for_ip(path_ip).name)
+        except KeyError:
+            assert False, "Traceroute returned the address '%s' " \
+                          "that cannot be linked to a node" % path_ip
 
     assert path == expected_path, "We expected the path from %s to %s to go " \
                                   "through %s but it went through %s" \
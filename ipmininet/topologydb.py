@@ -6,6 +6,7 @@ import json
 import itertools
 from ipaddress import ip_interface
 
+from .ipindex import PrefixTrie
 from .utils import otherIntf, realIntfList
 
 from mininet.log import lg
@@ -29,6 +30,7 @@ class TopologyDB(object):
             dict keyed by - properties -> val
                           - neighbor   -> interface properties"""
         self._network = {}
+        self._ip_index = None  # PrefixTrie of the interface addresses
         if db:
             self.load(db)
         if net:
@@ -42,6 +44,7 @@ class TopologyDB(object):
         :param fpath: path towards the file to load"""
         with open(fpath, 'r') as f:
             self._network = json.load(f)
+        self._ip_index = None
 
     def save(self, fpath):
         """Save the topology database
@@ -95,6 +98,23 @@ class TopologyDB(object):
         :return: ip_network-like object"""
         return self.interface(x, y).network
 
+    def node_for_ip(self, ip):
+        """Return the node owning a given IP address
+
+        :param ip: an IP address, with or without a prefix length
+        :return: the node name"""
+        if self._ip_index is None:
+            self._ip_index = PrefixTrie()
+            for name, props in self._network.items():
+                for itf in props.get('interfaces', ()):
+                    for addr in props[itf]['ips']:
+                        self._ip_index.setdefault(
+                            ip_interface(str(addr)).ip, name)
+        try:
+            return self._ip_index[ip_interface(str(ip)).ip]
+        except (KeyError, ValueError):
+            raise ValueError('No node has the address %s' % ip)
+
     def routerid(self, x):
         """Return the router id of a node
 
@@ -132,6 +152,7 @@ class TopologyDB(object):
                 props[nh.node.name] = itf_props
             props[itf.name] = itf_props
         self._network[n.name] = props
+        self._ip_index = None
 
     def add_host(self, n):
         """Register an host
@@ -2,26 +2,49 @@
 from builtins import str
 from ipmininet import basestring
 
-import collections
 import os
+import weakref
+try:
+    from collections.abc import Sequence
+except ImportError:  # Python 2
+    from collections import Sequence
 
 from mininet.log import lg as log
 
 from ipaddress import ip_address
 
 
-def has_cmd(cmd):
-    """Return whether the given executable is available on the system or not"""
+def find_cmd(cmd):
+    """Return the path of the given executable, or None if it is not
+    available on the system"""
     # Check if cmd is a valid absolute path
     if os.path.isfile(cmd) and os.access(cmd, os.X_OK):
-        return True
+        return cmd
     # Try to find the cmd in each directory in $PATH
     for path in os.environ["PATH"].split(os.path.pathsep):
         path = path.strip('"')
         exe = os.path.join(path, cmd)
         if os.path.isfile(exe) and os.access(exe, os.X_OK):
-            return True
-    return False
+            return exe
+    return None
+
+
+def cache_directory(*subdirs):
+    """Return the directory in which ipmininet caches data, i.e.,
+    $IPMININET_CACHE_DIR or $XDG_CACHE_HOME/ipmininet
+
+    :param subdirs: the path of a sub directory in the cache"""
+    base = os.environ.get('IPMININET_CACHE_DIR')
+    if not base:
+        base = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                            os.path.join(os.path.expanduser('~'), '.cache'),
+                            'ipmininet')
+    return os.path.join(base, *subdirs)
+
+
+def has_cmd(cmd):
+    """Return whether the given executable is available on the system or not"""
+    return find_cmd(cmd) is not None
 
 
 def require_cmd(cmd, help_str=None):
@@ -52,13 +75,13 @@ def realIntfList(n):
 
 def address_pair(n, use_v4=True, use_v6=True):
     """Returns a tuple (ip, ip6) with ip/ip6 being one of the IPv4/IPv6
-       addresses of the node n"""
+       addresses of the node n. This relies on the known addresses of the
+       interfaces, without requesting them again to the node."""
     v4 = v6 = None
     for itf in realIntfList(n):
         if use_v4 and v4 is None:
-            v4 = itf.updateIP()
+            v4 = itf.ip
         if use_v6 and v6 is None:
-            itf.updateIP6()
             v6 = next(itf.ip6s(exclude_lls=True), None)
             v6 = v6.ip.compressed if v6 is not None else v6
         if (not use_v4 or v4 is not None) and (not use_v6 or v6 is not None):
@@ -68,7 +91,7 @@ def address_pair(n, use_v4=True, use_v6=True):
 
 def is_container(x):
     """Return whether x is a container (=iterable but not a string)"""
-    return (isinstance(x, collections.Sequence) and
+    return (isinstance(x, Sequence) and
             not isinstance(x, basestring))
 
 
@@ -111,28 +134,146 @@ def get_set(d, key, default):
         return x
 
 
+class DisjointSet(object):
+    """A union-find structure over hashable objects, with path compression
+    and union by size"""
+
+    def __init__(self, elements=()):
+        self._parent = {}
+        self._size = {}
+        for e in elements:
+            self.add(e)
+
+    def __contains__(self, item):
+        return item in self._parent
+
+    def add(self, e):
+        """Register an element in its own set, if not already present"""
+        if e not in self._parent:
+            self._parent[e] = e
+            self._size[e] = 1
+
+    def find(self, e):
+        """Return the representative of the set containing e"""
+        self.add(e)
+        root = e
+        while self._parent[root] != root:
+            root = self._parent[root]
+        # Compress the path towards the root
+        while self._parent[e] != root:
+            self._parent[e], e = root, self._parent[e]
+        return root
+
+    def union(self, a, b):
+        """Merge the sets containing a and b
+
+        :return: the representative of the merged set"""
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        return a
+
+
 def find_node(start, node_name):
     """
     :param start: The starting node of the search
     :param node_name: The name of the node to find
     :return: The interface of the node connected to start with node_name as name
     """
+    return adjacency_index(start).find_node(start, node_name)
 
-    if start.name == node_name:
-        return start.intf()
-
-    visited = set()
-    to_visit = realIntfList(start)
-    # Explore all interfaces recursively, until we find one
-    # connected to the node
-    while to_visit:
-        i = to_visit.pop()
-        if i in visited:
-            continue
-        visited.add(i)
-        for n in i.broadcast_domain.interfaces:
-            if n.node.name == node_name:
-                return n
-            elif L3Router.is_l3router_intf(n):
-                to_visit.extend(realIntfList(n.node))
-    return None
+
+_ADJACENCY_INDEXES = weakref.WeakKeyDictionary()
+
+
+def adjacency_index(node):
+    """Return the AdjacencyIndex of the network of a node, or an empty one
+    if the node was not registered in any index
+
+    :param node: the node"""
+    try:
+        return _ADJACENCY_INDEXES[node]
+    except KeyError:
+        return AdjacencyIndex()
+
+
+class AdjacencyIndex(object):
+    """An index of the layer-3 adjacencies of a network.
+
+    It maps node names to their interfaces, and memoizes the result of the
+    exploration of the network from a given node, so that looking up the
+    interface of a node reachable from another one costs a single graph
+    walk per starting node instead of one per lookup."""
+
+    def __init__(self, nodes=()):
+        """:param nodes: the nodes to index"""
+        self.interfaces = {}  # node name -> interfaces
+        self._nodes = {}  # start node name -> {node name: first interface}
+        self._peers = {}  # router name -> {router name: first interface}
+        for n in nodes:
+            self.interfaces[n.name] = realIntfList(n)
+            _ADJACENCY_INDEXES[n] = self
+
+    def _intfs(self, node):
+        try:
+            return self.interfaces[node.name]
+        except KeyError:
+            return realIntfList(node)
+
+    def _explore(self, start, neighbors, expand):
+        """Walk the network from a node and return a mapping between the
+        names of the nodes found and their first interface encountered
+
+        :param start: the starting node
+        :param neighbors: a function returning the interfaces adjacent to
+                          a given interface
+        :param expand: a function telling whether the walk continues through
+                       the node of a given interface"""
+        found = {}
+        visited = set()
+        to_visit = list(self._intfs(start))
+        while to_visit:
+            i = to_visit.pop()
+            if i in visited:
+                continue
+            visited.add(i)
+            for n in neighbors(i):
+                found.setdefault(n.node.name, n)
+                if expand(n):
+                    to_visit.extend(self._intfs(n.node))
+        return found
+
+    def find_node(self, start, node_name):
+        """Return the interface of the node named node_name that is the
+        closest to start, exploring the network through L3 routers
+
+        :param start: The starting node of the search
+        :param node_name: The name of the node to find"""
+        if start.name == node_name:
+            return start.intf()
+        try:
+            reachable = self._nodes[start.name]
+        except KeyError:
+            reachable = self._nodes[start.name] = self._explore(
+                start, lambda i: i.broadcast_domain.interfaces,
+                L3Router.is_l3router_intf)
+        return reachable.get(node_name)
+
+    def find_peer(self, base, peer):
+        """Return the interface of the router named peer that base should
+        contact to establish a peering, exploring the routers of the AS of
+        base
+
+        :param base: The router that looks for its peer
+        :param peer: The name of the peer"""
+        try:
+            reachable = self._peers[base.name]
+        except KeyError:
+            reachable = self._peers[base.name] = self._explore(
+                base, lambda i: i.broadcast_domain.routers,
+                lambda n: n.node.asn == base.asn or not n.node.asn)
+        return reachable.get(peer)